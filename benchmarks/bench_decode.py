@@ -0,0 +1,141 @@
+# AFWRename/benchmarks/bench_decode.py
+"""
+Compares the full and fast thumbnail decode paths.
+
+Each mode runs in its own child process so that peak RSS is measured
+independently. Example:
+
+    python -m benchmarks.bench_decode --generate 20
+    python -m benchmarks.bench_decode /path/to/folder
+"""
+
+import argparse
+import io
+import json
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def exif_with_preview(preview_jpeg: bytes) -> bytes:
+    """Builds a minimal EXIF block whose IFD1 carries the given JPEG preview."""
+    entries = [(0x0103, 3, 1, 6), (0x0201, 4, 1, 0), (0x0202, 4, 1, len(preview_jpeg))]
+    ifd0 = struct.pack("<H", 0) + struct.pack("<I", 8 + 2 + 4)
+    ifd1_offset = 8 + len(ifd0)
+    data_offset = ifd1_offset + 2 + 12 * len(entries) + 4
+    ifd1 = struct.pack("<H", len(entries))
+    for tag, typ, count, value in entries:
+        if tag == 0x0201:
+            value = data_offset
+        ifd1 += struct.pack("<HHII", tag, typ, count, value)
+    ifd1 += struct.pack("<I", 0)
+    return b"Exif\x00\x00" + b"II*\x00" + struct.pack("<I", 8) + ifd0 + ifd1 + preview_jpeg
+
+
+def generate_samples(folder: Path, count: int, megapixels: int = 50):
+    """Writes large JPEGs (with and without EXIF previews), PNGs and PDFs to a folder."""
+    import fitz
+    from PIL import Image, ImageDraw
+
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    base = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(base)
+    for i in range(0, width, 97):
+        draw.line((i, 0, width - i, height), fill=(i % 255, 80, 160), width=9)
+
+    preview = io.BytesIO()
+    base.resize((320, 240)).save(preview, "JPEG")
+    exif = exif_with_preview(preview.getvalue())
+
+    for i in range(1, count + 1):
+        kind = i % 4
+        if kind == 0:
+            base.resize((width // 4, height // 4)).save(folder / f"sample ({i}).png")
+        elif kind == 1:
+            doc = fitz.open()
+            page = doc.new_page(width=2480, height=3508)
+            page.insert_text((200, 400), f"Sample page {i}", fontsize=120)
+            page.draw_rect(fitz.Rect(200, 600, 2200, 3200), color=(0.9, 0.2, 0.4), width=20)
+            doc.save(folder / f"sample ({i}).pdf")
+        elif kind == 2:
+            base.save(folder / f"sample ({i}).jpg", quality=90, exif=exif)
+        else:
+            base.save(folder / f"sample ({i}).jpg", quality=90)
+
+
+def run_mode(folder: Path, fast: bool) -> dict:
+    """Decodes every supported file in the folder and returns timing statistics."""
+    import resource
+
+    from core.scanner import SUPPORTED_SUFFIXES
+    from core.thumbnailer import make_thumbnail
+
+    timings = {}
+    for path in sorted(folder.iterdir()):
+        if path.suffix.lower() not in SUPPORTED_SUFFIXES:
+            continue
+        start = time.perf_counter()
+        make_thumbnail(str(path), fast=fast)
+        timings[path.name] = time.perf_counter() - start
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss_kb //= 1024
+    return {"mode": "fast" if fast else "full", "files": timings, "peak_rss_kb": peak_rss_kb}
+
+
+def _run_child(folder: Path, mode: str, *extra: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_decode", str(folder), "--child", mode, *extra],
+        check=True, capture_output=True, text=True,
+    ).stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", nargs="?", type=Path, help="Folder of images and PDFs to decode.")
+    parser.add_argument("--generate", type=int, metavar="N", help="Generate N synthetic samples into a temporary folder.")
+    parser.add_argument("--megapixels", type=int, default=50, help="Size of generated images.")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON.")
+    parser.add_argument("--child", choices=("fast", "full", "generate"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "generate":
+        generate_samples(args.folder, args.generate, args.megapixels)
+        return
+    if args.child:
+        print(json.dumps(run_mode(args.folder, args.child == "fast")))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder
+        if args.generate:
+            folder = Path(tmp)
+            # Generate in a child too: peak RSS survives exec, so the parent must stay small.
+            _run_child(folder, "generate", "--generate", str(args.generate), "--megapixels", str(args.megapixels))
+        if folder is None:
+            parser.error("a folder or --generate is required")
+
+        results = {}
+        for mode in ("full", "fast"):
+            out = _run_child(folder, mode)
+            results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    full, fast = results["full"]["files"], results["fast"]["files"]
+    print(f"{'file':<32} {'full ms':>10} {'fast ms':>10} {'speedup':>8}")
+    for name in full:
+        print(f"{name:<32} {full[name] * 1000:>10.1f} {fast[name] * 1000:>10.1f} {full[name] / fast[name]:>7.1f}x")
+    print(f"{'total':<32} {sum(full.values()) * 1000:>10.1f} {sum(fast.values()) * 1000:>10.1f}")
+    print(f"{'peak RSS (MiB)':<32} {results['full']['peak_rss_kb'] / 1024:>10.1f} {results['fast']['peak_rss_kb'] / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
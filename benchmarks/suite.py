@@ -0,0 +1,370 @@
+# AFWRename/benchmarks/suite.py
+"""
+Benchmark suite for scanning, thumbnailing, set management and renaming.
+
+Synthetic folders are generated under each root (e.g. a tmpfs and a disk
+folder), then every scenario runs in its own child process so that peak
+RSS is measured independently. Results are printed as a table or as JSON,
+and can be compared with an earlier JSON run. Examples:
+
+    python -m benchmarks.suite --files 2000 --synced 2
+    python -m benchmarks.suite --root /dev/shm --root /var/tmp --json > base.json
+    python -m benchmarks.suite --compare base.json
+
+Scenarios:
+    scan     os.scandir listing of the primary folder, plus ID lookups
+    decode   make_thumbnail for every file on the default thread pool
+    worker   ThumbnailWorker delivering every thumbnail, made into a QPixmap on arrival (needs PySide6)
+    sets     SetManager assignments of 1 to 3 files, then undoing all of them
+    rename   a journaled rename of every file in all folders, then its undo
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCENARIOS = ("scan", "decode", "worker", "sets", "rename")
+KINDS = ("jpg", "png", "webp", "pdf")
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Returns p50, p90, p99 and max of the samples, in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+
+def peak_rss_kb() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _encoded_samples(megapixels: float, large_megapixels: float) -> dict:
+    """Encodes one small and one large file of each kind; the folders reuse these bytes."""
+    import fitz
+    from PIL import Image, ImageDraw
+
+    samples = {}
+    for label, mp in (("small", megapixels), ("large", large_megapixels)):
+        width = int((mp * 1_000_000 * 4 / 3) ** 0.5)
+        height = width * 3 // 4
+        img = Image.new("RGB", (width, height), (30, 40, 60))
+        draw = ImageDraw.Draw(img)
+        for x in range(0, width, max(1, width // 40)):
+            draw.line((x, 0, width - x, height), fill=(x % 255, 120, 200), width=max(1, width // 200))
+        for kind, fmt in (("jpg", "JPEG"), ("png", "PNG"), ("webp", "WEBP")):
+            buf = io.BytesIO()
+            img.save(buf, fmt, quality=85) if fmt != "PNG" else img.save(buf, fmt, compress_level=1)
+            samples[(kind, label)] = buf.getvalue()
+        doc = fitz.open()
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((72, 120), f"Sample {label}", fontsize=36)
+        page.draw_rect(fitz.Rect(72, 200, 520, 760), color=(0.9, 0.2, 0.4), width=4)
+        samples[("pdf", label)] = doc.tobytes()
+    return samples
+
+
+def generate_dataset(root: Path, files: int, synced: int, kinds: list[str], large_fraction: float,
+                     megapixels: float, large_megapixels: float, seed: int = 1):
+    """
+    Writes a primary folder and `synced` synced folders with matching IDs.
+    Files are named "img (N).ext" and shuffled in creation order, so the
+    directory order is not already sorted.
+    """
+    rng = random.Random(seed)
+    samples = _encoded_samples(megapixels, large_megapixels)
+    folders = [root / "primary"] + [root / f"synced{i + 1}" for i in range(synced)]
+    for folder in folders:
+        folder.mkdir(parents=True, exist_ok=True)
+    ids = list(range(1, files + 1))
+    rng.shuffle(ids)
+    for n, image_id in enumerate(ids):
+        kind = kinds[n % len(kinds)]
+        label = "large" if rng.random() < large_fraction else "small"
+        data = samples[(kind, label)]
+        (folders[0] / f"img ({image_id}).{kind}").write_bytes(data)
+        for folder in folders[1:]:
+            (folder / f"img ({image_id}).{kind}").write_bytes(data)
+
+
+def _dataset_folders(root: Path) -> tuple[Path, list[Path]]:
+    synced = sorted(p for p in root.iterdir() if p.name.startswith("synced"))
+    return root / "primary", synced
+
+
+def run_scan(root: Path, repeat: int) -> dict:
+    from core.folder_index import FolderIndex
+    from core.scanner import scan_folder
+
+    primary, _ = _dataset_folders(root)
+    timings = []
+    entries = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        entries = list(scan_folder(primary))
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    index = FolderIndex(primary)
+    build = time.perf_counter() - start
+    lookups = []
+    for entry in entries:
+        start = time.perf_counter()
+        index.get(entry.image_id)
+        lookups.append(time.perf_counter() - start)
+    return {
+        "items": len(entries),
+        "seconds": min(timings),
+        "latency_ms": percentiles(timings),
+        "extra": {"index_build_s": build, "lookup_latency_ms": percentiles(lookups)},
+    }
+
+
+def run_decode(root: Path, repeat: int) -> dict:
+    from concurrent.futures import as_completed
+
+    from core.scanner import scan_folder
+    from core.thumbnailer import make_executor, make_thumbnail
+
+    primary, _ = _dataset_folders(root)
+    paths = [entry.path for entry in scan_folder(primary)]
+    latencies = []
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with make_executor() as executor:
+            futures = {executor.submit(make_thumbnail, p): p for p in paths}
+            for future in as_completed(futures):
+                future.result()
+                latencies.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"items": len(paths), "seconds": best, "latency_ms": percentiles(latencies)}
+
+
+def run_worker(root: Path, repeat: int) -> dict:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtCore import QSize, QThread
+    from PySide6.QtGui import QPixmap
+    from PySide6.QtWidgets import QApplication
+
+    from core.scanner import scan_folder
+    from ui.main_window import ThumbnailWorker
+
+    app = QApplication.instance() or QApplication([])
+    primary, _ = _dataset_folders(root)
+    paths = [entry.path for entry in scan_folder(primary)]
+    latencies = []
+    best = None
+    for _ in range(repeat):
+        arrived = []
+        thread = QThread()
+        worker = ThumbnailWorker(QSize(128, 128))
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        def on_ready(batch):
+            for path_str, image in batch:
+                QPixmap.fromImage(image)
+            arrived.extend([time.perf_counter()] * len(batch))
+
+        worker.thumbnails_ready.connect(on_ready)
+        worker.file_skipped.connect(lambda path_str, *_: arrived.append(time.perf_counter()))
+        start = time.perf_counter()
+        thread.start()
+        worker.request(paths)
+        while len(arrived) < len(paths):
+            app.processEvents()
+            if time.perf_counter() - start > 600:
+                break
+        elapsed = time.perf_counter() - start
+        worker.stop()
+        thread.quit()
+        thread.wait()
+        latencies += [t - start for t in arrived]
+        best = elapsed if best is None else min(best, elapsed)
+    return {"items": len(paths), "seconds": best, "latency_ms": percentiles(latencies)}
+
+
+def run_sets(root: Path, repeat: int) -> dict:
+    from core.scanner import scan_folder
+    from core.set_manager import SetManager
+
+    primary, _ = _dataset_folders(root)
+    paths = sorted(entry.path for entry in scan_folder(primary))
+    rng = random.Random(2)
+    assign, undo = [], []
+    total = 0.0
+    for _ in range(repeat):
+        manager = SetManager()
+        start_all = time.perf_counter()
+        i = 0
+        while i < len(paths):
+            size = rng.choice((1, 2, 3))
+            group = paths[i:i + size]
+            i += size
+            start = time.perf_counter()
+            manager.add_set(size if len(group) == size else 1, group)
+            assign.append(time.perf_counter() - start)
+        while True:
+            start = time.perf_counter()
+            if manager.undo_last_set() is None:
+                break
+            undo.append(time.perf_counter() - start)
+        total += time.perf_counter() - start_all
+    return {
+        "items": len(paths),
+        "seconds": total / repeat,
+        "latency_ms": percentiles(assign),
+        "extra": {"undo_latency_ms": percentiles(undo)},
+    }
+
+
+def run_rename(root: Path, repeat: int) -> dict:
+    from core.rename_engine import execute_plan, plan_renames, undo_batch
+    from core.scanner import scan_folder
+
+    primary, synced = _dataset_folders(root)
+    journals = root / "journals"
+    timings, plans, undos = [], [], []
+    ops = 0
+    for _ in range(repeat):
+        sets = {"set1": sorted(entry.path for entry in scan_folder(primary))}
+        start = time.perf_counter()
+        plan = plan_renames(sets, primary, synced)
+        plans.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        journal = execute_plan(plan, directory=journals)
+        timings.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        undo_batch(journal.path, directory=journals)
+        undos.append(time.perf_counter() - start)
+        ops = len(plan)
+    shutil.rmtree(journals, ignore_errors=True)
+    return {
+        "items": ops,
+        "seconds": min(timings),
+        "latency_ms": percentiles(timings),
+        "extra": {"plan_latency_ms": percentiles(plans), "undo_latency_ms": percentiles(undos)},
+    }
+
+
+RUNNERS = {"scan": run_scan, "decode": run_decode, "worker": run_worker, "sets": run_sets, "rename": run_rename}
+
+
+def _run_child(*args: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", *args],
+        check=True, capture_output=True, text=True,
+    ).stdout
+
+
+def compare(results: list[dict], baseline: list[dict]) -> list[str]:
+    """Lines describing how each scenario's throughput changed against a baseline run."""
+    base = {(r["scenario"], r["root_kind"]): r for r in baseline}
+    lines = []
+    for r in results:
+        b = base.get((r["scenario"], r["root_kind"]))
+        if b and b.get("throughput") and r.get("throughput"):
+            change = (r["throughput"] / b["throughput"] - 1) * 100
+            lines.append(f"{r['scenario']:<8} {r['root_kind']:<8} {b['throughput']:>12.1f} -> {r['throughput']:>12.1f} /s  {change:+6.1f}%")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", action="append", type=Path, help="Folder to generate data in; repeat to compare filesystems (default: the temp folder).")
+    parser.add_argument("--tmpfs", action="store_true", help="Also run under /dev/shm if it exists.")
+    parser.add_argument("--files", type=int, default=1000, help="Files per folder.")
+    parser.add_argument("--synced", type=int, default=2, help="Number of synced folders.")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="File types to generate, comma separated.")
+    parser.add_argument("--large-fraction", type=float, default=0.1, help="Share of files generated at --large-megapixels.")
+    parser.add_argument("--megapixels", type=float, default=2, help="Size of ordinary images.")
+    parser.add_argument("--large-megapixels", type=float, default=24, help="Size of large images.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Scenarios to run, comma separated.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the best time is reported.")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON.")
+    parser.add_argument("--compare", type=Path, metavar="BASELINE", help="Compare with the results of an earlier --json run.")
+    parser.add_argument("--child", choices=("generate",) + SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--data", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "generate":
+        generate_dataset(args.data, args.files, args.synced, args.kinds.split(","), args.large_fraction,
+                         args.megapixels, args.large_megapixels)
+        return
+    if args.child:
+        result = RUNNERS[args.child](args.data, args.repeat)
+        result["peak_rss_kb"] = peak_rss_kb()
+        print(json.dumps(result))
+        return
+
+    roots = args.root or [Path(tempfile.gettempdir())]
+    if args.tmpfs and Path("/dev/shm").is_dir():
+        roots.append(Path("/dev/shm"))
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    results = []
+    for base in roots:
+        root_kind = "tmpfs" if str(base).startswith("/dev/shm") else base.name or str(base)
+        with tempfile.TemporaryDirectory(prefix="afw-bench-", dir=base) as tmp:
+            data = Path(tmp)
+            # Generated in a child too: peak RSS survives exec, so the parent must stay small.
+            _run_child("--child", "generate", "--data", str(data), "--files", str(args.files),
+                       "--synced", str(args.synced), "--kinds", args.kinds, "--large-fraction", str(args.large_fraction),
+                       "--megapixels", str(args.megapixels), "--large-megapixels", str(args.large_megapixels))
+            for scenario in scenarios:
+                try:
+                    out = _run_child("--child", scenario, "--data", str(data), "--repeat", str(args.repeat))
+                except subprocess.CalledProcessError as e:
+                    print(f"Warning: {scenario} failed on {base}:\n{e.stderr}", file=sys.stderr)
+                    continue
+                result = json.loads(out.strip().splitlines()[-1])
+                result.update(scenario=scenario, root=str(base), root_kind=root_kind)
+                result["throughput"] = result["items"] / result["seconds"] if result["seconds"] else 0.0
+                results.append(result)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "files": args.files,
+            "synced": args.synced,
+            "kinds": args.kinds,
+            "repeat": args.repeat,
+            "time": time.time(),
+        },
+        "results": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'scenario':<8} {'root':<8} {'items':>7} {'seconds':>9} {'items/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'RSS MiB':>8}")
+    for r in results:
+        lat = r.get("latency_ms", {})
+        print(f"{r['scenario']:<8} {r['root_kind']:<8} {r['items']:>7} {r['seconds']:>9.3f} {r['throughput']:>11.1f} "
+              f"{lat.get('p50', 0):>9.3f} {lat.get('p99', 0):>9.3f} {r['peak_rss_kb'] / 1024:>8.1f}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print("\nThroughput against baseline:")
+        for line in compare(results, baseline):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+# AFWRename/cli.py
+"""
+Headless batch mode. Replays set assignments from plan files and renames the
+files without starting the GUI. Only the core modules are imported, so neither
+Qt nor the imaging libraries need to be installed.
+
+A plan file lists the sets in the order they were assigned:
+
+    {
+        "primary": "/data/shoot-01/raw",
+        "synced": ["/data/shoot-01/edited"],
+        "groups": [
+            ["img (12).jpg", "img (13).jpg"],
+            {"set": 1, "files": ["img (14).jpg", "img (15).jpg"]}
+        ]
+    }
+
+A plain list of files becomes a set of that size; the object form is needed to
+put several files into set1 at once. File names are resolved against the
+primary folder. `--primary` and `--synced` override the folders in the plan.
+`--match-content` also matches files by their picture, which needs Pillow.
+Such matches are fuzzy, so they are listed as warnings and nothing is renamed
+unless `--yes` is given as well; review them with `--dry-run` first.
+
+Examples:
+
+    python cli.py apply plan.json --dry-run
+    python cli.py apply nightly/*.json --json
+    python cli.py apply plan.json --export /mnt/archive/shoot-01 --verify
+    python cli.py apply plan.json --match-content --dry-run
+    python cli.py apply plan.json --match-content --yes
+    python cli.py resume
+    python cli.py rollback ~/.local/share/AFWRename/journals/<batch>.jsonl
+    python cli.py apply plan.json --trace rename-trace.json
+
+Exit codes: 0 on success, 1 if renaming failed or was interrupted, 2 for
+invalid arguments or plan files, 3 if a plan has conflicts and was not run,
+4 if a plan matched files by content and was not run because `--yes` was not
+given.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from core import instrumentation
+from core.exporter import ExportError, export_files, plan_export
+from core.rename_engine import (
+    RenameBatchError, RenameConflictError, execute_plan, find_incomplete_batches,
+    plan_renames, resume_batch, rollback_batch
+)
+from core.set_manager import SetManager
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CONFLICTS = 3
+EXIT_UNCONFIRMED = 4
+
+
+class PlanError(Exception):
+    """Raised when a plan file cannot be read or does not describe valid sets."""
+
+
+def load_plan(path: Path) -> dict:
+    """Reads a plan file and checks its structure."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            plan = json.load(f)
+    except (OSError, ValueError) as e:
+        raise PlanError(f"{path}: {e}") from e
+    if not isinstance(plan, dict) or not isinstance(plan.get("groups"), list):
+        raise PlanError(f"{path}: expected an object with a 'groups' list.")
+    return plan
+
+
+def build_sets(groups: list, primary_folder: Path) -> dict:
+    """Replays the plan's groups through a SetManager, as the GUI would have."""
+    set_manager = SetManager()
+    for n, group in enumerate(groups, 1):
+        if isinstance(group, dict):
+            set_size, files = group.get("set"), group.get("files")
+        else:
+            set_size, files = (len(group) if isinstance(group, list) else None), group
+        if set_size not in (1, 2, 3) or not isinstance(files, list) or not all(isinstance(f, str) for f in files):
+            raise PlanError(f"Group {n} is not a list of 1 to 3 file names or a {{'set', 'files'}} object.")
+        paths = [str(primary_folder / f) for f in files]
+        repeated = [Path(p).name for p in paths if set_manager.is_assigned(p)]
+        if repeated or len(set(paths)) != len(paths):
+            raise PlanError(f"Group {n} repeats a file that is already in a set: {', '.join(repeated) or 'within the group'}.")
+        if set_manager.add_set(set_size, paths) is None:
+            raise PlanError(f"Group {n} does not have {set_size} files for set{set_size}.")
+    return set_manager.get_all_sets()
+
+
+def apply_plan(plan_path: Path, args) -> tuple[int, dict]:
+    """Plans and, unless this is a dry run, applies one plan file."""
+    result = {"plan": str(plan_path), "status": "ok", "dry_run": args.dry_run}
+    try:
+        plan_data = load_plan(plan_path)
+        primary = args.primary or plan_data.get("primary")
+        synced = args.synced if args.synced is not None else plan_data.get("synced", [])
+        if not primary:
+            raise PlanError(f"{plan_path}: no primary folder given.")
+        primary_folder = Path(primary)
+        synced_folders = [Path(folder) for folder in synced]
+        for folder in [primary_folder] + synced_folders + ([args.export] if args.export else []):
+            if not folder.is_dir():
+                raise PlanError(f"{plan_path}: '{folder}' is not a folder.")
+        sets = build_sets(plan_data["groups"], primary_folder)
+    except PlanError as e:
+        result.update(status="invalid", error=str(e))
+        return EXIT_USAGE, result
+
+    try:
+        if args.export:
+            plan = plan_export(sets, primary_folder, args.export)
+        else:
+            plan = plan_renames(sets, primary_folder, synced_folders, matcher=content_matcher(args))
+    except OSError as e:
+        # A folder became unreadable after it was checked.
+        result.update(status="failed", error=str(e), warnings=[], conflicts=[])
+        return EXIT_FAILED, result
+    result.update(
+        primary=str(primary_folder),
+        synced=[str(folder) for folder in synced_folders],
+        renames=[{"src": str(op.src), "dst": str(op.dst)} for op in plan.ops],
+        warnings=plan.warnings,
+        conflicts=plan.conflicts,
+        content_matches=[] if args.export else plan.content_matches,
+    )
+    if args.export:
+        result["export"] = str(args.export)
+    if plan.conflicts:
+        result["status"] = "conflicts"
+        return EXIT_CONFLICTS, result
+    if args.dry_run or not plan.ops:
+        return EXIT_OK, result
+    if result["content_matches"] and not args.yes:
+        result["status"] = "unconfirmed"
+        return EXIT_UNCONFIRMED, result
+
+    try:
+        if args.export:
+            export = export_files(plan, allow_hardlinks=args.hardlink, verify=args.verify)
+            result.update(bytes=export.total_bytes, seconds=export.seconds, methods=dict(export.methods))
+        else:
+            journal = execute_plan(plan, directory=args.journal_dir)
+            result["journal"] = str(journal.path)
+    except RenameConflictError as e:
+        result.update(status="conflicts", conflicts=e.conflicts)
+        return EXIT_CONFLICTS, result
+    except RenameBatchError as e:
+        result.update(status="failed", error=str(e), journal=str(e.journal_path))
+        return EXIT_FAILED, result
+    except ExportError as e:
+        result.update(status="failed", error=str(e))
+        return EXIT_FAILED, result
+    except OSError as e:
+        result.update(status="failed", error=str(e))
+        return EXIT_FAILED, result
+    return EXIT_OK, result
+
+
+def content_matcher(args):
+    """The matcher for --match-content. Needs Pillow, and NumPy for speed."""
+    if not args.match_content:
+        return None
+    from core.content_match import ContentMatcher
+    from core.thumbnail_cache import ThumbnailCache
+    try:
+        cache = ThumbnailCache()
+    except Exception:
+        # Hashes are then computed for this run only.
+        cache = None
+    if args.match_threshold is None:
+        return ContentMatcher(cache=cache)
+    return ContentMatcher(args.match_threshold, cache)
+
+
+def print_apply_result(result: dict):
+    plan, status = result["plan"], result["status"]
+    if status == "invalid":
+        print(f"{plan}: {result['error']}", file=sys.stderr)
+        return
+    for warning in result["warnings"]:
+        print(f"{plan}: Warning: {warning}", file=sys.stderr)
+    for conflict in result["conflicts"]:
+        print(f"{plan}: Conflict: {conflict}", file=sys.stderr)
+    if status == "unconfirmed":
+        print(
+            f"{plan}: {len(result['content_matches'])} file(s) were matched by content; "
+            "nothing was renamed. Check the matches with --dry-run and run again with --yes.",
+            file=sys.stderr
+        )
+    if result["dry_run"]:
+        for rename in result["renames"]:
+            print(f"{rename['src']} -> {rename['dst']}")
+    if status == "failed":
+        print(f"{plan}: {result['error']}", file=sys.stderr)
+        if "journal" in result:
+            print(f"{plan}: resume or roll back with journal {result['journal']}", file=sys.stderr)
+    elif status == "ok":
+        verb = "renamed"
+        if result["dry_run"]:
+            verb = "would export" if "export" in result else "would rename"
+        if "bytes" in result:
+            print(f"{plan}: exported {len(result['renames'])} file(s), {result['bytes'] / 1e6:.1f} MB in {result['seconds']:.1f}s.")
+        else:
+            print(f"{plan}: {verb} {len(result['renames'])} file(s).")
+
+
+def cmd_apply(args) -> int:
+    exit_code = EXIT_OK
+    results = []
+    for plan_path in args.plans:
+        code, result = apply_plan(plan_path, args)
+        exit_code = max(exit_code, code)
+        results.append(result)
+        if not args.json:
+            print_apply_result(result)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return exit_code
+
+
+def cmd_recover(args) -> int:
+    journals = args.journals or find_incomplete_batches(args.journal_dir)
+    recover = rollback_batch if args.command == "rollback" else resume_batch
+    exit_code = EXIT_OK
+    results = []
+    for path in journals:
+        result = {"journal": str(path), "status": "ok"}
+        try:
+            recover(path)
+        except (OSError, ValueError, RenameBatchError) as e:
+            result.update(status="failed", error=str(e))
+            exit_code = EXIT_FAILED
+        results.append(result)
+        if not args.json:
+            message = result.get("error", "rolled back" if args.command == "rollback" else "resumed")
+            print(f"{path}: {message}", file=sys.stderr if result["status"] == "failed" else sys.stdout)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return exit_code
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="afwrename", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--journal-dir", type=Path, help="Where rename journals are kept (default: the app's data folder).")
+    common.add_argument("--json", action="store_true", help="Print results as JSON on stdout.")
+    common.add_argument("--profile", action="store_true", help="Print per-stage timings to stderr on exit.")
+    common.add_argument("--trace", metavar="FILE", help="Also write a Chrome trace of the run to FILE.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    apply = commands.add_parser("apply", parents=[common], help="Rename files according to one or more plan files.")
+    apply.add_argument("plans", nargs="+", type=Path, metavar="plan.json")
+    apply.add_argument("--primary", help="Primary folder, overriding the plan.")
+    apply.add_argument("--synced", nargs="*", help="Synced folders, overriding the plan.")
+    apply.add_argument("--dry-run", action="store_true", help="Show the renames without touching any file.")
+    apply.add_argument("--export", type=Path, metavar="DIR", help="Copy the primary folder's files here under their new names instead of renaming them.")
+    apply.add_argument("--verify", action="store_true", help="With --export, compare checksums of copied files.")
+    apply.add_argument("--hardlink", action="store_true", help="With --export, hard link files on the same filesystem instead of copying.")
+    apply.add_argument("--match-content", action="store_true", help="Match files without an ID, or whose counterpart was renamed, by their picture.")
+    apply.add_argument("--match-threshold", type=int, metavar="BITS", help="With --match-content, how many of the 64 hash bits may differ.")
+    apply.add_argument("--yes", action="store_true", help="With --match-content, apply plans that matched files by their picture.")
+    apply.set_defaults(func=cmd_apply)
+
+    for name, text in (("resume", "Finish interrupted batches."), ("rollback", "Undo interrupted batches.")):
+        recover = commands.add_parser(name, parents=[common], help=text)
+        recover.add_argument("journals", nargs="*", type=Path, help="Journal files (default: every incomplete batch).")
+        recover.set_defaults(func=cmd_recover)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.profile or args.trace:
+        instrumentation.enable(args.trace)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# AFWRename/core/app_dirs.py
+
+import os
+import sys
+from pathlib import Path
+
+
+def user_cache_dir() -> Path:
+    """Returns the per-user cache directory for the application."""
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+        return base / "AFWRename" / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "AFWRename"
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "afwrename"
+
+
+def user_data_dir() -> Path:
+    """Returns the per-user directory for state that must survive a cache wipe."""
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+        return base / "AFWRename"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Application Support" / "AFWRename"
+    base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / "afwrename"
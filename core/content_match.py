@@ -0,0 +1,238 @@
+# AFWRename/core/content_match.py
+"""
+Matching by picture rather than by name, for files whose name has no
+"(N)" ID or whose counterpart in a synced folder was renamed by another
+tool. Every file is reduced to a 64-bit perceptual hash (see
+thumbnailer.perceptual_hash), and two files match when their hashes
+differ in at most `threshold` bits. Pictures with too little detail, such
+as blank pages, hash to almost no set bits and would all match each other,
+so they are never matched.
+
+Hashes are taken from the thumbnail cache where the thumbnail pass already
+stored them, and otherwise computed once and stored there. Files are decoded
+in supervised worker processes with the same limits as thumbnails, so a
+malformed file fails on its own instead of stalling the plan. NumPy is used
+for the Hamming distances when it is installed; without it matching is
+the same, only slower on large folders.
+"""
+
+import os
+from concurrent.futures import Executor
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from core import instrumentation
+from core.scanner import scan_folder
+from core.thumbnail_cache import ThumbnailCache
+from core.thumbnailer import DEFAULT_PROCESS_WORKERS, MAX_DECODE_PIXELS, make_executor, make_thumbnail
+
+# Bits out of 64 in which two hashes may differ and still count as the same
+# picture. Resized and recompressed copies typically differ in 0-3.
+DEFAULT_MATCH_THRESHOLD = 10
+
+# Fewest set bits a hash needs to be matched at all. A uniform picture
+# hashes to 0, and near-blank ones to a handful of bits.
+MIN_HASH_BITS = 8
+
+# Queries compared with a folder's hashes at once, bounding the size of the
+# distance matrix.
+_QUERY_CHUNK = 256
+
+if np is not None:
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _table_popcount(values):
+        # For NumPy before 2.0, which lacks bitwise_count.
+        return _BYTE_BITS[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+    _popcount = getattr(np, "bitwise_count", _table_popcount)
+
+
+class HashIndex:
+    """The perceptual hashes of one folder's files, searched by Hamming distance."""
+
+    def __init__(self, paths: list[Path], hashes: list[int]):
+        self.paths = paths
+        self._hashes = np.array(hashes, dtype=np.uint64) if np is not None else hashes
+
+    def __len__(self):
+        return len(self.paths)
+
+    def match_all(self, queries: list[int], threshold: int, exclude: set[Path] | None = None) -> list[Path | None]:
+        """
+        Finds the file matching each query hash. A query only gets a match if
+        one file is strictly closer than every other and within `threshold`;
+        if several queries pick the same file, only a strictly closest one
+        keeps it. Files in `exclude` are never matched.
+        """
+        candidates = [p not in exclude for p in self.paths] if exclude else None
+        best = self._nearest(queries, candidates)
+        claims: dict[int, list[tuple[int, int]]] = {}
+        for q, (index, distance, runner_up) in enumerate(best):
+            if index is not None and distance <= threshold and runner_up > distance:
+                claims.setdefault(index, []).append((distance, q))
+        matches: list[Path | None] = [None] * len(queries)
+        for index, claimants in claims.items():
+            claimants.sort()
+            if len(claimants) == 1 or claimants[0][0] < claimants[1][0]:
+                matches[claimants[0][1]] = self.paths[index]
+        return matches
+
+    def _nearest(self, queries: list[int], candidates: list[bool] | None) -> list[tuple[int | None, int, int]]:
+        """(index of the closest hash, its distance, distance of the next closest) per query."""
+        if not self.paths or not queries:
+            return [(None, 65, 65)] * len(queries)
+        if np is None:
+            return [self._nearest_one(query, candidates) for query in queries]
+
+        results = []
+        mask = None if candidates is None else ~np.array(candidates, dtype=bool)
+        for start in range(0, len(queries), _QUERY_CHUNK):
+            chunk = np.array(queries[start:start + _QUERY_CHUNK], dtype=np.uint64)
+            distances = _popcount(chunk[:, None] ^ self._hashes[None, :]).astype(np.int16)
+            if mask is not None:
+                distances[:, mask] = 65
+            rows = np.arange(len(chunk))
+            if distances.shape[1] == 1:
+                closest = distances[:, 0]
+                nearest = np.zeros(len(chunk), dtype=np.intp)
+                runner_up = np.full(len(chunk), 65)
+            else:
+                two = np.argpartition(distances, 1, axis=1)[:, :2]
+                nearest = two[:, 0]
+                closest = distances[rows, nearest]
+                runner_up = distances[rows, two[:, 1]]
+            for index, distance, second in zip(nearest.tolist(), closest.tolist(), runner_up.tolist()):
+                results.append((index, distance, second) if distance <= 64 else (None, 65, 65))
+        return results
+
+    def _nearest_one(self, query: int, candidates: list[bool] | None) -> tuple[int | None, int, int]:
+        best = (None, 65, 65)
+        for index, value in enumerate(self._hashes):
+            if candidates is not None and not candidates[index]:
+                continue
+            distance = (query ^ value).bit_count()
+            if distance < best[1]:
+                best = (index, distance, best[1])
+            elif distance < best[2]:
+                best = (best[0], best[1], distance)
+        return best
+
+
+class ContentMatcher:
+    """
+    Finds files in other folders that show the same picture. Hashes are kept
+    for the matcher's lifetime, so one matcher should serve one plan.
+
+    Files are decoded on `executor` if given, a pool from
+    make_executor(use_processes=True) shared with other work and left
+    running; otherwise a pool of up to `max_workers` processes is started
+    for each batch of files.
+    """
+
+    def __init__(
+        self,
+        threshold: int = DEFAULT_MATCH_THRESHOLD,
+        cache: ThumbnailCache | None = None,
+        max_workers: int | None = None,
+        executor: Executor | None = None
+    ):
+        self.threshold = threshold
+        self.cache = cache
+        self.max_workers = max_workers or DEFAULT_PROCESS_WORKERS
+        self.executor = executor
+        # Files that could not be read, for the caller to report.
+        self.warnings: list[str] = []
+        self._hashes: dict[Path, int] = {}
+
+    def match(
+        self, paths: list[Path], folder: Path, exclude: set[Path] | None = None, exclude_ids: set[str] | None = None
+    ) -> dict[Path, Path]:
+        """
+        Returns the file in `folder` matching each of `paths` that has one.
+        Files in `exclude`, and files whose ID is in `exclude_ids` because
+        they are another file's counterpart, are never candidates.
+        """
+        index = self.folder_index(folder, exclude, exclude_ids)
+        hashes = self.hashes(paths)
+        queries = []
+        for path in paths:
+            if path not in hashes:
+                continue
+            if hashes[path].bit_count() < MIN_HASH_BITS:
+                self.warnings.append(f"'{path.name}' has too little detail to be matched by content.")
+                continue
+            queries.append(path)
+        with instrumentation.span("match.search"):
+            found = index.match_all([hashes[path] for path in queries], self.threshold)
+        return {path: match for path, match in zip(queries, found) if match is not None}
+
+    def folder_index(self, folder: Path, exclude: set[Path] | None = None, exclude_ids: set[str] | None = None) -> HashIndex:
+        """
+        Hashes the candidate files in `folder`; excluded files are not decoded
+        at all, and files with too little detail are left out.
+        """
+        exclude = exclude or set()
+        exclude_ids = exclude_ids or set()
+        entries = {}
+        for entry in scan_folder(folder, sort_keys=False):
+            path = Path(entry.path)
+            if path not in exclude and entry.image_id not in exclude_ids:
+                entries[path] = (entry.size, entry.mtime_ns)
+        hashes = self.hashes(list(entries), entries)
+        paths = [path for path in entries if path in hashes and hashes[path].bit_count() >= MIN_HASH_BITS]
+        return HashIndex(paths, [hashes[path] for path in paths])
+
+    def hashes(self, paths: list[Path], stats: dict[Path, tuple[int, int]] | None = None) -> dict[Path, int]:
+        """Returns the hash of every path that could be read, decoding only files not in the cache."""
+        result = {}
+        missing = []
+        for path in paths:
+            if path in self._hashes:
+                result[path] = self._hashes[path]
+                continue
+            stat_key = (stats or {}).get(path) or _stat_key(path)
+            if stat_key is None:
+                continue
+            cached = self.cache.get_hash(str(path), *stat_key) if self.cache else None
+            if cached is not None:
+                result[path] = cached
+            else:
+                missing.append((path, stat_key))
+        if missing:
+            if self.executor is not None:
+                self._decode(self.executor, missing, result)
+            else:
+                # Worker processes take a moment to start, so no more are started than there are files.
+                with make_executor(min(self.max_workers, len(missing)), use_processes=True) as executor:
+                    self._decode(executor, missing, result)
+            if self.cache:
+                self.cache.flush()
+        self._hashes.update(result)
+        return result
+
+    def _decode(self, executor: Executor, missing: list[tuple[Path, tuple[int, int]]], result: dict[Path, int]):
+        futures = [executor.submit(make_thumbnail, str(path), max_pixels=MAX_DECODE_PIXELS) for path, _ in missing]
+        for (path, stat_key), future in zip(missing, futures):
+            try:
+                thumb = future.result()
+            except Exception as e:
+                self.warnings.append(f"Could not read '{path.name}' to match it by content: {e}")
+                continue
+            if thumb is None or thumb.phash is None:
+                continue
+            result[path] = thumb.phash
+            if self.cache:
+                self.cache.put_hash(str(path), *stat_key, thumb.phash)
+
+
+def _stat_key(path: Path) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
@@ -0,0 +1,239 @@
+# AFWRename/core/decode_pool.py
+"""
+A process pool for decoding untrusted files. Each worker process runs one
+file at a time under a time limit and, where the platform allows it, a
+memory limit. A worker that runs over its time, or crashes, is killed and
+replaced, and the file fails with DecodeLimitError; the other workers carry
+on undisturbed. Running out of memory within the limit fails the same way.
+
+Workers are started with the "spawn" method on every platform, since
+forking a process that runs Qt threads is unsafe.
+"""
+
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import CancelledError, Executor, Future
+
+from core import instrumentation
+from core.thumbnailer import DEFAULT_PROCESS_WORKERS, DecodeLimitError
+
+# Longest time one file may take, in seconds.
+TIME_LIMIT = 10.0
+
+# Address space each worker process may use, in bytes. Applied with
+# RLIMIT_AS, which Windows lacks; make_thumbnail's pixel limit bounds
+# memory there.
+MEMORY_LIMIT = 2 * 1024 ** 3
+
+# Time a worker is given to start, and to exit after being asked to, in seconds.
+_START_TIMEOUT = 60.0
+_EXIT_TIMEOUT = 1.0
+
+
+def _limit_memory(limit: int):
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _worker_main(conn, memory_limit: int | None, initializer, initargs):
+    """Runs calls received on `conn` until told to stop, sending back each result."""
+    # Timings are reported by the parent process only; see instrumentation.
+    instrumentation.ENABLED = False
+    if memory_limit:
+        _limit_memory(memory_limit)
+    if initializer is not None:
+        initializer(*initargs)
+    conn.send(("ready", None))
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        fn, args, kwargs = task
+        try:
+            reply = ("ok", fn(*args, **kwargs))
+        except MemoryError:
+            reply = ("memory", None)
+        except Exception as e:
+            reply = ("error", e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The result or exception could not be pickled.
+            conn.send(("error", RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    """One worker process and the pipe to it, restarted after it is killed."""
+
+    def __init__(self, context, memory_limit: int | None, initializer, initargs):
+        self._context = context
+        self._memory_limit = memory_limit
+        self._init = (initializer, initargs)
+        self.process = None
+        self.conn = None
+        self._ready = False
+
+    def start(self):
+        if self.process is not None:
+            return
+        self.conn, child_conn = self._context.Pipe()
+        self.process = self._context.Process(
+            target=_worker_main, args=(child_conn, self._memory_limit, *self._init), daemon=True, name="decoder"
+        )
+        self.process.start()
+        child_conn.close()
+        self._ready = False
+
+    def call(self, fn, args, kwargs, time_limit: float):
+        self.start()
+        try:
+            if not self._ready:
+                if not self.conn.poll(_START_TIMEOUT):
+                    self.kill()
+                    raise DecodeLimitError("The decoder did not start.")
+                self.conn.recv()
+                self._ready = True
+            self.conn.send((fn, args, kwargs))
+            if not self.conn.poll(time_limit):
+                self.kill()
+                raise DecodeLimitError(f"Took longer than {time_limit:g} seconds.")
+            status, value = self.conn.recv()
+        except (EOFError, OSError):
+            exitcode = self.kill()
+            raise DecodeLimitError(f"The decoder crashed (exit code {exitcode}).") from None
+        if status == "memory":
+            if self._memory_limit:
+                raise DecodeLimitError(f"Needs more than {self._memory_limit // 1024 ** 2} MB of memory.")
+            raise DecodeLimitError("Ran out of memory.")
+        if status == "error":
+            raise value
+        return value
+
+    def kill(self) -> int | None:
+        """Stops the process at once; the next call starts a new one."""
+        process, self.process = self.process, None
+        if process is None:
+            return None
+        process.kill()
+        process.join()
+        self.conn.close()
+        return process.exitcode
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(_EXIT_TIMEOUT)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.process = None
+            self.conn.close()
+
+
+class SupervisedPool(Executor):
+    """
+    Executor running calls in worker processes, one call per process at a
+    time. Functions and arguments must be picklable, as for a
+    ProcessPoolExecutor. Calls that exceed `time_limit` or `memory_limit`,
+    or that crash their worker, fail with DecodeLimitError.
+
+    Workers are started at once and run `initializer` first, so that they
+    are ready, e.g. with their libraries imported, when work arrives. The
+    time limit does not include this start up.
+    """
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        time_limit: float = TIME_LIMIT,
+        memory_limit: int | None = MEMORY_LIMIT,
+        initializer=None,
+        initargs: tuple = ()
+    ):
+        self.max_workers = max_workers or DEFAULT_PROCESS_WORKERS
+        self.time_limit = time_limit
+        self._queue = queue.SimpleQueue()
+        self._shutdown = False
+        self._abandoned = False
+        self._lock = threading.Lock()
+        context = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(context, memory_limit, initializer, initargs) for _ in range(self.max_workers)]
+        self._threads = [
+            threading.Thread(target=self._supervise, args=(worker,), daemon=True, name="decoder-supervisor")
+            for worker in self._workers
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def _supervise(self, worker: _Worker):
+        worker.start()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                worker.close()
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = worker.call(fn, args, kwargs, self.time_limit)
+            except DecodeLimitError as e:
+                if self._abandoned:
+                    # Killed by shutdown(cancel_futures=True) rather than by a limit.
+                    future.set_exception(CancelledError())
+                    continue
+                instrumentation.count("decode.limit")
+                future.set_exception(e)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """
+        Stops the workers once queued calls are done. With `cancel_futures`,
+        queued calls are cancelled and running ones abandoned, killing their
+        workers so that a slow file does not keep a process busy.
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            self._abandoned = cancel_futures
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            for _ in self._threads:
+                self._queue.put(None)
+        if cancel_futures:
+            for worker in self._workers:
+                process = worker.process
+                if process is not None and process.is_alive():
+                    process.kill()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,337 @@
+# AFWRename/core/exporter.py
+
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from core import instrumentation
+from core.rename_engine import RenameConflictError, set_targets
+from core.scanner import TEMP_NAME_PREFIX, FileRecord
+
+# Files copied at the same time. The kernel does the copying, so a few threads
+# are enough to keep one disk busy and to overlap latency on network shares.
+DEFAULT_COPY_WORKERS = 4
+
+# Bytes moved per copy system call, and between progress and cancel checks.
+COPY_CHUNK = 16 * 1024 * 1024
+
+# Buffer size for the plain read/write fallback and for checksums.
+BUFFER_SIZE = 1024 * 1024
+
+# Linux ioctl that shares a file's blocks with another (Btrfs, XFS, bcachefs).
+_FICLONE = 0x40049409
+
+# Errors meaning a copy method is not available here, rather than a failed copy.
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY}
+
+# Called with files finished, total files, bytes copied and total bytes.
+# May be called from worker threads.
+ExportProgressCallback = Callable[[int, int, int, int], None]
+
+
+class ExportError(Exception):
+    """Raised when some files could not be exported. The others were exported."""
+
+    def __init__(self, errors: list[str], result: "ExportResult"):
+        self.errors = errors
+        self.result = result
+        super().__init__(f"{len(errors)} file(s) could not be exported:\n" + "\n".join(errors))
+
+
+class ExportCancelledError(Exception):
+    """
+    Raised when an export was cancelled. Files it had already written are
+    removed; `errors` lists those that could not be.
+    """
+
+    def __init__(self, errors: list[str] | None = None):
+        self.errors = errors or []
+        message = "Export was cancelled."
+        if self.errors:
+            message += " These exported files could not be removed:\n" + "\n".join(self.errors)
+        super().__init__(message)
+
+
+class ExportOp(NamedTuple):
+    src: Path
+    dst: Path
+    size: int
+
+
+class ExportPlan:
+    """
+    Every copy for one export run. `conflicts` lists copies whose source is
+    missing or whose target already exists or is shared with another copy;
+    a plan with conflicts is never executed.
+    """
+
+    def __init__(self, ops: list[ExportOp], warnings: list[str] | None = None, conflicts: list[str] | None = None):
+        self.ops = ops
+        self.warnings = warnings or []
+        self.conflicts = conflicts or []
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(op.size for op in self.ops)
+
+    def __len__(self):
+        return len(self.ops)
+
+
+class ExportResult:
+    """What an export did: how many files and bytes, how long it took, and how each file was written."""
+
+    def __init__(self, files: int, total_bytes: int, seconds: float, methods: Counter):
+        self.files = files
+        self.total_bytes = total_bytes
+        self.seconds = seconds
+        self.methods = methods
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.total_bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        methods = ", ".join(f"{count} {method}" for method, count in sorted(self.methods.items()))
+        return (
+            f"Exported {self.files} files ({self.total_bytes / 1e9:.2f} GB) in {self.seconds:.1f}s, "
+            f"{self.bytes_per_second / 1e6:.0f} MB/s ({methods})."
+        )
+
+
+def plan_export(
+    sets: dict, primary_folder: Path, output_dir: Path, records: dict[str, FileRecord] | None = None
+) -> ExportPlan:
+    """
+    Works out the new name of every file in the sets inside `output_dir`.
+    See set_targets() for `records`.
+    """
+    warnings = []
+    ops = []
+    conflicts = []
+    targets = set()
+    for op in set_targets(sets, primary_folder, [], warnings=warnings, records=records):
+        dst = output_dir / op.dst.name
+        key = os.path.normcase(dst)
+        if key in targets:
+            conflicts.append(f"Two files would both be exported as '{dst.name}'.")
+            continue
+        targets.add(key)
+        try:
+            size = op.src.stat().st_size
+        except OSError:
+            conflicts.append(f"'{op.src.name}' no longer exists in '{op.folder.name}'.")
+            continue
+        if dst.exists():
+            conflicts.append(f"'{dst.name}' already exists in '{output_dir.name}'.")
+        ops.append(ExportOp(op.src, dst, size))
+    return ExportPlan(ops, warnings, conflicts)
+
+
+def export_files(
+    plan: ExportPlan,
+    max_workers: int = DEFAULT_COPY_WORKERS,
+    allow_hardlinks: bool = False,
+    verify: bool = False,
+    progress: ExportProgressCallback | None = None,
+    cancel: threading.Event | None = None
+) -> ExportResult:
+    """
+    Writes every file of the plan to its target, in parallel. Each file is
+    reflinked where the filesystem supports it, or copied by the kernel with
+    copy_file_range/sendfile into a preallocated file, falling back to a
+    buffered copy. Hard links are only used if allowed, since they share the
+    file rather than its contents: editing the export would edit the original.
+
+    Files are written under a temporary name and renamed once complete. With
+    `verify`, copied files are read back and compared by checksum. Setting
+    `cancel` stops the export and removes the files it already wrote.
+    """
+    if plan.conflicts:
+        raise RenameConflictError(plan.conflicts)
+
+    total_files = len(plan.ops)
+    total_bytes = plan.total_bytes
+    lock = threading.Lock()
+    files_done = 0
+    bytes_done = 0
+    written: list[Path] = []
+    errors: list[str] = []
+    methods: Counter = Counter()
+
+    def on_bytes(n: int):
+        nonlocal bytes_done
+        with lock:
+            bytes_done += n
+            if progress:
+                progress(files_done, total_files, bytes_done, total_bytes)
+
+    def export_one(op: ExportOp):
+        nonlocal files_done
+        if cancel is not None and cancel.is_set():
+            return
+        try:
+            with instrumentation.span("export.file"):
+                method = _export_file(op, allow_hardlinks, verify, on_bytes, cancel)
+        except ExportCancelledError:
+            return
+        except OSError as e:
+            with lock:
+                errors.append(f"{op.src.name}: {e}")
+            return
+        with lock:
+            written.append(op.dst)
+            methods[method] += 1
+            files_done += 1
+            if progress:
+                progress(files_done, total_files, bytes_done, total_bytes)
+
+    start = time.perf_counter()
+    if plan.ops:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(plan.ops)), thread_name_prefix="export") as executor:
+            futures = [executor.submit(export_one, op) for op in plan.ops]
+        for future in futures:
+            future.result()
+    exported = set(written)
+    result = ExportResult(files_done, sum(op.size for op in plan.ops if op.dst in exported), time.perf_counter() - start, methods)
+
+    if cancel is not None and cancel.is_set():
+        leftovers = []
+        for path in written:
+            try:
+                path.unlink()
+            except OSError as e:
+                leftovers.append(f"{path}: {e}")
+        raise ExportCancelledError(leftovers)
+    if errors:
+        raise ExportError(errors, result)
+    return result
+
+
+def _export_file(op: ExportOp, allow_hardlinks: bool, verify: bool, on_bytes: Callable[[int], None], cancel: threading.Event | None) -> str:
+    """Writes one file and returns how: "hardlinked", "reflinked" or "copied"."""
+    if allow_hardlinks:
+        try:
+            # Creates the target atomically and refuses to replace an existing file.
+            os.link(op.src, op.dst)
+            on_bytes(op.size)
+            return "hardlinked"
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                raise
+
+    tmp = op.dst.with_name(f"{TEMP_NAME_PREFIX}export-{uuid.uuid4().hex[:12]}{op.dst.suffix}")
+    try:
+        with open(op.src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            if _reflink(fsrc.fileno(), fdst.fileno()):
+                method = "reflinked"
+                on_bytes(op.size)
+            else:
+                method = "copied"
+                _copy_data(fsrc.fileno(), fdst.fileno(), op.size, on_bytes, cancel)
+        shutil.copystat(op.src, tmp)
+        if verify and method == "copied" and _checksum(op.src) != _checksum(tmp):
+            raise OSError(f"checksum mismatch after copying to '{op.dst.name}'")
+        if op.dst.exists():
+            raise FileExistsError(errno.EEXIST, "Target already exists", str(op.dst))
+        os.replace(tmp, op.dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return method
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _copy_data(src_fd: int, dst_fd: int, size: int, on_bytes: Callable[[int], None], cancel: threading.Event | None):
+    """Copies file contents, preferring in-kernel copies over reading into Python."""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            # Reserves the space up front: less fragmentation, and a full disk fails early.
+            os.posix_fallocate(dst_fd, 0, size)
+        except OSError:
+            pass
+
+    copied = 0
+    for method in (_copy_file_range, _sendfile):
+        if method is None:
+            continue
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelledError()
+                n = method(src_fd, dst_fd, copied)
+                if n == 0:
+                    break
+                copied += n
+                on_bytes(n)
+            _finish(dst_fd, copied, size)
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            # Not available for this pair of files; carry on from where it stopped.
+
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    os.lseek(dst_fd, copied, os.SEEK_SET)
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(src_fd, "rb", buffering=0, closefd=False) as fsrc:
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelledError()
+            n = fsrc.readinto(buffer)
+            if not n:
+                break
+            os.write(dst_fd, view[:n])
+            copied += n
+            on_bytes(n)
+    _finish(dst_fd, copied, size)
+
+
+def _finish(dst_fd: int, copied: int, size: int):
+    # The file was preallocated to its expected size; trim it if the source shrank meanwhile.
+    if copied != size:
+        os.ftruncate(dst_fd, copied)
+
+
+def _copy_file_range_chunk(src_fd: int, dst_fd: int, offset: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, COPY_CHUNK, offset, offset)
+
+
+def _sendfile_chunk(src_fd: int, dst_fd: int, offset: int) -> int:
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, offset, COPY_CHUNK)
+
+
+_copy_file_range = _copy_file_range_chunk if hasattr(os, "copy_file_range") else None
+# sendfile only accepts a regular file as the destination on Linux.
+_sendfile = _sendfile_chunk if sys.platform.startswith("linux") and hasattr(os, "sendfile") else None
+
+
+def _checksum(path: Path) -> bytes:
+    digest = hashlib.blake2b()
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buffer):
+            digest.update(view[:n])
+    return digest.digest()
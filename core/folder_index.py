@@ -0,0 +1,67 @@
+# AFWRename/core/folder_index.py
+
+from pathlib import Path
+
+# The ID helpers live with the scanner, which extracts IDs while listing a folder.
+from core.scanner import ID_PATTERN, extract_id, scan_folder
+
+
+class FolderIndex:
+    """
+    Maps unique file IDs to paths for a single folder.
+
+    The folder is scanned once when the index is built. IDs that appear on more
+    than one file are recorded in `duplicates` and are never resolved, so an
+    ambiguous match is reported instead of silently picking one of the files.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self.paths: dict[str, Path] = {}
+        self.duplicates: dict[str, list[Path]] = {}
+        self._scan()
+
+    def _scan(self):
+        for entry in scan_folder(self.folder, suffixes=None, stat=False, sort_keys=False):
+            image_id = entry.image_id
+            if image_id is None:
+                continue
+            file_path = Path(entry.path)
+            if image_id in self.duplicates:
+                self.duplicates[image_id].append(file_path)
+            elif image_id in self.paths:
+                self.duplicates[image_id] = [self.paths.pop(image_id), file_path]
+            else:
+                self.paths[image_id] = file_path
+
+    def get(self, image_id: str) -> Path | None:
+        """Returns the unique file for an ID, or None if it is missing or ambiguous."""
+        return self.paths.get(image_id)
+
+    def is_duplicate(self, image_id: str) -> bool:
+        return image_id in self.duplicates
+
+    def duplicate_warnings(self) -> list[str]:
+        """Returns a warning for every ID shared by more than one file."""
+        warnings = []
+        for image_id, paths in sorted(self.duplicates.items(), key=lambda kv: int(kv[0])):
+            names = ", ".join(sorted(p.name for p in paths))
+            warnings.append(f"ID '({image_id})' appears on {len(paths)} files in '{self.folder.name}': {names}")
+        return warnings
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, image_id: str):
+        return image_id in self.paths
+
+
+def build_folder_indexes(folders: list[Path], warnings: list[str] | None = None) -> dict[Path, FolderIndex]:
+    """Builds one index per folder, adding any duplicate IDs found to `warnings`."""
+    indexes = {}
+    for folder in folders:
+        index = FolderIndex(folder)
+        if warnings is not None:
+            warnings.extend(index.duplicate_warnings())
+        indexes[folder] = index
+    return indexes
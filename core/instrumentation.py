@@ -0,0 +1,237 @@
+# AFWRename/core/instrumentation.py
+"""
+Opt-in timing instrumentation. Off by default, in which case span() hands
+back a shared no-op context manager and the other calls return at once.
+
+Enable it with the AFWRENAME_PROFILE=1 environment variable, or with
+AFWRENAME_TRACE=<file.json>, which also writes a Chrome trace (open it in
+chrome://tracing or https://ui.perfetto.dev). The GUI and the CLI accept
+--profile and --trace <file.json> as well. A summary of per-stage counts
+and latency percentiles is printed to stderr on exit.
+
+Timings are collected per process: stages that run inside a process pool
+are not included.
+
+With instrumentation on, the GUI also times its own start up: module
+imports as "import <module>" stages, the way `python -X importtime` does
+(which frozen builds cannot be given), and the time to the first paint.
+"""
+
+import atexit
+import importlib.abc
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from contextlib import contextmanager, nullcontext
+
+# Samples kept per stage for percentiles. Later samples still count towards
+# the totals.
+MAX_SAMPLES = 1_000_000
+
+# Trace events kept in memory before the rest are dropped.
+MAX_TRACE_EVENTS = 2_000_000
+
+ENABLED = False
+
+_lock = threading.Lock()
+_durations: dict[str, array] = {}
+_totals: dict[str, list] = {}  # stage -> [count, total seconds, max seconds]
+_counters: dict[str, int] = {}
+_flows: dict[tuple[str, object], float] = {}
+_trace_events: list[dict] | None = None
+_trace_path: str | None = None
+_origin = time.perf_counter()
+_null = nullcontext()
+
+
+def enable(trace_path: str | None = None):
+    """Turns instrumentation on for the rest of the process."""
+    global ENABLED, _trace_path, _trace_events
+    if trace_path:
+        _trace_path = trace_path
+        _trace_events = []
+    if not ENABLED:
+        ENABLED = True
+        atexit.register(dump)
+
+
+def enable_from_environment():
+    trace_path = os.environ.get("AFWRENAME_TRACE")
+    if trace_path or os.environ.get("AFWRENAME_PROFILE", "") not in ("", "0"):
+        enable(trace_path)
+
+
+def extract_args(argv: list[str]) -> list[str]:
+    """Handles --profile and --trace <file> and returns the remaining arguments."""
+    remaining = []
+    args = iter(argv)
+    for arg in args:
+        if arg == "--profile":
+            enable()
+        elif arg == "--trace":
+            enable(next(args, "afwrename-trace.json"))
+        elif arg.startswith("--trace="):
+            enable(arg.split("=", 1)[1])
+        else:
+            remaining.append(arg)
+    return remaining
+
+
+def record(stage: str, seconds: float, start: float | None = None):
+    """Adds one timing for a stage. `start` (perf_counter) places it on the trace timeline."""
+    if not ENABLED:
+        return
+    with _lock:
+        samples = _durations.get(stage)
+        if samples is None:
+            samples = _durations[stage] = array("d")
+            _totals[stage] = [0, 0.0, 0.0]
+        if len(samples) < MAX_SAMPLES:
+            samples.append(seconds)
+        totals = _totals[stage]
+        totals[0] += 1
+        totals[1] += seconds
+        if seconds > totals[2]:
+            totals[2] = seconds
+        if _trace_events is not None and len(_trace_events) < MAX_TRACE_EVENTS:
+            begin = start if start is not None else time.perf_counter() - seconds
+            _trace_events.append({
+                "name": stage, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                "ts": (begin - _origin) * 1e6, "dur": seconds * 1e6,
+            })
+
+
+@contextmanager
+def _span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, start)
+
+
+def span(stage: str):
+    """Times the enclosed block as one occurrence of `stage`."""
+    return _span(stage) if ENABLED else _null
+
+
+def count(counter: str, n: int = 1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + n
+
+
+def flow_start(stage: str, key):
+    """Marks the start of something that finishes elsewhere, e.g. on another thread."""
+    if not ENABLED:
+        return
+    with _lock:
+        _flows[(stage, key)] = time.perf_counter()
+
+
+def flow_end(stage: str, key):
+    """Records the time since the matching flow_start(), if there was one."""
+    if not ENABLED:
+        return
+    with _lock:
+        start = _flows.pop((stage, key), None)
+    if start is not None:
+        record(stage, time.perf_counter() - start, start)
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Wraps a module's loader to time its execution, nested imports included."""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with _span(f"import {module.__name__}"):
+            self._loader.exec_module(module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def trace_imports():
+    """Times every module imported from now on. Only takes effect while enabled."""
+    if ENABLED and not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+def import_report(top: int = 15) -> str:
+    """The slowest module imports so far, cumulative like `python -X importtime`."""
+    with _lock:
+        imports = [(stage[7:], total) for stage, (_, total, _) in _totals.items() if stage.startswith("import ")]
+    imports.sort(key=lambda item: -item[1])
+    return "\n".join(f"  {seconds * 1000:8.1f} ms  {name}" for name, seconds in imports[:top])
+
+
+def stats() -> dict:
+    """Per-stage count, total, mean and percentiles in milliseconds, plus counters."""
+    with _lock:
+        stages = {}
+        for stage, samples in _durations.items():
+            ordered = sorted(samples)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+            n, total, longest = _totals[stage]
+            stages[stage] = {
+                "count": n, "total_ms": total * 1000, "mean_ms": total / n * 1000,
+                "p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": longest * 1000,
+            }
+        return {"stages": stages, "counters": dict(_counters)}
+
+
+def summary() -> str:
+    data = stats()
+    lines = [f"{'stage':<24} {'count':>9} {'total ms':>11} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for stage, s in sorted(data["stages"].items(), key=lambda kv: -kv[1]["total_ms"]):
+        if stage.startswith("import "):
+            # Reported by import_report().
+            continue
+        lines.append(
+            f"{stage:<24} {s['count']:>9} {s['total_ms']:>11.1f} {s['mean_ms']:>9.3f} "
+            f"{s['p50_ms']:>9.3f} {s['p99_ms']:>9.3f} {s['max_ms']:>9.3f}"
+        )
+    for counter, value in sorted(data["counters"].items()):
+        lines.append(f"{counter:<24} {value:>9}")
+    return "\n".join(lines)
+
+
+def dump():
+    """Prints the summary and writes the trace file, if one was requested."""
+    if not ENABLED:
+        return
+    print("\nAFWRename timings:\n" + summary(), file=sys.stderr)
+    if _trace_path and _trace_events is not None:
+        try:
+            with _lock:
+                events = list(_trace_events)
+            with open(_trace_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+            print(f"Trace written to {_trace_path}", file=sys.stderr)
+        except OSError as e:
+            print(f"Warning: Could not write trace: {e}", file=sys.stderr)
+
+
+enable_from_environment()
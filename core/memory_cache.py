@@ -0,0 +1,96 @@
+# AFWRename/core/memory_cache.py
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """
+    In-memory cache bounded by a byte budget rather than an entry count.
+
+    `sizeof` returns the cost of a value in bytes. When an insert pushes the
+    total over the budget, least recently used entries are dropped and their
+    keys are passed to `on_evict`, so the owner can arrange for them to be
+    fetched again when next needed.
+    """
+
+    def __init__(self, budget_bytes: int, sizeof: Callable[[Any], int], on_evict: Callable[[list], None] | None = None):
+        self.budget_bytes = budget_bytes
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= old[1]
+        size = self._sizeof(value)
+        self._entries[key] = (value, size)
+        self._total_bytes += size
+        if self._total_bytes > self.budget_bytes:
+            self._evict(keep=key)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._total_bytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self._total_bytes = 0
+
+    def set_budget(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        if self._total_bytes > budget_bytes:
+            self._evict()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, keep=None):
+        evicted = []
+        while self._total_bytes > self.budget_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                # Never evict the entry being inserted, even if it alone exceeds the budget.
+                break
+            _, size = self._entries.pop(key)
+            self._total_bytes -= size
+            evicted.append(key)
+        self.evictions += len(evicted)
+        if evicted and self._on_evict:
+            self._on_evict(evicted)
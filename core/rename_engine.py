@@ -0,0 +1,620 @@
+# AFWRename/core/rename_engine.py
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, NamedTuple
+
+from core import instrumentation
+from core.app_dirs import user_data_dir
+from core.folder_index import FolderIndex, build_folder_indexes, extract_id
+from core.scanner import TEMP_NAME_PREFIX, FileRecord, scan_folder
+from core.set_manager import set_sort_key
+
+if TYPE_CHECKING:
+    from core.content_match import ContentMatcher
+
+# Per-operation journal records are fsync'd in groups of this size. Recovery
+# does not depend on them: the state of every operation can be read back from
+# the filesystem, because temporary names are unique to the batch.
+JOURNAL_SYNC_INTERVAL = 256
+
+# Folders renamed at the same time. Each folder is worked through in plan
+# order by a single thread, so this only helps with several folders, which
+# typically sit on different disks or shares.
+DEFAULT_RENAME_WORKERS = 8
+
+# Journal record types.
+BEGIN = "begin"
+STAGED = "staged"
+COMMITTED = "committed"
+STAGE_COMPLETE = "stage_complete"
+END = "end"
+ROLLBACK_BEGIN = "rollback_begin"
+RESTORED = "restored"
+ROLLED_BACK = "rolled_back"
+UNDONE = "undone"
+
+# Per-operation states during execution and recovery.
+PENDING, STAGED_STATE, DONE = "pending", "staged", "done"
+
+
+class RenameConflictError(Exception):
+    """Raised when a plan cannot be applied without overwriting a file."""
+
+    def __init__(self, conflicts: list[str]):
+        self.conflicts = conflicts
+        super().__init__("Rename plan has conflicts:\n" + "\n".join(conflicts))
+
+
+class RenameBatchError(Exception):
+    """
+    Raised when renames failed in one or more folders. The batch is left
+    incomplete so that it can be resumed or rolled back from its journal.
+    """
+
+    def __init__(self, errors: list[str], journal_path: Path):
+        self.errors = errors
+        self.journal_path = journal_path
+        super().__init__(f"{len(errors)} folder(s) failed:\n" + "\n".join(errors))
+
+
+class RenameCancelledError(Exception):
+    """
+    Raised when a batch was cancelled. Cancellation takes effect between
+    renames, and the batch is left for the caller to roll back or resume.
+    """
+
+    def __init__(self, journal_path: Path):
+        self.journal_path = journal_path
+        super().__init__("Processing was cancelled.")
+
+
+# Called with the phase ("staging" or "committing", or "copying" for exports),
+# the number of files finished in that phase and the phase total. May be
+# called from worker threads.
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class RenameOp(NamedTuple):
+    folder: Path
+    src: Path
+    dst: Path
+
+
+class RenamePlan:
+    """
+    The complete set of renames for one processing run, worked out before any
+    file is touched. `conflicts` lists renames whose source is missing or that
+    would overwrite a file not itself being renamed away; a plan with conflicts
+    is never executed. `chained` counts renames whose target is another
+    rename's source, including cycles, which two-phase execution handles safely.
+    `content_matches` describes the counterparts found by picture rather than
+    by ID, which a user should confirm.
+    """
+
+    def __init__(self, ops: list[RenameOp], warnings: list[str] | None = None, content_matches: list[str] | None = None):
+        self.ops = ops
+        self.warnings = warnings or []
+        self.content_matches = content_matches or []
+        self.conflicts: list[str] = []
+        self.chained = 0
+        self._check()
+
+    def _check(self):
+        sources = {}
+        for op in self.ops:
+            key = os.path.normcase(op.src)
+            if key in sources:
+                # Two selected files share an ID and so the same counterpart.
+                self.conflicts.append(f"'{op.src.name}' would be renamed to both '{sources[key].name}' and '{op.dst.name}' in '{op.folder.name}'.")
+            sources[key] = op.dst
+        targets = {}
+        for op in self.ops:
+            key = os.path.normcase(op.dst)
+            if key in targets:
+                self.conflicts.append(f"'{targets[key].name}' and '{op.src.name}' would both be renamed to '{op.dst.name}' in '{op.folder.name}'.")
+                continue
+            targets[key] = op.src
+            if not op.src.exists():
+                self.conflicts.append(f"'{op.src.name}' no longer exists in '{op.folder.name}'.")
+            elif key in sources:
+                self.chained += 1
+            elif op.dst.exists():
+                self.conflicts.append(f"'{op.dst.name}' already exists in '{op.folder.name}'.")
+
+    def __len__(self):
+        return len(self.ops)
+
+
+def plan_renames(
+    sets: dict,
+    primary_folder: Path,
+    synced_folders: list[Path],
+    folder_indexes: dict[Path, FolderIndex] | None = None,
+    matcher: "ContentMatcher | None" = None,
+    records: dict[str, FileRecord] | None = None
+) -> RenamePlan:
+    """
+    Works out every rename for the given sets, using each file's unique ID to
+    find its counterparts in the synced folders, or its picture where that
+    fails and a matcher is given. Files that would keep their name are left
+    out of the plan. See set_targets() for `records`.
+    """
+    warnings = []
+    matches = []
+    with instrumentation.span("rename.plan"):
+        ops = [
+            op for op in set_targets(sets, primary_folder, synced_folders, folder_indexes, warnings, matcher, matches, records)
+            if op.dst != op.src
+        ]
+    return RenamePlan(ops, warnings, matches)
+
+
+def set_targets(
+    sets: dict,
+    primary_folder: Path,
+    synced_folders: list[Path],
+    folder_indexes: dict[Path, FolderIndex] | None = None,
+    warnings: list[str] | None = None,
+    matcher: "ContentMatcher | None" = None,
+    matches: list[str] | None = None,
+    records: dict[str, FileRecord] | None = None
+) -> list[RenameOp]:
+    """
+    Returns the new name of every file in the sets, in every folder, as
+    operations whose `dst` lies in the file's own folder. Files that cannot
+    be matched are left out and explained in `warnings`.
+
+    Files in the primary folder are renamed as given; only their
+    counterparts in the synced folders are found by ID. With a `matcher`,
+    files without an ID are still renamed in the primary folder, and
+    counterparts that cannot be found by ID are looked for by content. Every
+    match made that way is listed in `warnings`, and in `matches` if given,
+    for review.
+
+    `records` maps primary paths to their scan records, whose name, ID and
+    suffix are then used as they are; paths without one are parsed.
+    """
+    all_target_folders = [primary_folder] + synced_folders
+    # The primary folder's files are renamed as selected, so only the synced
+    # folders are looked up by ID. Indexes kept current by the caller are used
+    # as they are; the rest are built now.
+    if warnings is None:
+        warnings = []
+    folder_indexes = dict(folder_indexes or {})
+    folder_indexes.update(build_folder_indexes([f for f in synced_folders if f not in folder_indexes], warnings))
+
+    ops = []
+    set1_counter = 0
+    # Folder -> (primary file, new base name) still to be matched by content.
+    unmatched: dict[Path, list[tuple[Path, str]]] = {}
+
+    for set_name in sorted(sets, key=set_sort_key):
+        is_set1 = set_name.startswith("set1")
+
+        for i, primary_path_str in enumerate(sets[set_name]):
+            primary_path = Path(primary_path_str)
+            record = records.get(primary_path_str) if records else None
+            if record is not None:
+                name, image_id, suffix = record.name, record.image_id, record.suffix
+            else:
+                name, suffix = primary_path.name, primary_path.suffix
+                image_id = extract_id(name)
+            if image_id is None and synced_folders and matcher is None:
+                warnings.append(f"Could not find a unique ID in '{name}'. Skipping.")
+                continue
+
+            if is_set1:
+                set1_counter += 1
+                new_base_name = f"set1 ({set1_counter})"
+            else:
+                new_base_name = f"{set_name} ({i + 1})"
+
+            for folder in all_target_folders:
+                if folder == primary_folder:
+                    # The selected file itself, even if another file, such as
+                    # an earlier run's "set1 (3).jpg", shares its ID.
+                    ops.append(RenameOp(folder, primary_path, folder / f"{new_base_name}{suffix}"))
+                    continue
+                if image_id is None:
+                    unmatched.setdefault(folder, []).append((primary_path, new_base_name))
+                    continue
+                index = folder_indexes[folder]
+                file_to_rename = index.get(image_id)
+                if index.is_duplicate(image_id):
+                    warnings.append(f"ID '({image_id})' is not unique in '{folder.name}'. Skipping.")
+                elif file_to_rename is None and matcher is not None:
+                    unmatched.setdefault(folder, []).append((primary_path, new_base_name))
+                elif file_to_rename is None:
+                    warnings.append(f"No matching file for ID '({image_id})' found in '{folder.name}'.")
+                else:
+                    ops.append(RenameOp(folder, file_to_rename, folder / f"{new_base_name}{file_to_rename.suffix}"))
+
+    # A synced file whose ID is on a file in the primary folder is that file's
+    # counterpart, whether or not it is being renamed, so it is never matched by content.
+    primary_ids = None
+    for folder, wanted in unmatched.items():
+        if primary_ids is None:
+            primary_ids = {entry.image_id for entry in scan_folder(primary_folder, suffixes=None, stat=False, sort_keys=False)}
+            primary_ids.discard(None)
+        # Files already renamed by ID cannot also be the match for another file.
+        taken = {op.src for op in ops if op.folder == folder}
+        found = matcher.match([path for path, _ in wanted], folder, taken, primary_ids)
+        for path, new_base_name in wanted:
+            match = found.get(path)
+            if match is None:
+                warnings.append(f"No file in '{folder.name}' matches '{path.name}' by ID or by content.")
+            else:
+                message = f"Matched '{path.name}' to '{match.name}' in '{folder.name}' by content."
+                warnings.append(message)
+                if matches is not None:
+                    matches.append(message)
+                ops.append(RenameOp(folder, match, folder / f"{new_base_name}{match.suffix}"))
+    if matcher is not None:
+        warnings.extend(matcher.warnings)
+        matcher.warnings.clear()
+
+    return ops
+
+
+def journal_dir() -> Path:
+    return user_data_dir() / "journals"
+
+
+def _temp_path(op: RenameOp, batch_id: str, i: int) -> Path:
+    # Same folder as the target so that both renames stay on one filesystem.
+    return op.folder / f"{TEMP_NAME_PREFIX}{batch_id}-{i}{op.src.suffix}"
+
+
+def _fsync_dir(folder: Path):
+    """Makes renames in a folder durable. Not possible on every platform."""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class RenameJournal:
+    """
+    Append-only record of one rename batch. The first line holds the whole plan;
+    later lines record progress. Each phase boundary is fsync'd.
+    """
+
+    def __init__(self, path: Path, batch_id: str, ops: list[RenameOp], records: list[dict] | None = None):
+        self.path = path
+        self.batch_id = batch_id
+        self.ops = ops
+        self.records = records or []
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, ops: list[RenameOp], directory: Path | None = None, kind: str = "rename", undoes: str | None = None) -> "RenameJournal":
+        directory = directory or journal_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        batch_id = uuid.uuid4().hex[:12]
+        # A nanosecond timestamp prefix keeps journals in creation order when sorted by name.
+        path = directory / f"{time.time_ns()}-{batch_id}.jsonl"
+        journal = cls(path, batch_id, ops)
+        journal.append({
+            "type": BEGIN,
+            "batch": batch_id,
+            "kind": kind,
+            "undoes": undoes,
+            "time": time.time(),
+            "ops": [[str(op.folder), str(op.src), str(op.dst)] for op in ops],
+        }, sync=True)
+        return journal
+
+    @classmethod
+    def load(cls, path: Path) -> "RenameJournal":
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write; everything before it is intact.
+                    break
+        if not records or records[0].get("type") != BEGIN:
+            raise ValueError(f"'{path.name}' is not a rename journal.")
+        begin = records[0]
+        ops = [RenameOp(Path(folder), Path(src), Path(dst)) for folder, src, dst in begin["ops"]]
+        return cls(path, begin["batch"], ops, records)
+
+    @property
+    def kind(self) -> str:
+        return self.records[0].get("kind", "rename")
+
+    @property
+    def undoes(self) -> str | None:
+        return self.records[0].get("undoes")
+
+    def has(self, record_type: str) -> bool:
+        return any(r.get("type") == record_type for r in self.records)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.has(END) or self.has(ROLLED_BACK)
+
+    def temp_path(self, i: int) -> Path:
+        return _temp_path(self.ops[i], self.batch_id, i)
+
+    def append(self, record: dict, sync: bool = False):
+        """Appends a record. Safe to call from several threads."""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record) + "\n")
+            self.records.append(record)
+            self._unsynced += 1
+            if sync or self._unsynced >= JOURNAL_SYNC_INTERVAL:
+                self._sync()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._file is None:
+            return
+        with instrumentation.span("journal.fsync"):
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def probe_states(self) -> list[str]:
+        """
+        Reads each operation's state back from the filesystem. Until staging has
+        completed no file has reached its final name, so a missing temp file
+        means the rename has not started; afterwards it means it has finished.
+        """
+        stage_complete = self.has(STAGE_COMPLETE)
+        states = []
+        for i in range(len(self.ops)):
+            if self.temp_path(i).exists():
+                states.append(STAGED_STATE)
+            else:
+                states.append(DONE if stage_complete else PENDING)
+        return states
+
+
+def _group_by_folder(ops: list[RenameOp]) -> dict[Path, list[int]]:
+    groups = {}
+    for i, op in enumerate(ops):
+        groups.setdefault(op.folder, []).append(i)
+    return groups
+
+
+def _run_phase(journal: RenameJournal, groups, step, phase: str, max_workers: int, progress: ProgressCallback | None, cancel: threading.Event | None):
+    """
+    Runs `step(i)` for every operation index, one thread per folder group so
+    that each folder keeps its plan order. A failure stops only its own folder;
+    all failures are raised together once every folder has finished. Setting
+    `cancel` stops every folder before its next rename.
+    """
+    total = sum(len(indices) for indices in groups.values())
+    done = 0
+    done_lock = threading.Lock()
+    errors = []
+    stage = f"rename.{phase}"
+
+    def run_group(folder, indices):
+        nonlocal done
+        for i in indices:
+            if cancel is not None and cancel.is_set():
+                return
+            try:
+                with instrumentation.span(stage):
+                    step(i)
+            except OSError as e:
+                errors.append(f"{folder}: {e}")
+                return
+            if progress:
+                with done_lock:
+                    done += 1
+                    progress(phase, done, total)
+        _fsync_dir(folder)
+
+    if len(groups) <= 1 or max_workers <= 1:
+        for folder, indices in groups.items():
+            run_group(folder, indices)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(groups)), thread_name_prefix="rename") as executor:
+            futures = [executor.submit(run_group, folder, indices) for folder, indices in groups.items()]
+        for future in futures:
+            # Re-raise anything other than the OSErrors collected per folder.
+            future.result()
+
+    if errors:
+        journal.sync()
+        raise RenameBatchError(sorted(errors), journal.path)
+    if cancel is not None and cancel.is_set():
+        journal.sync()
+        raise RenameCancelledError(journal.path)
+
+
+def _run(
+    journal: RenameJournal,
+    states: list[str],
+    max_workers: int = DEFAULT_RENAME_WORKERS,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None
+):
+    """
+    Applies a batch from the given per-operation states: stage everything,
+    then commit everything. Folders are processed concurrently within a phase.
+    """
+    ops = journal.ops
+
+    def stage(i):
+        if states[i] == PENDING:
+            ops[i].src.rename(journal.temp_path(i))
+            states[i] = STAGED_STATE
+            journal.append({"type": STAGED, "i": i})
+
+    def commit(i):
+        if states[i] == STAGED_STATE:
+            journal.temp_path(i).rename(ops[i].dst)
+            states[i] = DONE
+            journal.append({"type": COMMITTED, "i": i})
+
+    groups = _group_by_folder(ops)
+    _run_phase(journal, groups, stage, "staging", max_workers, progress, cancel)
+    if not journal.has(STAGE_COMPLETE):
+        journal.append({"type": STAGE_COMPLETE}, sync=True)
+    _run_phase(journal, groups, commit, "committing", max_workers, progress, cancel)
+    journal.append({"type": END, "time": time.time()}, sync=True)
+
+
+def execute_plan(
+    plan: RenamePlan,
+    directory: Path | None = None,
+    max_workers: int = DEFAULT_RENAME_WORKERS,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None
+) -> RenameJournal:
+    """
+    Applies a plan as one journaled batch. Every file is first moved to a
+    temporary name unique to the batch and only then to its final name, so
+    chains and cycles cannot overwrite each other. If the process dies, the
+    batch can be finished with resume_batch() or reverted with rollback_batch().
+    Folders are renamed concurrently; failures are collected per folder and
+    raised together as RenameBatchError. Setting `cancel` stops the batch
+    between renames with RenameCancelledError.
+    """
+    if plan.conflicts:
+        raise RenameConflictError(plan.conflicts)
+    journal = RenameJournal.create(plan.ops, directory)
+    try:
+        _run(journal, [PENDING] * len(plan.ops), max_workers, progress, cancel)
+    finally:
+        journal.close()
+    return journal
+
+
+def resume_batch(journal_path: Path, max_workers: int = DEFAULT_RENAME_WORKERS, progress: ProgressCallback | None = None) -> RenameJournal:
+    """Finishes a batch that was interrupted part way through."""
+    journal = RenameJournal.load(journal_path)
+    if journal.is_complete:
+        return journal
+    if journal.has(ROLLBACK_BEGIN):
+        return rollback_batch(journal_path)
+    try:
+        _run(journal, journal.probe_states(), max_workers, progress)
+    finally:
+        journal.close()
+    return journal
+
+
+def rollback_batch(journal_path: Path) -> RenameJournal:
+    """
+    Returns every file of an interrupted batch to its original name. Files are
+    moved back through their temporary names, again in two phases.
+    """
+    journal = RenameJournal.load(journal_path)
+    if journal.is_complete:
+        return journal
+    try:
+        states = journal.probe_states()
+        # Restored files are back at names that other operations may target, so
+        # they cannot be told apart by probing; their records are fsync'd instead.
+        for record in journal.records:
+            if record.get("type") == RESTORED:
+                states[record["i"]] = PENDING
+        if not journal.has(ROLLBACK_BEGIN):
+            journal.append({"type": ROLLBACK_BEGIN}, sync=True)
+        for i, op in enumerate(journal.ops):
+            if states[i] == DONE and op.dst.exists():
+                op.dst.rename(journal.temp_path(i))
+                states[i] = STAGED_STATE
+        for i, op in enumerate(journal.ops):
+            if states[i] == STAGED_STATE:
+                journal.temp_path(i).rename(op.src)
+                states[i] = PENDING
+                journal.append({"type": RESTORED, "i": i}, sync=True)
+        for folder in {op.folder for op in journal.ops}:
+            _fsync_dir(folder)
+        journal.append({"type": ROLLED_BACK, "time": time.time()}, sync=True)
+    finally:
+        journal.close()
+    return journal
+
+
+def list_journals(directory: Path | None = None) -> list[Path]:
+    """Returns all journal files, oldest first."""
+    directory = directory or journal_dir()
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob("*.jsonl"))
+
+
+def find_incomplete_batches(directory: Path | None = None) -> list[Path]:
+    """Returns journals of batches that neither finished nor were rolled back."""
+    incomplete = []
+    for path in list_journals(directory):
+        try:
+            if not RenameJournal.load(path).is_complete:
+                incomplete.append(path)
+        except (OSError, ValueError):
+            continue
+    return incomplete
+
+
+def last_undoable_batch(directory: Path | None = None) -> Path | None:
+    """Returns the most recent finished batch that has not been undone yet."""
+    journals = []
+    undone = set()
+    for path in list_journals(directory):
+        try:
+            journal = RenameJournal.load(path)
+        except (OSError, ValueError):
+            continue
+        journals.append((path, journal))
+        if journal.has(UNDONE):
+            undone.add(journal.batch_id)
+        if journal.undoes and journal.has(END):
+            undone.add(journal.undoes)
+    for path, journal in reversed(journals):
+        if journal.has(END) and journal.kind == "rename" and journal.batch_id not in undone:
+            return path
+    return None
+
+
+def undo_batch(journal_path: Path, directory: Path | None = None, progress: ProgressCallback | None = None) -> RenameJournal:
+    """
+    Reverts a finished batch by applying the inverse renames as a new journaled
+    batch, so the undo is itself crash-safe and can be resumed.
+    """
+    original = RenameJournal.load(journal_path)
+    if not original.has(END):
+        raise ValueError("Only a finished batch can be undone; resume or roll it back instead.")
+    inverse = RenamePlan([RenameOp(op.folder, op.dst, op.src) for op in reversed(original.ops)])
+    if inverse.conflicts:
+        raise RenameConflictError(inverse.conflicts)
+    journal = RenameJournal.create(inverse.ops, directory or journal_path.parent, kind="undo", undoes=original.batch_id)
+    try:
+        _run(journal, [PENDING] * len(inverse.ops), progress=progress)
+    finally:
+        journal.close()
+    original.append({"type": UNDONE, "by": journal.batch_id}, sync=True)
+    original.close()
+    return journal
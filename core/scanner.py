@@ -0,0 +1,163 @@
+# AFWRename/core/scanner.py
+
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+# This regex finds a number in parentheses, e.g., "(247)", to use as a unique ID.
+ID_PATTERN = re.compile(r'\((\d+)\)\.[a-zA-Z]+$')
+
+# File types shown in the grid.
+SUPPORTED_SUFFIXES = frozenset({".png", ".jpg", ".jpeg", ".webp", ".pdf"})
+
+# Files renamed or copied by the application pass through names with this
+# prefix. They are not listed, since they disappear once the batch finishes.
+TEMP_NAME_PREFIX = ".afw-"
+
+# Entries per batch when streaming a listing to the GUI.
+SCAN_BATCH_SIZE = 512
+
+_NUMBERS = re.compile(r'(\d+)')
+
+
+def natural_sort_key(name: str) -> str:
+    """
+    Returns a string that sorts names case-insensitively and with numbers by
+    value, so "img (2).jpg" comes before "img (10).jpg". One string per name
+    keeps the key as cheap to store and compare as the name itself. Names
+    that differ only in case or leading zeros share a key; callers that need
+    a strict order break ties by path, rather than every key holding the
+    name again.
+    """
+    parts = _NUMBERS.split(name.casefold())
+    for i in range(1, len(parts), 2):
+        digits = parts[i].lstrip("0") or "0"
+        # The length first, so that shorter numbers sort before longer ones.
+        parts[i] = chr(len(digits)) + digits
+    return "".join(parts)
+
+
+class FileRecord:
+    """
+    One file found by a scan, with everything later steps need from its name
+    worked out once. Records are shared by the grid, the thumbnail loader and
+    the folder indexes; the path string itself is what sets and sessions
+    refer to.
+    """
+
+    __slots__ = ("path", "name", "suffix", "image_id", "size", "mtime_ns", "sort_key")
+
+    def __init__(self, path: str, name: str, suffix: str, image_id: str | None, size: int, mtime_ns: int, sort_key: str | None):
+        self.path = path
+        self.name = name
+        self.suffix = suffix
+        self.image_id = image_id
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # natural_sort_key(name), or None if the scan was not asked for it.
+        self.sort_key = sort_key
+
+    def __repr__(self):
+        return f"FileRecord({self.path!r}, size={self.size}, mtime_ns={self.mtime_ns})"
+
+
+class ScanDiff(NamedTuple):
+    added: list[FileRecord]
+    removed: list[str]
+    # Files whose size or modification time differs from what was known.
+    changed: list[FileRecord]
+
+
+def extract_id(name: str) -> str | None:
+    """Returns the unique ID found in a filename, or None if there is none."""
+    match = ID_PATTERN.search(name)
+    return match.group(1) if match else None
+
+
+def _suffix(name: str) -> str:
+    # os.path.splitext(name)[1] at a quarter of the cost. Only names made of
+    # leading dots and an extension, like "..jpg", differ; they get the
+    # extension, as Path.suffix gives them.
+    dot = name.rfind(".")
+    return name[dot:] if dot > 0 else ""
+
+
+def is_supported_name(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in SUPPORTED_SUFFIXES
+
+
+def scan_folder(
+    folder: Path, suffixes: frozenset[str] | None = SUPPORTED_SUFFIXES, stat: bool = True, sort_keys: bool = True
+) -> Iterator[FileRecord]:
+    """
+    Yields the regular files in a folder, in directory order, as FileRecords
+    with their size, modification time, unique ID and sort key, in a single
+    pass.
+
+    Names are filtered by suffix before anything else is looked at. The file
+    type comes from the directory listing itself where the platform provides
+    it, and on Windows so do size and mtime, so most entries cost no extra
+    system call; elsewhere `stat=False` skips the one stat per file and leaves
+    size and mtime at 0. Scans that only look files up by ID can skip the
+    sort keys too. Entries that vanish or cannot be read, and the
+    application's own temporary files, are skipped.
+    """
+    with os.scandir(folder) as it:
+        for entry in it:
+            name = entry.name
+            if name.startswith(TEMP_NAME_PREFIX):
+                continue
+            # Interned, as a folder has only a few distinct suffixes.
+            suffix = sys.intern(_suffix(name))
+            if suffixes is not None and suffix.lower() not in suffixes:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                if stat:
+                    st = entry.stat()
+                    size, mtime_ns = st.st_size, st.st_mtime_ns
+                else:
+                    size = mtime_ns = 0
+            except OSError:
+                continue
+            yield FileRecord(
+                entry.path, name, suffix, extract_id(name), size, mtime_ns, natural_sort_key(name) if sort_keys else None
+            )
+
+
+def diff_scan(known: dict[str, FileRecord], entries: list[FileRecord]) -> ScanDiff:
+    """Compares a fresh scan with the records last seen for each path."""
+    added = []
+    changed = []
+    seen = set()
+    for entry in entries:
+        seen.add(entry.path)
+        previous = known.get(entry.path)
+        if previous is None:
+            added.append(entry)
+        elif previous.size != entry.size or previous.mtime_ns != entry.mtime_ns:
+            changed.append(entry)
+    removed = [path for path in known if path not in seen]
+    return ScanDiff(added, removed, changed)
+
+
+def scan_batches(folder: Path, batch_size: int = SCAN_BATCH_SIZE, max_delay: float | None = None, **kwargs) -> Iterator[list[FileRecord]]:
+    """
+    Groups scan_folder() into lists so they can be handed to another thread
+    cheaply. With `max_delay`, a partial batch is also handed over once that
+    many seconds have passed, so slow network folders still show files early.
+    """
+    batch = []
+    started = time.monotonic()
+    for entry in scan_folder(folder, **kwargs):
+        batch.append(entry)
+        if len(batch) >= batch_size or (max_delay is not None and time.monotonic() - started >= max_delay):
+            yield batch
+            batch = []
+            started = time.monotonic()
+    if batch:
+        yield batch
@@ -0,0 +1,200 @@
+# AFWRename/core/session.py
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+from core.app_dirs import user_data_dir
+from core.set_manager import SetManager
+
+SESSION_VERSION = 1
+
+# Record types.
+HEADER = "session"
+ADD = "add"
+UNDO = "undo"
+RESET = "reset"
+SYNCED = "synced"
+REMOVE = "remove"
+
+
+class RestoredSession(NamedTuple):
+    # (set size, primary folder paths, set name) in assignment order. The
+    # name is None in logs written before names were recorded.
+    groups: list[tuple[int, list[str], str | None]]
+    synced_folders: list[Path]
+    # Files the session refers to that are no longer in the primary folder.
+    missing: list[str]
+
+
+def sessions_dir() -> Path:
+    return user_data_dir() / "sessions"
+
+
+def session_path(primary_folder: Path, directory: Path | None = None) -> Path:
+    """Each primary folder has its own session file, named after a hash of its path."""
+    key = hashlib.sha1(os.path.normcase(str(primary_folder.resolve())).encode("utf-8")).hexdigest()[:16]
+    return (directory or sessions_dir()) / f"{key}.jsonl"
+
+
+class SessionLog:
+    """
+    Append-only record of the set assignments made for one primary folder, so
+    that work survives closing the folder or a crash. Every assignment, undo
+    and reset is one short line; the log is replayed on load and rewritten
+    with only the surviving assignments when it is reopened.
+
+    File names are stored relative to the primary folder. Write failures are
+    reported once and turn the log off rather than interrupting the user.
+    """
+
+    def __init__(self, primary_folder: Path, directory: Path | None = None):
+        self.primary_folder = primary_folder
+        self.path = session_path(primary_folder, directory)
+        self._file = None
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def load(self, valid_paths) -> RestoredSession | None:
+        """
+        Replays the log. Assignments referring to files that are not among
+        `valid_paths` are dropped: set1 keeps its remaining files, while a set
+        of 2 or 3 is dropped as a whole. Returns None if there is nothing to
+        load, and raises OSError if the log exists but cannot be read.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-write; everything before it is intact.
+                break
+        if not records or records[0].get("type") != HEADER or records[0].get("primary") != str(self.primary_folder):
+            return None
+
+        history = []
+        synced = records[0].get("synced", [])
+        for record in records[1:]:
+            record_type = record.get("type")
+            if record_type == ADD:
+                history.append((record["set"], record["files"], record.get("name")))
+            elif record_type == UNDO and history:
+                history.pop()
+            elif record_type == RESET:
+                history.clear()
+            elif record_type == SYNCED:
+                synced = record["folders"]
+            elif record_type == REMOVE:
+                history = _remove_files(history, set(record["files"]))
+
+        groups = []
+        missing = []
+        for set_size, names, set_name in history:
+            paths = [str(self.primary_folder / name) for name in names]
+            present = [p for p in paths if p in valid_paths]
+            missing.extend(p for p in paths if p not in valid_paths)
+            if present and (set_size == 1 or len(present) == set_size):
+                groups.append((set_size, present, set_name))
+        synced_folders = [Path(folder) for folder in synced if Path(folder).is_dir()]
+        return RestoredSession(groups, synced_folders, missing)
+
+    def start(self, restored: RestoredSession | None = None):
+        """
+        Begins logging, writing the restored assignments (if any) as the new
+        starting point. The file is replaced atomically so a crash here keeps
+        the previous log.
+        """
+        self.close()
+        records = [{"type": HEADER, "version": SESSION_VERSION, "primary": str(self.primary_folder), "synced": []}]
+        if restored:
+            records[0]["synced"] = [str(folder) for folder in restored.synced_folders]
+            records += [self._add_record(set_size, paths, set_name) for set_size, paths, set_name in restored.groups]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+        except OSError as e:
+            print(f"Warning: Session will not be saved: {e}")
+            self._file = None
+
+    def record_add(self, set_size: int, image_paths: list[str], set_name: str | None = None):
+        self._append(self._add_record(set_size, image_paths, set_name))
+
+    def record_undo(self):
+        self._append({"type": UNDO})
+
+    def record_reset(self):
+        self._append({"type": RESET})
+
+    def record_remove(self, paths: list[str]):
+        """Records files deleted from the folder, which also leave their sets."""
+        self._append({"type": REMOVE, "files": [Path(p).name for p in paths]})
+
+    def record_synced(self, folders: list[Path]):
+        self._append({"type": SYNCED, "folders": [str(folder) for folder in folders]})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Stops logging and deletes the session, e.g. once its sets were processed."""
+        self.close()
+        try:
+            self.path.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Warning: Could not delete session file: {e}")
+
+    @staticmethod
+    def _add_record(set_size: int, image_paths: list[str], set_name: str | None = None) -> dict:
+        record = {"type": ADD, "set": set_size, "files": [Path(p).name for p in image_paths]}
+        if set_name is not None:
+            # Sets keep their numbers when an earlier one was dissolved; see SetManager.remove_paths.
+            record["name"] = set_name
+        return record
+
+    def _append(self, record: dict):
+        if not self._file:
+            return
+        try:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            print(f"Warning: Session will not be saved: {e}")
+            self.close()
+
+
+def _remove_files(history: list, names: set[str]) -> list:
+    # Mirrors SetManager.remove_paths: set1 keeps its other files, larger sets are dissolved.
+    kept = []
+    for set_size, files, set_name in history:
+        if names.isdisjoint(files):
+            kept.append((set_size, files, set_name))
+        elif set_size == 1:
+            remaining = [name for name in files if name not in names]
+            if remaining:
+                kept.append((set_size, remaining, set_name))
+    return kept
+
+
+def restore_sets(set_manager: SetManager, restored: RestoredSession):
+    """Rebuilds a SetManager's sets and history, under their saved names, from a restored session."""
+    set_manager.reset()
+    for set_size, paths, set_name in restored.groups:
+        set_manager.add_set(set_size, paths, set_name)
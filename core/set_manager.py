@@ -1,41 +1,104 @@
 # AFWRename/core/set_manager.py
 
+import re
+from bisect import bisect_left, insort
 from collections import deque
+from typing import Callable, NamedTuple
+
+from core.scanner import FileRecord
+
+_SET_NAME = re.compile(r'set(\d+)(?:-no(\d+))?$')
+
+
+def set_sort_key(set_name: str) -> tuple:
+    """Orders set names by size and then number, so that set2-no2 comes before set2-no10."""
+    match = _SET_NAME.match(set_name)
+    if match is None:
+        return (float("inf"), 0, set_name)
+    return (int(match.group(1)), int(match.group(2) or 0), "")
+
+
+class SetChange(NamedTuple):
+    # "added", "updated", "removed", or "reset" once all sets are cleared.
+    kind: str
+    set_name: str
+    # Position of the set among all sets in set_sort_key() order; for
+    # "removed", the position it had.
+    position: int
+    # Number of files now in the set.
+    size: int
+
 
 class SetManager:
-    """Manages the logic of creating and handling image sets."""
+    """
+    Manages the logic of creating and handling image sets.
 
-    def __init__(self):
-        self.sets = {}
+    Besides the sets themselves it keeps a map from each assigned path to its
+    set, and the set names in display order, so lookups and undo cost time in
+    the size of the change rather than in the number of assigned files.
+    Listeners added with subscribe() are told about every set that changes.
+
+    `records` is the scan record of every file in the primary folder, shared
+    with whoever keeps the listing current; sets still refer to files by path.
+    """
+
+    def __init__(self, records: dict[str, FileRecord] | None = None):
+        self.records = records if records is not None else {}
+        self.sets: dict[str, list[str]] = {}
         self.history = deque()
         self._counters = {'set1': 0, 'set2': 0, 'set3': 0}
+        self._membership: dict[str, str] = {}
+        self._order: list[tuple] = []
+        self._listeners: list[Callable[[SetChange], None]] = []
 
-    def add_set(self, set_size: int, image_paths: list[str]):
+    def subscribe(self, listener: Callable[[SetChange], None]):
+        self._listeners.append(listener)
+
+    def add_set(self, set_size: int, image_paths: list[str], set_name: str | None = None):
         """
         Adds a new set of images.
 
         Args:
             set_size (int): The number of images in this set type (1, 2, or 3).
             image_paths (list[str]): The list of image file paths from the primary folder.
+            set_name (str | None): For sets of 2 or 3, the name the set had
+                before, e.g. in a saved session; by default the next number.
+
+        Returns the set's name, or None if the set is not valid, including
+        when one of the paths is already in a set or the name is taken.
         """
         if not image_paths:
             return None
-        
+
         # For sets of 2 or 3, we must have the exact number of images.
         if set_size > 1 and len(image_paths) != set_size:
             return None
+        if len(set(image_paths)) != len(image_paths) or any(p in self._membership for p in image_paths):
+            return None
 
         key_prefix = f"set{set_size}"
         if set_size > 1:
-            self._counters[key_prefix] += 1
-            set_name = f"{key_prefix}-no{self._counters[key_prefix]}"
-            self.sets[set_name] = image_paths
+            if set_name is None:
+                self._counters[key_prefix] += 1
+                set_name = f"{key_prefix}-no{self._counters[key_prefix]}"
+            else:
+                size, number, _ = set_sort_key(set_name)
+                if size != set_size or not number or set_name in self.sets:
+                    return None
+                self._counters[key_prefix] = max(self._counters[key_prefix], number)
+            self.sets[set_name] = list(image_paths)
+            self._insert_name(set_name)
         else: # set1 case
             # For set1, we can add multiple images/groups to the same set name.
             set_name = key_prefix
             if set_name not in self.sets:
-                self.sets[set_name] = []
-            self.sets[set_name].extend(image_paths)
+                self.sets[set_name] = list(image_paths)
+                self._insert_name(set_name)
+            else:
+                self.sets[set_name].extend(image_paths)
+                self._notify("updated", set_name)
+        for path in image_paths:
+            self._membership[path] = set_name
 
         history_entry = (set_name, image_paths)
         self.history.append(history_entry)
@@ -47,27 +110,117 @@ class SetManager:
             return None
 
         last_set_name, last_images = self.history.pop()
+        for path in last_images:
+            del self._membership[path]
 
         if "no" in last_set_name:
             prefix = last_set_name.split('-')[0]
             self._counters[prefix] -= 1
             del self.sets[last_set_name]
+            self._remove_name(last_set_name)
         else: # set1 case
-            # Remove only the specific images that were last added
-            self.sets[last_set_name] = [
-                img for img in self.sets[last_set_name] if img not in last_images
-            ]
-            if not self.sets[last_set_name]:
+            images = self.sets[last_set_name]
+            # The last batch is always the tail of set1, since removals keep the order.
+            del images[len(images) - len(last_images):]
+            if images:
+                self._notify("updated", last_set_name)
+            else:
                 del self.sets[last_set_name]
-        
+                self._remove_name(last_set_name)
+
         return last_images
 
+    def remove_paths(self, paths) -> list[str]:
+        """
+        Takes files that no longer exist out of their sets. set1 keeps its other
+        files; a set of 2 or 3 cannot stay incomplete, so it is dissolved and its
+        remaining files are returned to be shown as unassigned again.
+        """
+        paths = {path for path in paths if path in self._membership}
+        if not paths:
+            return []
+        affected = {self._membership.pop(path) for path in paths}
+        released = []
+        kept_history = deque()
+        for set_name, images in self.history:
+            if set_name not in affected or paths.isdisjoint(images):
+                kept_history.append((set_name, images))
+                continue
+            remaining = [img for img in images if img not in paths]
+            if "no" in set_name:
+                released.extend(remaining)
+                continue
+            if remaining:
+                kept_history.append((set_name, remaining))
+        self.history = kept_history
+
+        for path in released:
+            del self._membership[path]
+        for set_name in sorted(affected, key=set_sort_key):
+            if "no" in set_name:
+                del self.sets[set_name]
+                self._remove_name(set_name)
+                continue
+            self.sets[set_name] = [img for img in self.sets[set_name] if img not in paths]
+            if self.sets[set_name]:
+                self._notify("updated", set_name)
+            else:
+                del self.sets[set_name]
+                self._remove_name(set_name)
+        return released
+
     def get_all_sets(self):
         """Returns the dictionary of all current sets."""
         return self.sets
 
+    def set_names(self) -> list[str]:
+        """Returns the names of all sets in set_sort_key() order."""
+        return [self._name_of(key) for key in self._order]
+
+    def set_of(self, path: str) -> str | None:
+        """Returns the name of the set a path is in, or None."""
+        return self._membership.get(path)
+
+    def is_assigned(self, path: str) -> bool:
+        return path in self._membership
+
+    def assigned_records(self) -> dict[str, FileRecord]:
+        """Returns the scan record of every file in a set that has one, by path."""
+        records = self.records
+        return {path: records[path] for path in self._membership if path in records}
+
     def reset(self):
         """Clears all sets and resets counters."""
         self.sets.clear()
         self.history.clear()
-        self._counters = {'set1': 0, 'set2': 0, 'set3': 0}
\ No newline at end of file
+        self._counters = {'set1': 0, 'set2': 0, 'set3': 0}
+        self._membership.clear()
+        self._order.clear()
+        for listener in self._listeners:
+            listener(SetChange("reset", "", 0, 0))
+
+    def _insert_name(self, set_name: str):
+        insort(self._order, set_sort_key(set_name))
+        self._notify("added", set_name)
+
+    def _remove_name(self, set_name: str):
+        key = set_sort_key(set_name)
+        position = bisect_left(self._order, key)
+        del self._order[position]
+        for listener in self._listeners:
+            listener(SetChange("removed", set_name, position, 0))
+
+    def _notify(self, kind: str, set_name: str):
+        if not self._listeners:
+            return
+        change = SetChange(kind, set_name, bisect_left(self._order, set_sort_key(set_name)), len(self.sets[set_name]))
+        for listener in self._listeners:
+            listener(change)
+
+    @staticmethod
+    def _name_of(key: tuple) -> str:
+        size, number, name = key
+        if name:
+            # A name set_sort_key() could not parse keeps it whole.
+            return name
+        return f"set{size}-no{number}" if number else f"set{size}"
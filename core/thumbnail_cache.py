@@ -0,0 +1,211 @@
+# AFWRename/core/thumbnail_cache.py
+
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from core.app_dirs import user_cache_dir
+from core.thumbnailer import Thumbnail
+
+# Default on-disk budget for cached thumbnails, in bytes.
+DEFAULT_BUDGET_BYTES = 1024 * 1024 * 1024
+
+# Most perceptual hashes kept. Each row takes about 100 bytes on disk.
+MAX_HASHES = 1_000_000
+
+# When the budget is exceeded, evict down to this fraction of it so that
+# eviction does not run again on the very next insert. The same applies
+# to MAX_HASHES.
+EVICT_TO_FRACTION = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnails (
+    path TEXT NOT NULL,
+    thumb_w INTEGER NOT NULL,
+    thumb_h INTEGER NOT NULL,
+    file_size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    stride INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    data BLOB NOT NULL,
+    nbytes INTEGER NOT NULL,
+    last_access INTEGER NOT NULL,
+    PRIMARY KEY (path, thumb_w, thumb_h)
+);
+CREATE INDEX IF NOT EXISTS thumbnails_lru ON thumbnails (last_access);
+CREATE TABLE IF NOT EXISTS phashes (
+    path TEXT PRIMARY KEY,
+    file_size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    last_access INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phashes_lru ON phashes (last_access);
+"""
+
+
+class ThumbnailCache:
+    """
+    Persistent thumbnail store backed by a single SQLite file.
+
+    Entries are keyed on path and thumbnail size, and are only returned while the
+    source file's size and mtime still match. Pixel data is zlib-compressed, and
+    the least recently used entries are evicted once the total exceeds the budget.
+    Perceptual hashes are kept alongside, per path. They do not count towards
+    the budget; the least recently used are evicted beyond `max_hashes`
+    instead, so that files renamed or deleted since do not stay forever.
+    The cache is safe to share between threads.
+    """
+
+    def __init__(self, db_path: Path | None = None, budget_bytes: int = DEFAULT_BUDGET_BYTES, max_hashes: int = MAX_HASHES):
+        if db_path is None:
+            db_path = user_cache_dir() / "thumbnails.sqlite3"
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.budget_bytes = budget_bytes
+        self.max_hashes = max_hashes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(phashes)")]
+        if columns and "last_access" not in columns:
+            # Written before hashes were evicted; they are only a cache, so they are dropped.
+            self._conn.execute("DROP TABLE phashes")
+        self._conn.executescript(_SCHEMA)
+        # Summing the sizes reads the whole file, so it is left until first needed.
+        self._total_bytes: int | None = None
+        self._grown = False
+        self._touched = []
+        self._hashes_grown = False
+        self._touched_hashes = []
+
+    def get(self, path_str: str, file_size: int, mtime_ns: int, size: tuple[int, int]) -> Thumbnail | None:
+        """Returns the cached thumbnail, or None if it is missing or stale."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_size, mtime_ns, width, height, stride, mode, data FROM thumbnails "
+                "WHERE path = ? AND thumb_w = ? AND thumb_h = ?",
+                (path_str, size[0], size[1]),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != file_size or row[1] != mtime_ns:
+                self._delete(path_str, size)
+                return None
+            # Access times are written back in bulk by flush().
+            self._touched.append((time.time_ns(), path_str, size[0], size[1]))
+        _, _, width, height, stride, mode, data = row
+        return Thumbnail(width, height, stride, mode, zlib.decompress(data))
+
+    def put(self, path_str: str, file_size: int, mtime_ns: int, size: tuple[int, int], thumb: Thumbnail):
+        """Stores a thumbnail, replacing any older entry for the same path and size."""
+        data = zlib.compress(thumb.data, 1)
+        with self._lock:
+            self._delete(path_str, size)
+            self._conn.execute(
+                "INSERT INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path_str, size[0], size[1], file_size, mtime_ns, thumb.width, thumb.height,
+                 thumb.stride, thumb.mode, data, len(data), time.time_ns()),
+            )
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+            self._grown = True
+
+    def get_hash(self, path_str: str, file_size: int, mtime_ns: int) -> int | None:
+        """Returns the perceptual hash stored for a file, or None if it is missing or stale."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash FROM phashes WHERE path = ? AND file_size = ? AND mtime_ns = ?",
+                (path_str, file_size, mtime_ns),
+            ).fetchone()
+            if row:
+                self._touched_hashes.append((time.time_ns(), path_str))
+        # SQLite integers are signed.
+        return row[0] & 0xFFFFFFFFFFFFFFFF if row else None
+
+    def put_hash(self, path_str: str, file_size: int, mtime_ns: int, value: int):
+        signed = value - (1 << 64) if value >= 1 << 63 else value
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO phashes VALUES (?, ?, ?, ?, ?)",
+                (path_str, file_size, mtime_ns, signed, time.time_ns()),
+            )
+            self._hashes_grown = True
+
+    def flush(self):
+        """Commits pending writes and evicts entries beyond the budget."""
+        with self._lock:
+            if self._touched:
+                self._conn.executemany(
+                    "UPDATE thumbnails SET last_access = ? WHERE path = ? AND thumb_w = ? AND thumb_h = ?",
+                    self._touched,
+                )
+                self._touched.clear()
+            if self._touched_hashes:
+                self._conn.executemany("UPDATE phashes SET last_access = ? WHERE path = ?", self._touched_hashes)
+                self._touched_hashes.clear()
+            # Only writes can take the cache over budget.
+            if self._grown and self._measured_total() > self.budget_bytes:
+                self._evict(int(self.budget_bytes * EVICT_TO_FRACTION))
+            if self._hashes_grown:
+                self._evict_hashes()
+            self._grown = self._hashes_grown = False
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM thumbnails")
+            self._conn.execute("DELETE FROM phashes")
+            self._conn.commit()
+            self._total_bytes = 0
+            self._touched.clear()
+            self._touched_hashes.clear()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._measured_total()
+
+    def _measured_total(self) -> int:
+        if self._total_bytes is None:
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM thumbnails").fetchone()[0]
+        return self._total_bytes
+
+    def _delete(self, path_str, size):
+        key = (path_str, size[0], size[1])
+        row = self._conn.execute(
+            "SELECT nbytes FROM thumbnails WHERE path = ? AND thumb_w = ? AND thumb_h = ?", key
+        ).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM thumbnails WHERE path = ? AND thumb_w = ? AND thumb_h = ?", key)
+            if self._total_bytes is not None:
+                self._total_bytes -= row[0]
+
+    def _evict(self, target_bytes):
+        rows = self._conn.execute("SELECT rowid, nbytes FROM thumbnails ORDER BY last_access").fetchall()
+        victims = []
+        for rowid, nbytes in rows:
+            if self._total_bytes <= target_bytes:
+                break
+            victims.append((rowid,))
+            self._total_bytes -= nbytes
+        self._conn.executemany("DELETE FROM thumbnails WHERE rowid = ?", victims)
+
+    def _evict_hashes(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM phashes").fetchone()[0]
+        if count <= self.max_hashes:
+            return
+        excess = count - int(self.max_hashes * EVICT_TO_FRACTION)
+        self._conn.execute(
+            "DELETE FROM phashes WHERE rowid IN (SELECT rowid FROM phashes ORDER BY last_access LIMIT ?)", (excess,)
+        )
@@ -0,0 +1,204 @@
+# AFWRename/core/thumbnailer.py
+
+import io
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from core import instrumentation
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+THUMBNAIL_SIZE = (256, 256)
+
+# EXIF tags in IFD1 locating the embedded JPEG preview.
+_EXIF_THUMB_OFFSET = 0x0201
+_EXIF_THUMB_LENGTH = 0x0202
+
+# Number of decode workers used when none is configured explicitly.
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+# Number of worker processes used when none is configured explicitly. Each is
+# a whole interpreter with its own memory limit, so large machines do not get
+# one per CPU.
+DEFAULT_PROCESS_WORKERS = min(DEFAULT_WORKERS, 6)
+
+# Largest image, in pixels after any reduction on decode, that is decoded
+# when a limit is asked for. About 600 MB as RGB.
+MAX_DECODE_PIXELS = 200_000_000
+
+
+class DecodeLimitError(Exception):
+    """A file needs more time or memory to decode than it is allowed."""
+
+
+class Thumbnail:
+    """
+    Raw pixel data for one thumbnail, independent of any GUI toolkit, and the
+    perceptual hash of the image when it was just decoded.
+    """
+
+    __slots__ = ("width", "height", "stride", "mode", "data", "phash")
+
+    def __init__(self, width: int, height: int, stride: int, mode: str, data: bytes, phash: int | None = None):
+        self.width = width
+        self.height = height
+        self.stride = stride
+        self.mode = mode  # "RGB" or "RGBA"
+        self.data = data
+        self.phash = phash
+
+
+# Pillow and PyMuPDF take a large share of startup time, so they are imported
+# on first use, or ahead of it by warm_up().
+def _pillow():
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = None
+    return Image
+
+
+def warm_up():
+    """Imports the imaging and PDF libraries, e.g. on a background thread before the first thumbnail."""
+    with instrumentation.span("startup.warm_up"):
+        _pillow()
+        import fitz  # noqa: F401
+
+
+def make_thumbnail(
+    path_str: str, size: tuple[int, int] = THUMBNAIL_SIZE, fast: bool = True, max_pixels: int | None = None
+) -> Thumbnail | None:
+    """
+    Decodes an image or the first page of a PDF and returns its thumbnail.
+    Kept at module level so it can be shipped to a process pool.
+
+    In fast mode JPEGs are taken from a large enough embedded EXIF preview or
+    DCT-scaled by the decoder straight to the target size, and PDF pages are
+    rendered directly at thumbnail resolution instead of at 72 dpi.
+
+    Raises DecodeLimitError, before decoding, if the image or page would
+    still have more than `max_pixels` pixels once reduced.
+    """
+    path = Path(path_str)
+    if path.suffix.lower() == ".pdf":
+        with instrumentation.span("decode.pdf"):
+            return _pdf_thumbnail(path, size, fast, max_pixels)
+
+    Image = _pillow()
+    with Image.open(path) as img:
+        with instrumentation.span("decode"):
+            reducing_gap = 2.0
+            if fast and img.format == "JPEG":
+                preview = _exif_preview(img, size)
+                if preview is not None:
+                    img = preview
+                else:
+                    # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, never below the target size.
+                    img.draft(None, size)
+                reducing_gap = None
+            else:
+                # The draft thumbnail() itself would request, made before load() is timed.
+                img.draft(None, (int(size[0] * reducing_gap), int(size[1] * reducing_gap)))
+            _check_pixels(img.width, img.height, max_pixels)
+            img.load()
+        with instrumentation.span("resize"):
+            img.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+            # Opaque images stay RGB, a quarter less data to pack, cache and convert.
+            mode = "RGBA" if img.has_transparency_data else "RGB"
+            if img.mode != mode:
+                img = img.convert(mode)
+        with instrumentation.span("phash"):
+            phash = perceptual_hash(img)
+        return Thumbnail(img.width, img.height, img.width * len(mode), mode, img.tobytes(), phash)
+
+
+def _pdf_thumbnail(path: Path, size: tuple[int, int], fast: bool, max_pixels: int | None = None) -> Thumbnail | None:
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        if len(doc) == 0:
+            return None
+        page = doc.load_page(0)  # type: ignore[attr-defined]
+        rect = page.rect
+        if fast:
+            zoom = min(size[0] / rect.width, size[1] / rect.height)
+            fitz_pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=rect, alpha=False)
+        else:
+            _check_pixels(int(rect.width), int(rect.height), max_pixels)
+            fitz_pix = page.get_pixmap()
+        # `samples` is the one copy out of MuPDF's buffer; a view of it could not
+        # outlive the pixmap or be sent back from a process pool.
+        samples = fitz_pix.samples
+        size = (fitz_pix.width, fitz_pix.height)
+        page_image = _pillow().frombuffer("RGB", size, samples, "raw", "RGB", fitz_pix.stride, 1)
+        with instrumentation.span("phash"):
+            phash = perceptual_hash(page_image)
+        return Thumbnail(fitz_pix.width, fitz_pix.height, fitz_pix.stride, "RGB", samples, phash)
+
+
+def _check_pixels(width: int, height: int, max_pixels: int | None):
+    if max_pixels and width * height > max_pixels:
+        raise DecodeLimitError(f"{width}x{height} pixels is more than the limit of {max_pixels / 1e6:g} megapixels.")
+
+
+def perceptual_hash(img: "Image.Image") -> int:
+    """
+    64-bit difference hash: one bit per pair of neighbouring pixels in a 9x8
+    grey version of the image, set where the left one is brighter. Resized,
+    recompressed or lightly edited copies of a picture differ in a few bits.
+    """
+    Image = _pillow()
+    pixels = img.convert("L").resize((9, 8), Image.Resampling.BOX).tobytes()
+    value = 0
+    for row in range(0, 72, 9):
+        for i in range(row, row + 8):
+            value = (value << 1) | (pixels[i] > pixels[i + 1])
+    return value
+
+
+def _exif_preview(img: "Image.Image", size: tuple[int, int]) -> "Image.Image | None":
+    """
+    Returns the JPEG preview embedded in the EXIF data if it can stand in for
+    the full image: at least as large as the thumbnail and of the same shape.
+    """
+    raw = img.info.get("exif")
+    if not raw:
+        return None
+    from PIL import ExifTags, Image
+    try:
+        exif = Image.Exif()
+        exif.load(raw)
+        ifd1 = exif.get_ifd(ExifTags.IFD.IFD1)
+        offset = ifd1.get(_EXIF_THUMB_OFFSET)
+        length = ifd1.get(_EXIF_THUMB_LENGTH)
+        if not offset or not length:
+            return None
+        # Offsets are relative to the TIFF header that follows the "Exif" marker.
+        tiff = raw[6:] if raw.startswith(b"Exif\x00\x00") else raw
+        preview = Image.open(io.BytesIO(tiff[offset:offset + length]))
+        preview.load()
+    except Exception:
+        return None
+
+    if preview.width < size[0] and preview.height < size[1]:
+        return None
+    # Reject letterboxed or cropped previews.
+    if abs(preview.width / preview.height - img.width / img.height) > 0.02:
+        return None
+    return preview
+
+
+def make_executor(max_workers: int | None = None, use_processes: bool = False) -> Executor:
+    """
+    Creates the pool used to decode thumbnails. Threads are enough for speed
+    since Pillow and PyMuPDF release the GIL while decoding. Processes, a
+    decode_pool.SupervisedPool, cost pickling the pixel data back but keep a
+    file that hangs, crashes or exhausts memory from taking the caller with
+    it; such files fail with DecodeLimitError instead. Start one process
+    pool per application and share it, as each worker is a whole interpreter.
+    """
+    if use_processes:
+        # Imported here as it pulls in multiprocessing.
+        from core.decode_pool import SupervisedPool
+        return SupervisedPool(max_workers or DEFAULT_PROCESS_WORKERS, initializer=warm_up)
+    return ThreadPoolExecutor(max_workers=max_workers or DEFAULT_WORKERS, thread_name_prefix="thumbnail")
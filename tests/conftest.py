@@ -0,0 +1,7 @@
+# AFWRename/tests/conftest.py
+
+import sys
+from pathlib import Path
+
+# The app is run from its own folder rather than installed; make its packages importable.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
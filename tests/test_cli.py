@@ -0,0 +1,150 @@
+# AFWRename/tests/test_cli.py
+
+import json
+from pathlib import Path
+
+import pytest
+
+import cli
+
+
+def make_files(folder: Path, names: list[str]) -> Path:
+    folder.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        (folder / name).write_text(name)
+    return folder
+
+
+def write_plan(path: Path, primary: Path, groups: list, synced: list[Path] = ()) -> Path:
+    path.write_text(json.dumps({"primary": str(primary), "synced": [str(f) for f in synced], "groups": groups}))
+    return path
+
+
+def run(capsys, *argv) -> tuple[int, object]:
+    """Runs the CLI and returns its exit code and its JSON report, or its stdout without --json."""
+    code = cli.main([str(arg) for arg in argv])
+    out = capsys.readouterr().out
+    return code, json.loads(out) if "--json" in argv else out
+
+
+class FakeMatcher:
+    """Matches every file to its name with "edit-" in front, standing in for decoding pictures."""
+
+    def __init__(self):
+        self.warnings = []
+
+    def match(self, paths, folder, exclude=None, exclude_ids=None):
+        return {path: folder / f"edit-{path.name}" for path in paths if (folder / f"edit-{path.name}").exists()}
+
+
+@pytest.fixture
+def content_plan(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "content_matcher", lambda args: FakeMatcher() if args.match_content else None)
+    primary = make_files(tmp_path / "photos", ["a.jpg"])
+    synced = make_files(tmp_path / "edits", ["edit-a.jpg"])
+    plan = write_plan(tmp_path / "plan.json", primary, [{"set": 1, "files": ["a.jpg"]}], [synced])
+    return plan, primary, synced
+
+
+def test_content_matches_need_yes(capsys, tmp_path, content_plan):
+    plan, primary, synced = content_plan
+    journals = tmp_path / "journals"
+    code, (result,) = run(capsys, "apply", plan, "--match-content", "--json", "--journal-dir", journals)
+    assert code == cli.EXIT_UNCONFIRMED
+    assert result["status"] == "unconfirmed"
+    assert result["content_matches"] == ["Matched 'a.jpg' to 'edit-a.jpg' in 'edits' by content."]
+    assert sorted(p.name for p in primary.iterdir()) == ["a.jpg"]
+    assert sorted(p.name for p in synced.iterdir()) == ["edit-a.jpg"]
+
+    code, (result,) = run(capsys, "apply", plan, "--match-content", "--dry-run", "--json")
+    assert code == cli.EXIT_OK
+    assert result["content_matches"]
+
+    code, (result,) = run(capsys, "apply", plan, "--match-content", "--yes", "--json", "--journal-dir", journals)
+    assert code == cli.EXIT_OK
+    assert sorted(p.name for p in primary.iterdir()) == ["set1 (1).jpg"]
+    assert sorted(p.name for p in synced.iterdir()) == ["set1 (1).jpg"]
+
+
+@pytest.fixture
+def shoot(tmp_path):
+    primary = make_files(tmp_path / "photos", ["img (1).jpg", "img (2).jpg", "img (3).png"])
+    synced = make_files(tmp_path / "edits", ["edit (1).jpg", "edit (2).jpg", "edit (3).jpg"])
+    groups = [["img (1).jpg", "img (2).jpg"], {"set": 1, "files": ["img (3).png"]}]
+    return write_plan(tmp_path / "plan.json", primary, groups, [synced]), primary, synced
+
+
+def test_dry_run_json(capsys, shoot):
+    plan, primary, synced = shoot
+    code, (result,) = run(capsys, "apply", plan, "--dry-run", "--json")
+    assert code == cli.EXIT_OK
+    assert (result["status"], result["dry_run"], result["plan"]) == ("ok", True, str(plan))
+    assert (result["primary"], result["synced"]) == (str(primary), [str(synced)])
+    assert sorted((Path(r["src"]).name, Path(r["dst"]).name) for r in result["renames"]) == [
+        ("edit (1).jpg", "set2-no1 (1).jpg"),
+        ("edit (2).jpg", "set2-no1 (2).jpg"),
+        ("edit (3).jpg", "set1 (1).jpg"),
+        ("img (1).jpg", "set2-no1 (1).jpg"),
+        ("img (2).jpg", "set2-no1 (2).jpg"),
+        ("img (3).png", "set1 (1).png"),
+    ]
+    assert (result["warnings"], result["conflicts"], result["content_matches"]) == ([], [], [])
+    assert "journal" not in result
+    assert sorted(p.name for p in primary.iterdir()) == ["img (1).jpg", "img (2).jpg", "img (3).png"]
+
+
+def test_apply(capsys, tmp_path, shoot):
+    plan, primary, synced = shoot
+    code, out = run(capsys, "apply", plan, "--journal-dir", tmp_path / "journals")
+    assert code == cli.EXIT_OK
+    assert out == f"{plan}: renamed 6 file(s).\n"
+    assert sorted(p.name for p in primary.iterdir()) == ["set1 (1).png", "set2-no1 (1).jpg", "set2-no1 (2).jpg"]
+    assert sorted(p.name for p in synced.iterdir()) == ["set1 (1).jpg", "set2-no1 (1).jpg", "set2-no1 (2).jpg"]
+
+
+def test_conflicts_exit(capsys, tmp_path, shoot):
+    plan, primary, synced = shoot
+    # A file outside the plan already has one of the new names.
+    (synced / "set1 (1).jpg").write_text("theirs")
+    ok_plan = write_plan(tmp_path / "ok.json", make_files(tmp_path / "other", ["a (1).jpg"]), [["a (1).jpg"]])
+    code, results = run(capsys, "apply", ok_plan, plan, "--json", "--journal-dir", tmp_path / "journals")
+    # The worst outcome of all the plans; the others still run.
+    assert code == cli.EXIT_CONFLICTS
+    assert [result["status"] for result in results] == ["ok", "conflicts"]
+    assert results[1]["conflicts"] and all("set1 (1).jpg" in c for c in results[1]["conflicts"])
+    assert sorted(p.name for p in primary.iterdir()) == ["img (1).jpg", "img (2).jpg", "img (3).png"]
+    assert sorted(p.name for p in (tmp_path / "other").iterdir()) == ["set1 (1).jpg"]
+
+    code, out = run(capsys, "apply", plan, "--dry-run")
+    assert code == cli.EXIT_CONFLICTS
+
+
+@pytest.mark.parametrize("contents, error", [
+    ("{not json", "Expecting property name"),
+    ('{"primary": "."}', "expected an object with a 'groups' list"),
+    ('{"groups": []}', "no primary folder given"),
+    ('{"primary": "missing", "groups": []}', "'missing' is not a folder"),
+    ('{"primary": ".", "groups": [["a", "b", "c", "d"]]}', "Group 1 is not a list of 1 to 3 file names"),
+    ('{"primary": ".", "groups": [["a"], ["a", "b"]]}', "Group 2 repeats a file that is already in a set: a"),
+    ('{"primary": ".", "groups": [{"set": 3, "files": ["a"]}]}', "Group 1 does not have 3 files for set3"),
+])
+def test_invalid_plan_exit(capsys, tmp_path, monkeypatch, contents, error):
+    monkeypatch.chdir(tmp_path)
+    plan = tmp_path / "plan.json"
+    plan.write_text(contents)
+    code, (result,) = run(capsys, "apply", plan, "--json")
+    assert code == cli.EXIT_USAGE
+    assert result["status"] == "invalid"
+    assert error in result["error"]
+
+    code, out = run(capsys, "apply", plan, tmp_path / "absent.json")
+    assert code == cli.EXIT_USAGE
+    assert out == ""
+
+
+@pytest.mark.parametrize("argv", [[], ["apply"], ["rename", "plan.json"], ["apply", "plan.json", "--match-threshold", "x"]])
+def test_usage_exit(capsys, argv):
+    with pytest.raises(SystemExit) as info:
+        cli.main(argv)
+    assert info.value.code == cli.EXIT_USAGE
+    assert "usage: afwrename" in capsys.readouterr().err
@@ -0,0 +1,123 @@
+# AFWRename/tests/test_content_match.py
+
+from pathlib import Path
+
+import pytest
+
+from core import content_match
+from core.content_match import MIN_HASH_BITS, ContentMatcher, HashIndex
+
+np = content_match.np
+
+
+@pytest.fixture(params=["bitwise_count", "table", "python"])
+def popcount(request, monkeypatch):
+    """Runs a test with each way of counting bits: both NumPy ones, and pure Python."""
+    if request.param == "python":
+        monkeypatch.setattr(content_match, "np", None)
+        return
+    if np is None:
+        pytest.skip("NumPy is not installed")
+    if request.param == "bitwise_count":
+        if not hasattr(np, "bitwise_count"):
+            pytest.skip("NumPy has no bitwise_count")
+        monkeypatch.setattr(content_match, "_popcount", np.bitwise_count)
+    else:
+        monkeypatch.setattr(content_match, "_popcount", content_match._table_popcount)
+
+
+A, B, C, D = (Path(name) for name in ("a.jpg", "b.jpg", "c.jpg", "d.jpg"))
+
+
+def index(hashes: dict[Path, int]) -> HashIndex:
+    return HashIndex(list(hashes), list(hashes.values()))
+
+
+def test_nearest_match(popcount):
+    found = index({A: 0b0000, B: 0b1111}).match_all([0b0001, 0b0111], threshold=2)
+    assert found == [A, B]
+
+
+def test_high_bits(popcount):
+    # Hashes use all 64 bits, which must not be taken for signed values.
+    top = 1 << 63
+    found = index({A: top | 1, B: 1}).match_all([top], threshold=2)
+    assert found == [A]
+
+
+def test_threshold_is_inclusive(popcount):
+    hashes = index({A: 0b111})
+    assert hashes.match_all([0], threshold=3) == [A]
+    assert hashes.match_all([0], threshold=2) == [None]
+
+
+def test_tie_matches_nothing(popcount):
+    # A and B are both one bit away; neither is strictly closer.
+    assert index({A: 0b01, B: 0b10}).match_all([0], threshold=5) == [None]
+
+
+def test_runner_up_only_needs_to_be_further(popcount):
+    assert index({A: 0b01, B: 0b11}).match_all([0], threshold=5) == [A]
+
+
+def test_exclude(popcount):
+    hashes = index({A: 0b0, B: 0b1, C: 0b111})
+    assert hashes.match_all([0], threshold=5, exclude={A}) == [B]
+    # With its rival excluded, a tie is broken.
+    assert index({A: 0b01, B: 0b10}).match_all([0], threshold=5, exclude={B}) == [A]
+    assert hashes.match_all([0], threshold=5, exclude={A, B, C}) == [None]
+
+
+def test_conflicting_claims(popcount):
+    hashes = index({A: 0b0000, D: 0b1111_0000})
+    # Both queries are closest to A; the closer one keeps it.
+    assert hashes.match_all([0b1, 0b11], threshold=5) == [A, None]
+    # Equally close, so neither gets it.
+    assert hashes.match_all([0b01, 0b10], threshold=5) == [None, None]
+
+
+def test_single_and_empty_index(popcount):
+    assert index({A: 0}).match_all([0b1, 0b1111_1111], threshold=5) == [A, None]
+    assert index({}).match_all([0], threshold=5) == [None]
+    assert index({A: 0}).match_all([], threshold=5) == []
+
+
+def test_many_queries(popcount, monkeypatch):
+    monkeypatch.setattr(content_match, "_QUERY_CHUNK", 3)
+    paths = [Path(f"{i}.jpg") for i in range(10)]
+    values = [1 << (6 * i) for i in range(10)]
+    # More queries than fit in one chunk, each its own file's hash.
+    assert HashIndex(paths, values).match_all(values, threshold=0) == paths
+
+
+def detailed(n: int) -> int:
+    """A hash with plenty of set bits, differing from detailed(0) in the low n bits."""
+    return 0x5555_5555_5555_5550 ^ ((1 << n) - 1)
+
+
+def test_matcher_skips_low_detail(tmp_path):
+    primary = tmp_path / "photos"
+    synced = tmp_path / "edits"
+    primary.mkdir()
+    synced.mkdir()
+    files = {}
+    for folder, name, value in [
+        (primary, "photo.jpg", detailed(0)), (primary, "blank.jpg", 0),
+        (synced, "photo-edit.jpg", detailed(1)), (synced, "blank-edit.jpg", 1),
+    ]:
+        path = folder / name
+        path.write_bytes(b"")
+        files[path] = value
+    matcher = ContentMatcher()
+    # Stands in for decoding, which needs Pillow.
+    matcher._hashes.update(files)
+    found = matcher.match([primary / "photo.jpg", primary / "blank.jpg"], synced)
+    assert found == {primary / "photo.jpg": synced / "photo-edit.jpg"}
+    assert matcher.warnings == ["'blank.jpg' has too little detail to be matched by content."]
+    assert synced / "blank-edit.jpg" not in matcher.folder_index(synced).paths
+
+
+def test_uniform_picture_has_no_detail():
+    Image = pytest.importorskip("PIL.Image")
+    from core.thumbnailer import perceptual_hash
+    assert perceptual_hash(Image.new("RGB", (64, 64), "white")).bit_count() < MIN_HASH_BITS
@@ -0,0 +1,87 @@
+# AFWRename/tests/test_decode_pool.py
+
+import os
+import sys
+import time
+
+import pytest
+
+from core.decode_pool import SupervisedPool
+from core.thumbnailer import DecodeLimitError
+
+
+# Tasks run in spawned worker processes, so they must be importable functions.
+def allocate(n: int) -> int:
+    return len(bytearray(n))
+
+
+def fail():
+    raise ValueError("bad file")
+
+
+@pytest.fixture
+def pool():
+    pool = SupervisedPool(1, time_limit=2.0, memory_limit=None)
+    yield pool
+    pool.shutdown(cancel_futures=True)
+
+
+def assert_usable(pool: SupervisedPool):
+    assert pool.submit(pow, 2, 10).result() == 1024
+
+
+def test_result_and_exception(pool):
+    assert_usable(pool)
+    with pytest.raises(ValueError, match="bad file"):
+        pool.submit(fail).result()
+    assert_usable(pool)
+
+
+def test_time_limit(pool):
+    assert_usable(pool)
+    started = time.monotonic()
+    with pytest.raises(DecodeLimitError, match="longer than 2 seconds"):
+        pool.submit(time.sleep, 30).result()
+    assert time.monotonic() - started < 10
+    assert_usable(pool)
+
+
+def test_crash(pool):
+    with pytest.raises(DecodeLimitError, match=r"crashed \(exit code 3\)"):
+        pool.submit(os._exit, 3).result()
+    assert_usable(pool)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="memory limits need RLIMIT_AS")
+def test_memory_limit():
+    pool = SupervisedPool(1, memory_limit=1024 ** 3)
+    try:
+        assert pool.submit(allocate, 1024).result() == 1024
+        with pytest.raises(DecodeLimitError, match="more than 1024 MB"):
+            pool.submit(allocate, 4 * 1024 ** 3).result()
+        assert_usable(pool)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def test_other_workers_carry_on():
+    pool = SupervisedPool(2, time_limit=2.0, memory_limit=None)
+    try:
+        slow = pool.submit(time.sleep, 30)
+        assert [pool.submit(pow, 2, n).result() for n in range(5)] == [1, 2, 4, 8, 16]
+        with pytest.raises(DecodeLimitError):
+            slow.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def test_shutdown_cancels_queued(pool):
+    running = pool.submit(time.sleep, 30)
+    queued = pool.submit(pow, 2, 10)
+    # Let the worker pick up the first call.
+    time.sleep(0.5)
+    pool.shutdown(cancel_futures=True)
+    assert queued.cancelled()
+    assert running.exception() is not None
+    with pytest.raises(RuntimeError):
+        pool.submit(pow, 2, 10)
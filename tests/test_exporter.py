@@ -0,0 +1,243 @@
+# AFWRename/tests/test_exporter.py
+
+import errno
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+from core import exporter
+from core.exporter import ExportCancelledError, ExportError, ExportOp, ExportPlan, export_files, plan_export
+from core.rename_engine import RenameConflictError
+from core.scanner import TEMP_NAME_PREFIX
+
+CHUNK = 1000
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    """A primary and an output folder. Files are always copied, in small chunks, so every path is taken."""
+    monkeypatch.setattr(exporter, "_reflink", lambda src_fd, dst_fd: False)
+    monkeypatch.setattr(exporter, "COPY_CHUNK", CHUNK)
+    monkeypatch.setattr(exporter, "BUFFER_SIZE", CHUNK)
+    primary = tmp_path / "photos"
+    output = tmp_path / "export"
+    primary.mkdir()
+    output.mkdir()
+    return primary, output
+
+
+def make_plan(primary: Path, output: Path, sizes: list[int]) -> ExportPlan:
+    ops = []
+    for i, size in enumerate(sizes):
+        src = primary / f"img ({i}).jpg"
+        src.write_bytes(bytes(j % 251 for j in range(size)))
+        ops.append(ExportOp(src, output / f"set1 ({i + 1}).jpg", size))
+    return ExportPlan(ops)
+
+
+def assert_copied(plan: ExportPlan):
+    for op in plan.ops:
+        assert op.dst.read_bytes() == op.src.read_bytes()
+    assert not list(plan.ops[0].dst.parent.glob(f"{TEMP_NAME_PREFIX}*"))
+
+
+def limited(method, calls: list[str], name: str, chunks: int | None):
+    """Wraps a copy method so it copies `chunks` chunks, or all of them with None, then fails as unsupported."""
+    def copy(src_fd, dst_fd, offset):
+        calls.append(name)
+        if chunks is not None and calls.count(name) > chunks:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return method(src_fd, dst_fd, offset)
+    return copy
+
+
+def test_plan_and_export(folders):
+    primary, output = folders
+    for name in ("img (1).jpg", "img (2).png"):
+        (primary / name).write_bytes(name.encode() * 1000)
+    sets = {"set1": [str(primary / "img (1).jpg")], "set2-no1": [str(primary / "img (2).png"), str(primary / "img (1).jpg")]}
+    plan = plan_export(sets, primary, output)
+    assert sorted(op.dst.name for op in plan.ops) == ["set1 (1).jpg", "set2-no1 (1).png", "set2-no1 (2).jpg"]
+    assert plan.total_bytes == 3 * 11000
+    reports = []
+    result = export_files(plan, verify=True, progress=lambda *args: reports.append(args))
+    assert_copied(plan)
+    assert (result.files, result.total_bytes, result.methods) == (3, 33000, {"copied": 3})
+    assert reports[-1] == (3, 3, 33000, 33000)
+    assert (output / "set1 (1).jpg").stat().st_mtime_ns == (primary / "img (1).jpg").stat().st_mtime_ns
+
+
+@pytest.mark.skipif(exporter._copy_file_range is None or exporter._sendfile is None, reason="needs copy_file_range and sendfile")
+@pytest.mark.parametrize("copy_file_range_chunks, sendfile_chunks, expected", [
+    # Six chunks, then a call that finds nothing left.
+    (None, 0, ["copy_file_range"] * 7),
+    # Unsupported from the start: sendfile does it all.
+    (0, None, ["copy_file_range"] + ["sendfile"] * 7),
+    # Unsupported part way: each method carries on from where the last stopped.
+    (2, 1, ["copy_file_range"] * 3 + ["sendfile"] * 2),
+    (0, 0, ["copy_file_range", "sendfile"]),
+])
+def test_copy_fallbacks(folders, monkeypatch, copy_file_range_chunks, sendfile_chunks, expected):
+    primary, output = folders
+    calls = []
+    monkeypatch.setattr(exporter, "_copy_file_range", limited(exporter._copy_file_range, calls, "copy_file_range", copy_file_range_chunks))
+    monkeypatch.setattr(exporter, "_sendfile", limited(exporter._sendfile, calls, "sendfile", sendfile_chunks))
+    plan = make_plan(primary, output, [5 * CHUNK + 10])
+    result = export_files(plan)
+    assert calls == expected
+    assert_copied(plan)
+    assert result.methods == {"copied": 1}
+
+
+def test_copy_error_is_reported(folders, monkeypatch):
+    primary, output = folders
+    calls = []
+
+    def copy_file_range(src_fd, dst_fd, offset):
+        if offset >= CHUNK:
+            raise OSError(errno.EIO, "Input/output error")
+        return exporter._copy_file_range_chunk(src_fd, dst_fd, offset)
+
+    monkeypatch.setattr(exporter, "_copy_file_range", copy_file_range)
+    monkeypatch.setattr(exporter, "_sendfile", limited(exporter._sendfile_chunk, calls, "sendfile", None))
+    plan = make_plan(primary, output, [5 * CHUNK, 10])
+    with pytest.raises(ExportError) as info:
+        export_files(plan, max_workers=1)
+    # A real failure is not retried with another method.
+    assert calls == []
+    assert len(info.value.errors) == 1 and info.value.errors[0].startswith("img (0).jpg: ")
+    assert (info.value.result.files, info.value.result.total_bytes) == (1, 10)
+    assert sorted(p.name for p in output.iterdir()) == ["set1 (2).jpg"]
+
+
+def test_copy_when_source_shrinks(folders):
+    primary, output = folders
+    plan = make_plan(primary, output, [3 * CHUNK])
+    # Planned at 3000 bytes, but smaller by the time it is copied.
+    plan.ops[0].src.write_bytes(b"x" * 1500)
+    export_files(plan)
+    assert_copied(plan)
+
+
+def test_cancel_removes_written_files(folders):
+    primary, output = folders
+    plan = make_plan(primary, output, [2 * CHUNK, 5 * CHUNK, 2 * CHUNK])
+    cancel = threading.Event()
+
+    def progress(files_done, total_files, bytes_done, total_bytes):
+        # Part way through the second file.
+        if bytes_done > 3 * CHUNK:
+            cancel.set()
+
+    with pytest.raises(ExportCancelledError) as info:
+        export_files(plan, max_workers=1, progress=progress, cancel=cancel)
+    assert info.value.errors == []
+    assert list(output.iterdir()) == []
+
+
+def test_cancel_reports_files_left_behind(folders, monkeypatch):
+    primary, output = folders
+    plan = make_plan(primary, output, [CHUNK, CHUNK])
+    cancel = threading.Event()
+    real_unlink = Path.unlink
+
+    def unlink(self, missing_ok=False):
+        if self.parent == output and not self.name.startswith(TEMP_NAME_PREFIX):
+            raise PermissionError(errno.EACCES, "Permission denied", str(self))
+        real_unlink(self, missing_ok=missing_ok)
+
+    monkeypatch.setattr(Path, "unlink", unlink)
+
+    def progress(files_done, total_files, bytes_done, total_bytes):
+        if files_done:
+            cancel.set()
+
+    with pytest.raises(ExportCancelledError) as info:
+        export_files(plan, max_workers=1, progress=progress, cancel=cancel)
+    assert len(info.value.errors) == 1
+    assert info.value.errors[0].startswith(f"{output / 'set1 (1).jpg'}: ")
+    assert "could not be removed" in str(info.value)
+    assert sorted(p.name for p in output.iterdir()) == ["set1 (1).jpg"]
+
+
+def test_verify_mismatch(folders, monkeypatch):
+    primary, output = folders
+    plan = make_plan(primary, output, [CHUNK])
+    # As if the copy had come out different from its source.
+    monkeypatch.setattr(exporter, "_checksum", lambda path: path.name.encode())
+    with pytest.raises(ExportError, match="checksum mismatch after copying to 'set1 \\(1\\).jpg'"):
+        export_files(plan, verify=True)
+    assert list(output.iterdir()) == []
+    # Without verify, the copy is not read back.
+    export_files(plan)
+    assert_copied(plan)
+
+
+def test_hardlinks(folders):
+    primary, output = folders
+    plan = make_plan(primary, output, [CHUNK, CHUNK])
+    result = export_files(plan, allow_hardlinks=True)
+    assert result.methods == {"hardlinked": 2}
+    assert all(op.dst.stat().st_ino == op.src.stat().st_ino for op in plan.ops)
+
+
+def test_hardlink_falls_back_to_copy(folders, monkeypatch):
+    primary, output = folders
+    plan = make_plan(primary, output, [CHUNK])
+
+    def link(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", link)
+    assert export_files(plan, allow_hardlinks=True).methods == {"copied": 1}
+    assert_copied(plan)
+
+
+@pytest.mark.parametrize("allow_hardlinks", [False, True])
+def test_target_created_after_planning(folders, allow_hardlinks):
+    primary, output = folders
+    plan = make_plan(primary, output, [CHUNK, CHUNK])
+    assert plan.conflicts == []
+    # Another program writes one of the targets before the export gets to it.
+    plan.ops[0].dst.write_bytes(b"theirs")
+    with pytest.raises(ExportError) as info:
+        export_files(plan, allow_hardlinks=allow_hardlinks)
+    assert len(info.value.errors) == 1 and info.value.errors[0].startswith("img (0).jpg: [Errno 17]")
+    assert plan.ops[0].dst.read_bytes() == b"theirs"
+    assert plan.ops[1].dst.read_bytes() == plan.ops[1].src.read_bytes()
+    assert sorted(p.name for p in output.iterdir()) == ["set1 (1).jpg", "set1 (2).jpg"]
+
+
+def test_target_created_during_copy(folders):
+    primary, output = folders
+    plan = make_plan(primary, output, [5 * CHUNK])
+    dst = plan.ops[0].dst
+
+    def progress(files_done, total_files, bytes_done, total_bytes):
+        if not dst.exists():
+            dst.write_bytes(b"theirs")
+
+    with pytest.raises(ExportError, match="Target already exists"):
+        export_files(plan, progress=progress)
+    assert dst.read_bytes() == b"theirs"
+    assert [p.name for p in output.iterdir()] == ["set1 (1).jpg"]
+
+
+def test_conflicts(folders):
+    primary, output = folders
+    for name in ("img (1).jpg", "img (2).jpg", "img (3).jpg"):
+        (primary / name).write_bytes(b"data")
+    (output / "set1 (2).jpg").write_bytes(b"theirs")
+    (primary / "img (3).jpg").unlink()
+    sets = {"set1": [str(primary / name) for name in ("img (1).jpg", "img (2).jpg", "img (3).jpg")]}
+    plan = plan_export(sets, primary, output)
+    assert plan.conflicts == [
+        "'set1 (2).jpg' already exists in 'export'.",
+        "'img (3).jpg' no longer exists in 'photos'.",
+    ]
+    with pytest.raises(RenameConflictError):
+        export_files(plan)
+    assert sorted(p.name for p in output.iterdir()) == ["set1 (2).jpg"]
+    assert (output / "set1 (2).jpg").read_bytes() == b"theirs"
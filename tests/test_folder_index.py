@@ -0,0 +1,50 @@
+# AFWRename/tests/test_folder_index.py
+
+from pathlib import Path
+
+import pytest
+
+from core.folder_index import FolderIndex, build_folder_indexes
+from core.rename_engine import plan_renames
+
+
+@pytest.fixture
+def folder(tmp_path) -> Path:
+    folder = tmp_path / "edits"
+    folder.mkdir()
+    names = ["a (10).jpg", "b (10).png", "unique (7).jpg", "x (9).jpg", "y (9).tif", "z (9).jpg", "noid.jpg", "c (010).jpg"]
+    for name in names:
+        (folder / name).write_text(name)
+    return folder
+
+
+def test_duplicate_warnings(folder):
+    index = FolderIndex(folder)
+    # Ordered by ID as a number, names sorted; "010" is an ID of its own.
+    assert index.duplicate_warnings() == [
+        "ID '(9)' appears on 3 files in 'edits': x (9).jpg, y (9).tif, z (9).jpg",
+        "ID '(10)' appears on 2 files in 'edits': a (10).jpg, b (10).png",
+    ]
+    # Neither file wins: a shared ID does not resolve to any of them.
+    for image_id in ("9", "10"):
+        assert index.is_duplicate(image_id)
+        assert index.get(image_id) is None
+        assert image_id not in index
+    assert index.get("7") == folder / "unique (7).jpg"
+    assert index.get("010") == folder / "c (010).jpg"
+    assert len(index) == 2
+
+    warnings = []
+    build_folder_indexes([folder], warnings)
+    assert warnings == index.duplicate_warnings()
+
+
+def test_duplicate_is_not_renamed(tmp_path, folder):
+    primary = tmp_path / "photos"
+    primary.mkdir()
+    for name in ("img (10).jpg", "img (7).jpg"):
+        (primary / name).write_text(name)
+    sets = {"set1": [str(primary / "img (10).jpg"), str(primary / "img (7).jpg")]}
+    plan = plan_renames(sets, primary, [folder])
+    assert "ID '(10)' is not unique in 'edits'. Skipping." in plan.warnings
+    assert sorted(op.src.name for op in plan.ops if op.folder == folder) == ["unique (7).jpg"]
@@ -0,0 +1,98 @@
+# AFWRename/tests/test_memory_cache.py
+
+import pytest
+
+from core.memory_cache import LRUCache
+
+
+@pytest.fixture
+def evicted():
+    return []
+
+
+@pytest.fixture
+def cache(evicted):
+    # Values are byte strings costing their length.
+    return LRUCache(10, len, evicted.extend)
+
+
+def test_evicts_least_recently_used(cache, evicted):
+    for key in "abc":
+        cache.put(key, b"xxx")
+    assert cache.get("a") == b"xxx"
+    # 12 bytes: "b" was used least recently.
+    cache.put("d", b"xxx")
+    assert evicted == ["b"]
+    assert list(cache._entries) == ["c", "a", "d"]
+    assert cache.total_bytes == 9
+
+
+def test_one_put_can_evict_several(cache, evicted):
+    for key in "abcde":
+        cache.put(key, b"xx")
+    cache.put("f", b"xxxxxxx")
+    assert evicted == ["a", "b", "c", "d"]
+    assert sorted(cache._entries) == ["e", "f"]
+    assert cache.total_bytes == 9
+
+
+def test_replacing_a_value_updates_its_size(cache, evicted):
+    cache.put("a", b"xxxx")
+    cache.put("b", b"xxxx")
+    cache.put("a", b"x")
+    assert cache.total_bytes == 5
+    # Replacing also counts as a use.
+    cache.put("c", b"xxxxxx")
+    assert evicted == ["b"]
+    assert cache.get("a") == b"x"
+
+
+def test_oversized_value_is_kept(cache, evicted):
+    cache.put("a", b"x")
+    cache.put("big", b"x" * 20)
+    assert evicted == ["a"]
+    assert "big" in cache and len(cache) == 1
+    assert cache.total_bytes == 20
+
+
+def test_counters(cache, evicted):
+    cache.put("a", b"xxxxx")
+    assert cache.get("a") == b"xxxxx"
+    assert cache.get("b") is None
+    assert cache.get("b", b"") == b""
+    # A value that is falsy is still a hit.
+    cache.put("empty", b"")
+    assert cache.get("empty") == b""
+    cache.put("c", b"xxxxxx")
+    assert cache.stats() == {
+        "entries": 2, "bytes": 6, "budget_bytes": 10, "hits": 2, "misses": 2, "evictions": 1, "hit_rate": 0.5
+    }
+    # `in` and pop() are not lookups.
+    assert "c" in cache
+    assert cache.pop("c") == b"xxxxxx"
+    assert cache.pop("c", "gone") == "gone"
+    assert (cache.hits, cache.misses, cache.total_bytes) == (2, 2, 0)
+    assert evicted == ["a"]
+
+
+def test_set_budget(cache, evicted):
+    for key in "abcde":
+        cache.put(key, b"xx")
+    cache.set_budget(20)
+    assert evicted == []
+    cache.set_budget(5)
+    assert evicted == ["a", "b", "c"]
+    assert cache.stats()["evictions"] == 3
+    cache.clear()
+    assert len(cache) == 0 and cache.total_bytes == 0
+    # Clearing is not eviction.
+    assert evicted == ["a", "b", "c"]
+
+
+def test_without_on_evict():
+    cache = LRUCache(2, len)
+    cache.put("a", b"xx")
+    cache.put("b", b"xx")
+    assert "a" not in cache
+    assert cache.evictions == 1
+    assert LRUCache(1, len).stats()["hit_rate"] == 0.0
@@ -0,0 +1,283 @@
+# AFWRename/tests/test_rename_engine.py
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from core.rename_engine import (
+    END, ROLLED_BACK, UNDONE, RenameBatchError, RenameCancelledError, RenameConflictError, RenameJournal,
+    RenameOp, RenamePlan, execute_plan, find_incomplete_batches, last_undoable_batch, plan_renames, resume_batch,
+    rollback_batch, undo_batch
+)
+from core.scanner import scan_folder
+
+
+class Crash(BaseException):
+    """Stands in for the process dying. Not an OSError, so the engine cannot handle it."""
+
+
+@pytest.fixture
+def crash_after(monkeypatch):
+    """Makes the n-th rename from now on, counting from 0, kill the "process"."""
+    real_rename = Path.rename
+
+    def install(n: int):
+        calls = 0
+
+        def rename(self, target):
+            nonlocal calls
+            if calls == n:
+                monkeypatch.setattr(Path, "rename", real_rename)
+                raise Crash()
+            calls += 1
+            return real_rename(self, target)
+
+        monkeypatch.setattr(Path, "rename", rename)
+
+    return install
+
+
+def make_files(folder: Path, files: dict[str, str]) -> Path:
+    folder.mkdir(parents=True, exist_ok=True)
+    for name, content in files.items():
+        (folder / name).write_text(content)
+    return folder
+
+
+def contents(folder: Path) -> dict[str, str]:
+    return {p.name: p.read_text() for p in folder.iterdir()}
+
+
+def chain_plan(folder: Path) -> RenamePlan:
+    """a -> b while b -> c, so b must be moved out of the way first."""
+    return RenamePlan([
+        RenameOp(folder, folder / "a.jpg", folder / "b.jpg"),
+        RenameOp(folder, folder / "b.jpg", folder / "c.jpg"),
+    ])
+
+
+ORIGINAL = {"a.jpg": "A", "b.jpg": "B"}
+RENAMED = {"b.jpg": "A", "c.jpg": "B"}
+
+# Two files, each renamed once to its temporary name and once to its final one.
+RENAMES = 4
+
+
+def crashed_batch(tmp_path: Path, crash_after, n: int) -> tuple[Path, Path]:
+    """Runs the chain until its n-th rename and returns the folder and the journal left behind."""
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    journals = tmp_path / "journals"
+    crash_after(n)
+    with pytest.raises(Crash):
+        execute_plan(chain_plan(folder), journals)
+    incomplete = find_incomplete_batches(journals)
+    assert len(incomplete) == 1
+    return folder, incomplete[0]
+
+
+def test_plan_counts_chain():
+    folder = Path("photos")
+    plan = RenamePlan([
+        RenameOp(folder, folder / "a.jpg", folder / "b.jpg"),
+        RenameOp(folder, folder / "b.jpg", folder / "c.jpg"),
+    ])
+    # Checked against the filesystem; neither file exists here.
+    assert len(plan.conflicts) == 2
+    assert plan.chained == 0
+
+
+def test_execute_chain(tmp_path):
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    plan = chain_plan(folder)
+    assert plan.conflicts == []
+    assert plan.chained == 1
+    journal = execute_plan(plan, tmp_path / "journals")
+    assert contents(folder) == RENAMED
+    assert RenameJournal.load(journal.path).has(END)
+    assert find_incomplete_batches(tmp_path / "journals") == []
+
+
+def test_execute_swap(tmp_path):
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    plan = RenamePlan([
+        RenameOp(folder, folder / "a.jpg", folder / "b.jpg"),
+        RenameOp(folder, folder / "b.jpg", folder / "a.jpg"),
+    ])
+    execute_plan(plan, tmp_path / "journals")
+    assert contents(folder) == {"a.jpg": "B", "b.jpg": "A"}
+
+
+def test_conflict_renames_nothing(tmp_path):
+    folder = make_files(tmp_path / "photos", {"a.jpg": "A", "c.jpg": "C"})
+    plan = RenamePlan([RenameOp(folder, folder / "a.jpg", folder / "c.jpg")])
+    with pytest.raises(RenameConflictError):
+        execute_plan(plan, tmp_path / "journals")
+    assert contents(folder) == {"a.jpg": "A", "c.jpg": "C"}
+    assert not (tmp_path / "journals").exists()
+
+
+@pytest.mark.parametrize("n", range(RENAMES))
+def test_resume_after_crash(tmp_path, crash_after, n):
+    folder, journal_path = crashed_batch(tmp_path, crash_after, n)
+    resume_batch(journal_path)
+    assert contents(folder) == RENAMED
+    assert RenameJournal.load(journal_path).has(END)
+    assert find_incomplete_batches(journal_path.parent) == []
+
+
+@pytest.mark.parametrize("n", range(RENAMES))
+def test_rollback_after_crash(tmp_path, crash_after, n):
+    folder, journal_path = crashed_batch(tmp_path, crash_after, n)
+    rollback_batch(journal_path)
+    assert contents(folder) == ORIGINAL
+    assert RenameJournal.load(journal_path).has(ROLLED_BACK)
+    assert find_incomplete_batches(journal_path.parent) == []
+
+
+@pytest.mark.parametrize("n", range(RENAMES))
+@pytest.mark.parametrize("m", range(RENAMES))
+def test_resume_after_crashed_resume(tmp_path, crash_after, n, m):
+    folder, journal_path = crashed_batch(tmp_path, crash_after, n)
+    crash_after(m)
+    try:
+        resume_batch(journal_path)
+    except Crash:
+        pass
+    resume_batch(journal_path)
+    assert contents(folder) == RENAMED
+
+
+@pytest.mark.parametrize("n", range(RENAMES))
+@pytest.mark.parametrize("m", range(RENAMES))
+def test_rollback_after_crashed_rollback(tmp_path, crash_after, n, m):
+    folder, journal_path = crashed_batch(tmp_path, crash_after, n)
+    crash_after(m)
+    try:
+        rollback_batch(journal_path)
+    except Crash:
+        pass
+    # A rollback once begun is finished even if asked to resume.
+    resume_batch(journal_path)
+    assert contents(folder) == ORIGINAL
+    assert RenameJournal.load(journal_path).has(ROLLED_BACK)
+
+
+def test_resume_ignores_torn_journal_line(tmp_path, crash_after):
+    folder, journal_path = crashed_batch(tmp_path, crash_after, 3)
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('{"type": "comm')
+    resume_batch(journal_path)
+    assert contents(folder) == RENAMED
+
+
+def test_failed_folder_leaves_batch_recoverable(tmp_path, monkeypatch):
+    good = make_files(tmp_path / "good", ORIGINAL)
+    bad = make_files(tmp_path / "bad", ORIGINAL)
+    plan = RenamePlan(chain_plan(good).ops + chain_plan(bad).ops)
+    real_rename = Path.rename
+
+    def rename(self, target):
+        if self.parent == bad:
+            raise PermissionError("read-only")
+        return real_rename(self, target)
+
+    monkeypatch.setattr(Path, "rename", rename)
+    with pytest.raises(RenameBatchError) as info:
+        execute_plan(plan, tmp_path / "journals")
+    assert len(info.value.errors) == 1
+    # The other folder was staged all the same, but nothing was committed.
+    staged = contents(good)
+    assert all(name.startswith(".afw-") for name in staged)
+    assert sorted(staged.values()) == ["A", "B"]
+    assert contents(bad) == ORIGINAL
+    monkeypatch.undo()
+    rollback_batch(info.value.journal_path)
+    assert contents(good) == ORIGINAL
+    assert contents(bad) == ORIGINAL
+
+
+def test_cancel_then_rollback(tmp_path):
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    cancel = threading.Event()
+
+    def progress(phase, done, total):
+        if done == 1:
+            cancel.set()
+
+    with pytest.raises(RenameCancelledError) as info:
+        execute_plan(chain_plan(folder), tmp_path / "journals", progress=progress, cancel=cancel)
+    rollback_batch(info.value.journal_path)
+    assert contents(folder) == ORIGINAL
+
+
+def test_undo(tmp_path):
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    journals = tmp_path / "journals"
+    journal = execute_plan(chain_plan(folder), journals)
+    assert last_undoable_batch(journals) == journal.path
+    undo_batch(journal.path)
+    assert contents(folder) == ORIGINAL
+    assert RenameJournal.load(journal.path).has(UNDONE)
+    assert last_undoable_batch(journals) is None
+
+
+def test_undo_needs_finished_batch(tmp_path, crash_after):
+    folder, journal_path = crashed_batch(tmp_path, crash_after, 1)
+    with pytest.raises(ValueError):
+        undo_batch(journal_path)
+    assert last_undoable_batch(journal_path.parent) is None
+
+
+def test_undo_conflict_restores_nothing(tmp_path):
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    journal = execute_plan(chain_plan(folder), tmp_path / "journals")
+    (folder / "a.jpg").write_text("new")
+    with pytest.raises(RenameConflictError):
+        undo_batch(journal.path)
+    assert contents(folder) == {**RENAMED, "a.jpg": "new"}
+
+
+@pytest.mark.parametrize("n", range(RENAMES))
+def test_resume_crashed_undo(tmp_path, crash_after, n):
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    journals = tmp_path / "journals"
+    journal = execute_plan(chain_plan(folder), journals)
+    crash_after(n)
+    with pytest.raises(Crash):
+        undo_batch(journal.path)
+    (undo_path,) = find_incomplete_batches(journals)
+    assert RenameJournal.load(undo_path).undoes == journal.batch_id
+    resume_batch(undo_path)
+    assert contents(folder) == ORIGINAL
+    assert last_undoable_batch(journals) is None
+
+
+@pytest.mark.parametrize("n", range(RENAMES))
+def test_rollback_crashed_undo(tmp_path, crash_after, n):
+    folder = make_files(tmp_path / "photos", ORIGINAL)
+    journals = tmp_path / "journals"
+    journal = execute_plan(chain_plan(folder), journals)
+    crash_after(n)
+    with pytest.raises(Crash):
+        undo_batch(journal.path)
+    (undo_path,) = find_incomplete_batches(journals)
+    rollback_batch(undo_path)
+    assert contents(folder) == RENAMED
+    # The batch was never undone, so it still can be.
+    assert last_undoable_batch(journals) == journal.path
+
+
+def test_execute_empty_plan(tmp_path):
+    journal = execute_plan(RenamePlan([]), tmp_path / "journals")
+    assert RenameJournal.load(journal.path).has(END)
+
+
+def test_plan_uses_scan_records(tmp_path):
+    primary = make_files(tmp_path / "photos", {"img (2).JPG": "A", "img (10).jpg": "B"})
+    synced = make_files(tmp_path / "edits", {"edit (2).jpg": "A", "edit (10).jpg": "B"})
+    records = {record.path: record for record in scan_folder(primary)}
+    sets = {"set2-no1": [str(primary / "img (2).JPG"), str(primary / "img (10).jpg")]}
+    plan = plan_renames(sets, primary, [synced], records=records)
+    assert plan.ops == plan_renames(sets, primary, [synced]).ops
+    assert sorted(op.dst.name for op in plan.ops if op.folder == primary) == ["set2-no1 (1).JPG", "set2-no1 (2).jpg"]
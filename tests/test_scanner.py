@@ -0,0 +1,30 @@
+# AFWRename/tests/test_scanner.py
+
+from core.scanner import natural_sort_key, scan_folder
+
+
+def test_natural_order():
+    names = ["img (10).jpg", "IMG (9).jpg", "img (2).jpg", "img.jpg", "img (1) b.jpg", "img (1).jpg"]
+    assert sorted(names, key=natural_sort_key) == [
+        "img (1) b.jpg", "img (1).jpg", "img (2).jpg", "IMG (9).jpg", "img (10).jpg", "img.jpg"
+    ]
+
+
+def test_ties_are_left_to_the_caller():
+    # The key does not hold the name again; callers order these by path.
+    assert natural_sort_key("IMG (02).jpg") == natural_sort_key("img (2).jpg")
+    assert natural_sort_key("img (0).jpg") == natural_sort_key("img (000).jpg")
+    assert "IMG" not in natural_sort_key("IMG (2).jpg")
+
+
+def test_scan_folder(tmp_path):
+    for name in ["b (2).JPG", "a.png", "notes.txt", ".afw-1234-0.jpg", "..jpg"]:
+        (tmp_path / name).write_text(name)
+    (tmp_path / "dir.jpg").mkdir()
+    records = {record.name: record for record in scan_folder(tmp_path)}
+    assert sorted(records) == ["..jpg", "a.png", "b (2).JPG"]
+    record = records["b (2).JPG"]
+    assert (record.path, record.suffix, record.image_id, record.size) == (str(tmp_path / "b (2).JPG"), ".JPG", "2", 9)
+    assert record.sort_key == natural_sort_key("b (2).JPG")
+    assert records["a.png"].image_id is None
+    assert all(r.sort_key is None for r in scan_folder(tmp_path, sort_keys=False))
@@ -0,0 +1,162 @@
+# AFWRename/tests/test_session.py
+
+import random
+from pathlib import Path
+
+import pytest
+
+from core.session import SessionLog, restore_sets
+from core.set_manager import SetManager
+
+
+@pytest.fixture
+def folders(tmp_path):
+    primary = tmp_path / "photos"
+    synced = tmp_path / "edits"
+    primary.mkdir()
+    synced.mkdir()
+    return primary, synced, tmp_path / "sessions"
+
+
+def groups_of(manager: SetManager) -> list[tuple[int, list[str], str]]:
+    """A SetManager's assignments as (set size, paths, name), in the order they were made."""
+    return [(int(name[3]), list(paths), name) for name, paths in manager.history]
+
+
+def replay(manager: SetManager, log: SessionLog, paths: list[str], rng: random.Random, steps: int):
+    """Applies random operations to both, the way MainWindow does."""
+    for _ in range(steps):
+        action = rng.choice(["add", "add", "add", "undo", "remove", "reset", "synced"])
+        free = [p for p in paths if not manager.is_assigned(p)]
+        if action == "add" and free:
+            size = rng.choice([1, 2, 3])
+            chosen = rng.sample(free, min(len(free), size if size > 1 else rng.randint(1, 3)))
+            set_name = manager.add_set(size, chosen)
+            if set_name is not None:
+                log.record_add(size, chosen, set_name)
+        elif action == "undo":
+            if manager.undo_last_set() is not None:
+                log.record_undo()
+        elif action == "remove":
+            gone = rng.sample(paths, rng.randint(1, 2))
+            manager.remove_paths(gone)
+            log.record_remove(gone)
+            for path in gone:
+                paths.remove(path)
+        elif action == "reset" and rng.random() < 0.3:
+            manager.reset()
+            log.record_reset()
+        elif action == "synced":
+            log.record_synced([])
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_replay_matches_set_manager(folders, seed):
+    primary, _, sessions = folders
+    rng = random.Random(seed)
+    paths = [str(primary / f"img ({i}).jpg") for i in range(40)]
+    manager = SetManager()
+    log = SessionLog(primary, sessions)
+    log.start()
+    replay(manager, log, paths, rng, 60)
+    log.close()
+
+    restored = SessionLog(primary, sessions).load(set(paths))
+    assert restored.groups == groups_of(manager)
+    assert restored.missing == []
+    rebuilt = SetManager()
+    restore_sets(rebuilt, restored)
+    assert rebuilt.sets == manager.sets
+    assert rebuilt.set_names() == manager.set_names()
+    # New sets are numbered after the restored ones.
+    free = [p for p in paths if not manager.is_assigned(p)][:2]
+    if len(free) == 2:
+        assert rebuilt.add_set(2, free) not in manager.sets
+
+
+def test_missing_files(folders):
+    primary, _, sessions = folders
+    log = SessionLog(primary, sessions)
+    log.start()
+    log.record_add(2, [str(primary / "a.jpg"), str(primary / "b.jpg")])
+    log.record_add(1, [str(primary / "c.jpg"), str(primary / "d.jpg")])
+    log.close()
+    valid = {str(primary / name) for name in ("a.jpg", "c.jpg")}
+    restored = SessionLog(primary, sessions).load(valid)
+    # A set of 2 cannot be kept with one file; set1 keeps what is left.
+    assert restored.groups == [(1, [str(primary / "c.jpg")], None)]
+    assert sorted(Path(p).name for p in restored.missing) == ["b.jpg", "d.jpg"]
+
+
+def test_torn_last_line(folders):
+    primary, synced, sessions = folders
+    paths = [str(primary / name) for name in ("a.jpg", "b.jpg", "c.jpg")]
+    log = SessionLog(primary, sessions)
+    log.start()
+    log.record_add(2, paths[:2], "set2-no1")
+    log.record_synced([synced])
+    log.record_add(1, paths[2:], "set1")
+    log.close()
+    # A crash in the middle of writing the next line.
+    with open(log.path, "a", encoding="utf-8") as f:
+        f.write('{"type":"und')
+    restored = SessionLog(primary, sessions).load(set(paths))
+    assert restored.groups == [(2, paths[:2], "set2-no1"), (1, paths[2:], "set1")]
+    assert restored.synced_folders == [synced]
+
+
+def test_start_replaces_log(folders):
+    primary, synced, sessions = folders
+    paths = [str(primary / name) for name in ("a.jpg", "b.jpg", "c.jpg", "d.jpg")]
+    log = SessionLog(primary, sessions)
+    log.start()
+    log.record_add(2, paths[:2])
+    log.record_add(1, paths[2:3])
+    log.record_undo()
+    log.record_add(1, paths[3:])
+    log.record_synced([synced])
+    log.close()
+
+    restored = SessionLog(primary, sessions).load(set(paths))
+    reopened = SessionLog(primary, sessions)
+    reopened.start(restored)
+    reopened.close()
+    # Only the surviving assignments are written back.
+    assert len(reopened.path.read_text(encoding="utf-8").splitlines()) == 3
+    assert not reopened.path.with_suffix(".tmp").exists()
+    assert SessionLog(primary, sessions).load(set(paths)) == restored
+
+    # Starting afresh replaces the log with an empty one.
+    fresh = SessionLog(primary, sessions)
+    fresh.start()
+    fresh.close()
+    assert SessionLog(primary, sessions).load(set(paths)).groups == []
+
+
+def test_other_folder_is_not_loaded(folders, tmp_path):
+    primary, _, sessions = folders
+    log = SessionLog(primary, sessions)
+    log.start()
+    log.record_add(1, [str(primary / "a.jpg")])
+    log.close()
+    # Same session file, as if two paths hashed alike, but another folder in the header.
+    other = SessionLog(tmp_path / "other", sessions)
+    other.path = log.path
+    assert other.load({str(tmp_path / "other" / "a.jpg")}) is None
+
+
+def test_names_survive_dissolved_sets(folders):
+    primary, _, sessions = folders
+    paths = [str(primary / f"{i}.jpg") for i in range(4)]
+    manager = SetManager()
+    log = SessionLog(primary, sessions)
+    log.start()
+    for pair in (paths[:2], paths[2:]):
+        log.record_add(2, pair, manager.add_set(2, pair))
+    manager.remove_paths(paths[:1])
+    log.record_remove(paths[:1])
+    log.close()
+    rebuilt = SetManager()
+    restore_sets(rebuilt, SessionLog(primary, sessions).load(set(paths[1:])))
+    # set2-no1 was dissolved; the other set is not renumbered to take its place.
+    assert rebuilt.sets == {"set2-no2": paths[2:]}
@@ -0,0 +1,148 @@
+# AFWRename/tests/test_set_manager.py
+
+import pytest
+
+from core.set_manager import SetChange, SetManager, set_sort_key
+
+
+@pytest.fixture
+def manager():
+    return SetManager()
+
+
+@pytest.fixture
+def changes(manager):
+    received = []
+    manager.subscribe(received.append)
+    return received
+
+
+def test_add_set(manager):
+    assert manager.add_set(2, ["a", "b"]) == "set2-no1"
+    assert manager.add_set(1, ["c"]) == "set1"
+    assert manager.add_set(1, ["d", "e"]) == "set1"
+    assert manager.sets == {"set2-no1": ["a", "b"], "set1": ["c", "d", "e"]}
+    assert manager.set_of("d") == "set1"
+
+
+@pytest.mark.parametrize("size, paths", [
+    (2, ["a"]),
+    (3, ["a", "b"]),
+    (2, ["a", "a"]),
+    (1, []),
+    # Already in set2-no1.
+    (2, ["x", "a"]),
+])
+def test_invalid_sets(manager, size, paths):
+    manager.add_set(2, ["a", "b"])
+    assert manager.add_set(size, paths) is None
+    assert manager.sets == {"set2-no1": ["a", "b"]}
+    assert not manager.is_assigned("x")
+
+
+def test_set_order():
+    names = ["set3-no1", "set2-no10", "set1", "set2-no2", "custom"]
+    assert sorted(names, key=set_sort_key) == ["set1", "set2-no2", "set2-no10", "set3-no1", "custom"]
+
+
+def test_set_names(manager):
+    for paths in (["a", "b"], ["c", "d"], ["e", "f", "g"]):
+        manager.add_set(len(paths), paths)
+    manager.add_set(1, ["h"])
+    assert manager.set_names() == ["set1", "set2-no1", "set2-no2", "set3-no1"]
+    # Names set_sort_key() cannot parse are listed last, as they are.
+    manager._insert_name("custom")
+    assert manager.set_names()[-1] == "custom"
+
+
+def test_remove_from_set1_keeps_the_rest(manager):
+    manager.add_set(1, ["a", "b"])
+    manager.add_set(1, ["c"])
+    assert manager.remove_paths(["b", "unknown"]) == []
+    assert manager.sets == {"set1": ["a", "c"]}
+    assert not manager.is_assigned("b")
+
+
+def test_remove_dissolves_larger_sets(manager):
+    manager.add_set(2, ["a", "b"])
+    manager.add_set(3, ["c", "d", "e"])
+    manager.add_set(1, ["f"])
+    released = manager.remove_paths(["a", "d"])
+    assert sorted(released) == ["b", "c", "e"]
+    assert manager.sets == {"set1": ["f"]}
+    assert not any(manager.is_assigned(p) for p in "abcde")
+
+
+def test_undo_after_remove(manager):
+    manager.add_set(1, ["a", "b"])
+    manager.add_set(2, ["c", "d"])
+    manager.add_set(1, ["e", "f"])
+    manager.remove_paths(["c", "e"])
+    # The last batch lost "e", so only "f" is undone with it.
+    assert manager.undo_last_set() == ["f"]
+    assert manager.sets == {"set1": ["a", "b"]}
+    # set2-no1 was dissolved, so it is not in the history either.
+    assert manager.undo_last_set() == ["a", "b"]
+    assert manager.sets == {}
+    assert manager.undo_last_set() is None
+
+
+def test_undo_emptied_batch_is_skipped(manager):
+    manager.add_set(1, ["a"])
+    manager.add_set(1, ["b"])
+    manager.remove_paths(["b"])
+    assert manager.undo_last_set() == ["a"]
+    assert manager.sets == {}
+
+
+def test_numbers_are_reused_after_undo(manager):
+    manager.add_set(2, ["a", "b"])
+    manager.undo_last_set()
+    assert manager.add_set(2, ["a", "b"]) == "set2-no1"
+
+
+def test_change_positions(manager, changes):
+    manager.add_set(3, ["a", "b", "c"])
+    manager.add_set(2, ["d", "e"])
+    manager.add_set(1, ["f"])
+    manager.add_set(1, ["g"])
+    manager.add_set(2, ["h", "i"])
+    assert changes == [
+        SetChange("added", "set3-no1", 0, 3),
+        SetChange("added", "set2-no1", 0, 2),
+        SetChange("added", "set1", 0, 1),
+        SetChange("updated", "set1", 0, 2),
+        SetChange("added", "set2-no2", 2, 2),
+    ]
+    changes.clear()
+
+    manager.remove_paths(["d", "f"])
+    assert changes == [
+        SetChange("updated", "set1", 0, 1),
+        SetChange("removed", "set2-no1", 1, 0),
+    ]
+    changes.clear()
+
+    manager.undo_last_set()
+    manager.undo_last_set()
+    assert changes == [
+        SetChange("removed", "set2-no2", 1, 0),
+        SetChange("removed", "set1", 0, 0),
+    ]
+    assert manager.set_names() == ["set3-no1"]
+    changes.clear()
+
+    manager.reset()
+    assert changes == [SetChange("reset", "", 0, 0)]
+    assert manager.sets == {} and manager.set_names() == []
+
+
+def test_assigned_records():
+    records = {"a": "record a", "b": "record b", "c": "record c"}
+    manager = SetManager(records)
+    manager.add_set(2, ["a", "b"])
+    manager.add_set(1, ["unlisted"])
+    assert manager.assigned_records() == {"a": "record a", "b": "record b"}
+    # The mapping is shared, not copied.
+    records["unlisted"] = "record u"
+    assert manager.assigned_records()["unlisted"] == "record u"
@@ -0,0 +1,163 @@
+# AFWRename/tests/test_thumbnail_cache.py
+
+import random
+import sqlite3
+import zlib
+
+import pytest
+
+from core import thumbnail_cache
+from core.thumbnail_cache import ThumbnailCache
+from core.thumbnailer import Thumbnail
+
+SIZE = (128, 128)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Makes every access time one tick later than the last, so LRU order does not depend on the timer."""
+    ticks = iter(range(1, 1_000_000))
+    monkeypatch.setattr(thumbnail_cache.time, "time_ns", lambda: next(ticks))
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "cache" / "thumbnails.sqlite3"
+
+
+def open_cache(db_path) -> ThumbnailCache:
+    return ThumbnailCache(db_path, budget_bytes=3500, max_hashes=10)
+
+
+@pytest.fixture
+def cache(db_path, clock):
+    cache = open_cache(db_path)
+    yield cache
+    cache.close()
+
+
+def noise(n: int, seed: int = 0) -> Thumbnail:
+    """A thumbnail that zlib cannot compress, so each costs about `n` bytes."""
+    return Thumbnail(n // 4, 1, n, "RGBA", random.Random(seed).randbytes(n))
+
+
+def cached_paths(cache: ThumbnailCache) -> list[str]:
+    return sorted(row[0] for row in cache._conn.execute("SELECT path FROM thumbnails"))
+
+
+def test_round_trip(db_path):
+    data = bytes(range(256)) * 192
+    cache = open_cache(db_path)
+    cache.put("a.jpg", 100, 5, SIZE, Thumbnail(128, 128, 384, "RGB", data))
+    cache.close()
+
+    reopened = open_cache(db_path)
+    try:
+        thumb = reopened.get("a.jpg", 100, 5, SIZE)
+        assert (thumb.width, thumb.height, thumb.stride, thumb.mode, thumb.data) == (128, 128, 384, "RGB", data)
+        # Stored compressed.
+        (blob,) = reopened._conn.execute("SELECT data FROM thumbnails").fetchone()
+        assert zlib.decompress(blob) == data
+        assert reopened.total_bytes == len(blob) < len(data)
+    finally:
+        reopened.close()
+
+
+@pytest.mark.parametrize("file_size, mtime_ns", [(101, 5), (100, 6)])
+def test_stale_entry_is_dropped(cache, file_size, mtime_ns):
+    cache.put("a.jpg", 100, 5, SIZE, noise(1000))
+    cache.put("a.jpg", 100, 5, (64, 64), noise(500))
+    assert cache.get("a.jpg", file_size, mtime_ns, SIZE) is None
+    # The stale entry is deleted; the other size is checked on its own.
+    assert cache.get("a.jpg", 100, 5, SIZE) is None
+    assert cache.get("a.jpg", 100, 5, (64, 64)).data == noise(500).data
+    assert cache.total_bytes == len(zlib.compress(noise(500).data, 1))
+
+
+def test_put_replaces(cache):
+    cache.put("a.jpg", 100, 5, SIZE, noise(1000, seed=1))
+    cache.put("a.jpg", 200, 6, SIZE, noise(500, seed=2))
+    assert cache.get("a.jpg", 200, 6, SIZE).data == noise(500, seed=2).data
+    assert cache.total_bytes == len(zlib.compress(noise(500, seed=2).data, 1))
+
+
+def test_trims_least_recently_used(db_path, clock):
+    cache = open_cache(db_path)
+    for path in ("a", "b", "c"):
+        cache.put(path, 1, 1, SIZE, noise(1000))
+    cache.flush()
+    assert cached_paths(cache) == ["a", "b", "c"]
+    # Reading "a" makes "b" the least recently used once flushed.
+    assert cache.get("a", 1, 1, SIZE) is not None
+    cache.put("d", 1, 1, SIZE, noise(1000))
+    assert cached_paths(cache) == ["a", "b", "c", "d"]
+    cache.flush()
+    assert cached_paths(cache) == ["a", "c", "d"]
+    assert cache.total_bytes <= 3500 * thumbnail_cache.EVICT_TO_FRACTION
+    # The running total matches what is on disk.
+    total = cache.total_bytes
+    cache.close()
+    reopened = open_cache(db_path)
+    assert reopened.total_bytes == total
+    reopened.close()
+
+
+def test_trims_down_to_fraction(cache):
+    for path in ("a", "b", "c", "d"):
+        cache.put(path, 1, 1, SIZE, noise(800))
+    cache.flush()
+    cache.put("e", 1, 1, SIZE, noise(800))
+    cache.flush()
+    # Getting back under the budget would only need "a" to go.
+    assert cached_paths(cache) == ["c", "d", "e"]
+
+
+def test_hashes(cache):
+    cache.put_hash("a.jpg", 100, 5, 0xFFFF_0000_FFFF_0001)
+    cache.put_hash("b.jpg", 100, 5, 7)
+    assert cache.get_hash("a.jpg", 100, 5) == 0xFFFF_0000_FFFF_0001
+    assert cache.get_hash("b.jpg", 100, 5) == 7
+    assert cache.get_hash("a.jpg", 101, 5) is None
+    assert cache.get_hash("a.jpg", 100, 6) is None
+    assert cache.get_hash("c.jpg", 100, 5) is None
+    # Hashes do not count towards the thumbnail budget.
+    assert cache.total_bytes == 0
+
+
+def test_evicts_least_recently_used_hashes(cache):
+    for i in range(10):
+        cache.put_hash(f"{i}.jpg", 1, 1, i)
+    cache.flush()
+    assert cache.get_hash("0.jpg", 1, 1) == 0
+    cache.put_hash("new.jpg", 1, 1, 99)
+    cache.flush()
+    # Over max_hashes, so down to 9: the two least recently used go.
+    kept = sorted(row[0] for row in cache._conn.execute("SELECT path FROM phashes"))
+    assert kept == ["0.jpg"] + [f"{i}.jpg" for i in range(3, 10)] + ["new.jpg"]
+
+
+def test_old_hash_table_is_replaced(db_path):
+    db_path.parent.mkdir(parents=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("CREATE TABLE phashes (path TEXT PRIMARY KEY, file_size INTEGER, mtime_ns INTEGER, hash INTEGER)")
+    conn.execute("INSERT INTO phashes VALUES ('a.jpg', 1, 1, 5)")
+    conn.commit()
+    conn.close()
+    cache = ThumbnailCache(db_path)
+    try:
+        assert cache.get_hash("a.jpg", 1, 1) is None
+        cache.put_hash("a.jpg", 1, 1, 5)
+        assert cache.get_hash("a.jpg", 1, 1) == 5
+    finally:
+        cache.close()
+
+
+def test_clear(cache):
+    cache.put("a", 1, 1, SIZE, noise(1000))
+    cache.put_hash("a", 1, 1, 5)
+    cache.get("a", 1, 1, SIZE)
+    cache.clear()
+    cache.flush()
+    assert cache.total_bytes == 0
+    assert cache.get("a", 1, 1, SIZE) is None
+    assert cache.get_hash("a", 1, 1) is None
@@ -0,0 +1,74 @@
+# AFWRename/ui/folder_watcher.py
+
+from pathlib import Path
+
+from PySide6.QtCore import QElapsedTimer, QFileSystemWatcher, QObject, QTimer, Signal
+
+
+class FolderWatcher(QObject):
+    """
+    Watches folders for files being added, removed or renamed, and reports
+    each changed folder once things settle, so that copying thousands of
+    files in leads to one refresh rather than thousands. A steady stream of
+    changes is still reported at least every MAX_DELAY_MS.
+
+    Change notifications depend on the platform; folders on network shares
+    may not report changes made by other machines.
+    """
+
+    folder_changed = Signal(Path)
+
+    DEBOUNCE_MS = 400
+    MAX_DELAY_MS = 3000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._pending: set[str] = set()
+        self._suspended = False
+        self._first_change = QElapsedTimer()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE_MS)
+        self._timer.timeout.connect(self._flush)
+
+    def watch(self, folders: list[Path]):
+        """Watches exactly the given folders."""
+        wanted = {str(folder) for folder in folders}
+        current = set(self._watcher.directories())
+        if current - wanted:
+            self._watcher.removePaths(list(current - wanted))
+        if wanted - current:
+            self._watcher.addPaths(list(wanted - current))
+        self._pending &= wanted
+
+    def clear(self):
+        self.watch([])
+        self._timer.stop()
+
+    def suspend(self):
+        """Ignores changes, e.g. while the application renames files itself."""
+        self._suspended = True
+        self._pending.clear()
+        self._timer.stop()
+
+    def resume(self):
+        self._suspended = False
+
+    def _on_directory_changed(self, path: str):
+        if self._suspended:
+            return
+        if not self._pending:
+            self._first_change.start()
+        self._pending.add(path)
+        if self._first_change.elapsed() >= self.MAX_DELAY_MS:
+            self._flush()
+        else:
+            self._timer.start()
+
+    def _flush(self):
+        self._timer.stop()
+        pending, self._pending = self._pending, set()
+        for path in sorted(pending):
+            self.folder_changed.emit(Path(path))
@@ -1,88 +1,616 @@
 # AFWRename/ui/main_window.py
 
+import os
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
 from pathlib import Path
 
-from PIL import Image
-Image.MAX_IMAGE_PIXELS = None 
-
-import fitz  # PyMuPDF
-
-from PySide6.QtCore import Qt, QSize, QThread, QObject, Signal
-from PySide6.QtGui import QIcon, QPixmap, QShortcut, QKeySequence, QImage
+from PySide6.QtCore import Qt, QSize, QThread, QObject, QTimer, Signal
+from PySide6.QtGui import QPixmap, QShortcut, QKeySequence, QImage
 from PySide6.QtWidgets import (
-    QAbstractItemView, QApplication, QGroupBox, QHBoxLayout, QFileDialog,
-    QListWidget, QListWidgetItem, QMainWindow, QMessageBox, QPushButton,
-    QRadioButton, QVBoxLayout, QWidget, QLabel
+    QApplication, QGroupBox, QHBoxLayout, QFileDialog,
+    QListWidget, QMainWindow, QMessageBox, QProgressDialog, QPushButton,
+    QRadioButton, QVBoxLayout, QWidget, QLabel, QCheckBox
+)
+
+from core import instrumentation
+from core.exporter import ExportCancelledError, export_files, plan_export
+from core.folder_index import FolderIndex
+from core.scanner import FileRecord, diff_scan, scan_batches
+from core.session import SessionLog, restore_sets
+from core.set_manager import SetChange, SetManager
+from core.rename_engine import (
+    RenameBatchError, RenameCancelledError, RenameConflictError, RenameJournal, execute_plan,
+    find_incomplete_batches, last_undoable_batch, plan_renames, resume_batch, rollback_batch, undo_batch
+)
+from core.thumbnail_cache import ThumbnailCache
+from core.thumbnailer import (
+    DEFAULT_PROCESS_WORKERS, DEFAULT_WORKERS, MAX_DECODE_PIXELS, DecodeLimitError, Thumbnail, make_executor, make_thumbnail
 )
+from ui.folder_watcher import FolderWatcher
+from ui.thumbnail_grid import ThumbnailGrid, ThumbnailModel
+
 
-from core.set_manager import SetManager
-from core.renamer import rename_files
+def thumbnail_to_image(thumb: Thumbnail) -> QImage:
+    """
+    Wraps a thumbnail's pixels without copying them and converts the result to
+    the format QPixmap uses. The conversion is the only copy, and the QImage it
+    returns owns its pixels, so it stays valid once `thumb` is gone and
+    QPixmap.fromImage() on the GUI thread can share it as is.
+    """
+    if thumb.mode == "RGBA":
+        source, target = QImage.Format.Format_RGBA8888, QImage.Format.Format_ARGB32_Premultiplied
+    else:
+        source, target = QImage.Format.Format_RGB888, QImage.Format.Format_RGB32
+    return QImage(thumb.data, thumb.width, thumb.height, thumb.stride, source).convertToFormat(target)
 
 
 class ThumbnailWorker(QObject):
-    thumbnail_ready = Signal(str, str, QPixmap)
+    """
+    Long-running thumbnail loader for one primary folder. The grid tells it
+    which paths it currently wants via request(), in priority order; the worker
+    decodes those on a pool, skips anything already delivered, and cancels
+    queued work for paths that are no longer wanted. It runs until stop().
+
+    By default files are decoded in supervised processes (see
+    core.decode_pool), so a file that hangs, crashes the decoder or needs
+    too much memory costs at most one time limit. JPEGs among them are tried
+    once more at RETRY_SIZE, after other wanted files; files that still fail,
+    and other types, are reported through file_skipped as kept: they stay
+    selectable, under a placeholder.
+
+    Given an `executor`, such as the window's shared process pool, files are
+    decoded there and the pool is left running when the worker stops;
+    otherwise the worker starts a pool of its own.
+    """
+
+    # Lists of (path, QImage). QImage rather than QPixmap: pixmaps may only be
+    # created on the GUI thread.
+    thumbnails_ready = Signal(list)
     finished = Signal()
-    file_skipped = Signal(str, str)
+    # path, reason, and whether the file should be kept with a placeholder
+    # rather than removed as unreadable.
+    file_skipped = Signal(str, str, bool)
+
+    # Commit newly cached thumbnails after this many, so a crash loses little work.
+    CACHE_FLUSH_INTERVAL = 200
+
+    # Finished thumbnails are sent to the GUI in batches of up to BATCH_SIZE,
+    # or once the oldest one has waited BATCH_INTERVAL seconds.
+    BATCH_SIZE = 64
+    BATCH_INTERVAL = 0.03
+
+    # Size of the second attempt at a file that ran over a decode limit.
+    RETRY_SIZE = (128, 128)
+    # Only JPEGs are decoded at a reduced scale (see make_thumbnail), so only
+    # they can come in under a limit at a smaller size.
+    RETRY_SUFFIXES = frozenset({".jpg", ".jpeg"})
 
-    def __init__(self, paths_to_load: list[str], icon_size: QSize):
+    def __init__(
+        self,
+        icon_size: QSize,
+        max_workers: int | None = None,
+        use_processes: bool = True,
+        cache: ThumbnailCache | None = None,
+        batch_size: int | None = None,
+        batch_interval: float | None = None,
+        executor: Executor | None = None
+    ):
         super().__init__()
-        self.paths_to_load = paths_to_load
         self.thumbnail_size = (256, 256)
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.executor = executor
+        self.cache = cache
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.batch_interval = self.BATCH_INTERVAL if batch_interval is None else batch_interval
+        self.is_running = True
+        self._unflushed = 0
+        self._batch: list[tuple[str, QImage]] = []
+        self._batch_started = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._wanted: list[str] = []
+        self._delivered: set[str] = set()
+        self._records: dict[str, FileRecord] = {}
+        # Paths that ran over a decode limit at full size.
+        self._retry: set[str] = set()
+
+    def request(self, paths: list[str]):
+        """Replaces the set of wanted paths. Safe to call from the GUI thread."""
+        with self._lock:
+            self._wanted = list(paths)
+        self._wakeup.set()
+
+    def add_records(self, records: list[FileRecord]):
+        """Takes sizes and mtimes from a folder scan, saving a stat per cache lookup."""
+        with self._lock:
+            for record in records:
+                self._records[record.path] = record
+
+    def forget(self, paths):
+        """
+        Allows already delivered paths to be loaded again the next time they are
+        requested. They are dropped from the current request so that a budget
+        smaller than the screen cannot make the worker reload them in a loop.
+        """
+        paths = set(paths)
+        with self._lock:
+            self._delivered.difference_update(paths)
+            self._wanted = [p for p in self._wanted if p not in paths]
+            self._retry.difference_update(paths)
+
+    def run(self):
+        """
+        The main work of the thread. Cached thumbnails are ready straight away;
+        the rest are decoded on a pool and are ready as they complete, so results
+        arrive in no fixed order. Ready thumbnails are batched, see BATCH_SIZE.
+        """
+        executor = self.executor or make_executor(self.max_workers, self.use_processes)
+        workers = self.max_workers or getattr(self.executor, "max_workers", None)
+        if workers is None:
+            workers = DEFAULT_PROCESS_WORKERS if self.use_processes else DEFAULT_WORKERS
+        # Bound the number of queued files so a scroll does not leave a stale backlog behind.
+        max_in_flight = workers * 2
+        pending = {}
+        in_flight = {}
+        try:
+            while self.is_running:
+                self._wakeup.clear()
+                with self._lock:
+                    wanted = [p for p in self._wanted if p not in self._delivered]
+                    if self._retry:
+                        # Retries wait until other wanted files have been sent off.
+                        wanted.sort(key=self._retry.__contains__)
+
+                wanted_set = set(wanted)
+                for path_str, future in list(in_flight.items()):
+                    if path_str not in wanted_set and future.cancel():
+                        del in_flight[path_str]
+                        del pending[future]
+
+                for path_str in wanted:
+                    if not self.is_running or len(in_flight) >= max_in_flight:
+                        break
+                    if path_str in in_flight:
+                        continue
+                    stat_key = self._stat_key(path_str)
+                    if self._emit_cached(path_str, stat_key):
+                        self._mark_delivered(path_str)
+                        continue
+                    size = self.RETRY_SIZE if path_str in self._retry else self.thumbnail_size
+                    future = executor.submit(make_thumbnail, path_str, size, True, MAX_DECODE_PIXELS)
+                    pending[future] = (path_str, stat_key)
+                    in_flight[path_str] = future
+
+                if not pending:
+                    self._flush_batch()
+                    self._wakeup.wait(0.1)
+                    continue
+                done, _ = wait(pending, timeout=self._batch_timeout(0.05), return_when=FIRST_COMPLETED)
+                for future in done:
+                    path_str, stat_key = pending.pop(future)
+                    del in_flight[path_str]
+                    if self.is_running and self._emit_result(path_str, stat_key, future):
+                        self._mark_delivered(path_str)
+                if self._batch and time.monotonic() - self._batch_started >= self.batch_interval:
+                    self._flush_batch()
+        finally:
+            if self.is_running:
+                self._flush_batch()
+            if self.executor is None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                # The pool is shared; only this worker's queued files are dropped.
+                for future in pending:
+                    future.cancel()
+            if self.cache:
+                self.cache.flush()
+
+        self.finished.emit()
+
+    def _mark_delivered(self, path_str):
+        with self._lock:
+            self._delivered.add(path_str)
+
+    def _stat_key(self, path_str):
+        """Returns the (size, mtime) pair used to validate cache entries."""
+        if not self.cache:
+            return None
+        with self._lock:
+            known = self._records.get(path_str)
+        if known is not None:
+            return (known.size, known.mtime_ns)
+        try:
+            st = os.stat(path_str)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _emit_cached(self, path_str, stat_key):
+        if stat_key is None:
+            return False
+        with instrumentation.span("cache.get"):
+            thumb = self.cache.get(path_str, *stat_key, self.thumbnail_size)
+        if thumb is None:
+            instrumentation.count("cache.miss")
+            return False
+        instrumentation.count("cache.hit")
+        self._emit_thumbnail(path_str, thumb)
+        return True
+
+    def _emit_result(self, path_str, stat_key, future) -> bool:
+        """Hands on a decoded file; returns False if it is to be tried again."""
+        with self._lock:
+            retried = path_str in self._retry
+            self._retry.discard(path_str)
+        try:
+            thumb = future.result()
+            if thumb is not None and stat_key is not None:
+                # A retry's smaller thumbnail is cached for the full size too,
+                # so the file does not run into its limit again next time.
+                self.cache.put(path_str, *stat_key, self.thumbnail_size, thumb)
+                if thumb.phash is not None:
+                    # Saves decoding the file again if it has to be matched by content.
+                    self.cache.put_hash(path_str, *stat_key, thumb.phash)
+                self._unflushed += 1
+                if self._unflushed >= self.CACHE_FLUSH_INTERVAL:
+                    self.cache.flush()
+                    self._unflushed = 0
+            self._emit_thumbnail(path_str, thumb)
+
+        except DecodeLimitError as e:
+            if not retried and os.path.splitext(path_str)[1].lower() in self.RETRY_SUFFIXES:
+                with self._lock:
+                    self._retry.add(path_str)
+                return False
+            self.file_skipped.emit(path_str, f"No preview: {e}", True)
+        except Exception as e:
+            self.file_skipped.emit(path_str, f"Could not process file: {e}", False)
+        return True
+
+    def _emit_thumbnail(self, path_str, thumb):
+        image = None
+        if thumb is not None:
+            with instrumentation.span("convert"):
+                image = thumbnail_to_image(thumb)
+
+        if image is not None and not image.isNull():
+            instrumentation.flow_start("deliver", path_str)
+            if not self._batch:
+                self._batch_started = time.monotonic()
+            self._batch.append((path_str, image))
+            if len(self._batch) >= self.batch_size:
+                self._flush_batch()
+        else:
+            self.file_skipped.emit(path_str, "Could not generate a valid thumbnail.", False)
+
+    def _batch_timeout(self, timeout: float) -> float:
+        """Shortens a wait so that a waiting batch is not held past its interval."""
+        if not self._batch:
+            return timeout
+        return max(0.0, min(timeout, self._batch_started + self.batch_interval - time.monotonic()))
+
+    def _flush_batch(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            instrumentation.count("deliver.batches")
+            self.thumbnails_ready.emit(batch)
+
+    def stop(self):
+        self.is_running = False
+        self._wakeup.set()
+
+
+class ScanWorker(QObject):
+    """
+    Lists the primary folder off the GUI thread. Entries are handed over in
+    batches as they are found, so the grid fills in while a large or remote
+    folder is still being read. `completed` is only emitted once the whole
+    folder was listed, never after `failed` or stop().
+    """
+
+    files_found = Signal(list)
+    failed = Signal(str)
+    completed = Signal()
+    finished = Signal()
+
+    # Longest time found files are held back before being handed over, in seconds.
+    BATCH_DELAY = 0.1
+
+    def __init__(self, folder: Path):
+        super().__init__()
+        self.folder = folder
         self.is_running = True
 
     def run(self):
-        """The main work of the thread. Handles both images and PDFs."""
-        for path_str in self.paths_to_load:
+        try:
+            with instrumentation.span("scan"):
+                for batch in scan_batches(self.folder, max_delay=self.BATCH_DELAY):
+                    if not self.is_running:
+                        break
+                    instrumentation.count("scan.files", len(batch))
+                    self.files_found.emit(batch)
+        except OSError as e:
+            self.failed.emit(str(e))
+        else:
+            if self.is_running:
+                self.completed.emit()
+        self.finished.emit()
+
+    def stop(self):
+        self.is_running = False
+
+
+class IndexWorker(QObject):
+    """Builds the ID index of each synced folder off the GUI thread."""
+
+    indexed = Signal(Path, object)
+    failed = Signal(Path, str)
+    finished = Signal()
+
+    def __init__(self, folders: list[Path]):
+        super().__init__()
+        self.folders = list(folders)
+        self.is_running = True
+
+    def run(self):
+        for folder in self.folders:
             if not self.is_running:
                 break
-            
-            path = Path(path_str)
-            pixmap = None
-
             try:
-                if path.suffix.lower() == ".pdf":
-                    with fitz.open(path) as doc:
-                        if len(doc) > 0:
-                            # --- YOUR CORRECT FIX IS APPLIED HERE ---
-                            page = doc.load_page(0)  # type: ignore[attr-defined]
-                            fitz_pix = page.get_pixmap()
-                            q_image = QImage(fitz_pix.samples, fitz_pix.width, fitz_pix.height, fitz_pix.stride, QImage.Format.Format_RGB888)
-                            pixmap = QPixmap.fromImage(q_image)
-                else:
-                    with Image.open(path) as img:
-                        img.thumbnail(self.thumbnail_size, Image.Resampling.LANCZOS)
-                        img = img.convert("RGBA")
-                        q_image = QImage(img.tobytes("raw", "RGBA"), img.width, img.height, QImage.Format.Format_RGBA8888)
-                        pixmap = QPixmap.fromImage(q_image)
-
-                if pixmap and not pixmap.isNull():
-                    self.thumbnail_ready.emit(path_str, path.name, pixmap)
-                else:
-                    self.file_skipped.emit(path_str, "Could not generate a valid thumbnail.")
-
-            except Exception as e:
-                self.file_skipped.emit(path_str, f"Could not process file: {e}")
-                continue
-        
+                with instrumentation.span("index"):
+                    index = FolderIndex(folder)
+            except OSError as e:
+                self.failed.emit(folder, str(e))
+            else:
+                self.indexed.emit(folder, index)
         self.finished.emit()
 
     def stop(self):
         self.is_running = False
 
+
+class BatchWorker(QObject):
+    """
+    Base for workers that rename files off the GUI thread behind the
+    progress dialog. Progress is reported with throughput and an ETA.
+    """
+
+    # phase, files done in phase, phase total, throughput, ETA in seconds.
+    # Throughput is in files per second, or bytes per second while copying.
+    progress = Signal(str, int, int, float, float)
+    # files processed, skipped-file warnings, summary line
+    completed = Signal(int, list, str)
+    cancelled = Signal()
+    # message, whether a batch was left to resume or roll back
+    failed = Signal(str, bool)
+    finished = Signal()
+
+    # Minimum time between progress signals, in seconds.
+    PROGRESS_INTERVAL = 0.05
+
+    def __init__(self):
+        super().__init__()
+        self._cancel = threading.Event()
+        self._start = 0.0
+        self._last_emit = 0.0
+        self._total_files = 0
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _on_progress(self, phase, done, total):
+        # Called from the rename threads; throttled so the GUI event queue stays short.
+        now = time.perf_counter()
+        if done < total and now - self._last_emit < self.PROGRESS_INTERVAL:
+            return
+        self._last_emit = now
+        # Every file is renamed twice, once per phase.
+        steps_done = done + (self._total_files if phase == "committing" else 0)
+        elapsed = max(now - self._start, 1e-6)
+        steps_per_sec = steps_done / elapsed
+        eta = (2 * self._total_files - steps_done) / steps_per_sec if steps_per_sec else 0.0
+        self.progress.emit(phase, done, total, steps_per_sec / 2, eta)
+
+
+class ProcessWorker(BatchWorker):
+    """
+    Plans and applies a rename batch off the GUI thread, or exports renamed
+    copies when an output folder is given. cancel() stops the batch between
+    files, after which the files already renamed are rolled back, or the
+    copies removed. Files matched by content are only renamed once the user
+    agrees: confirm_matches is emitted and the worker waits for confirm().
+    """
+
+    # descriptions of the files matched by content
+    confirm_matches = Signal(list)
+
+    def __init__(
+        self, sets: dict, primary_folder: Path, synced_folders: list[Path],
+        output_dir: Path | None = None, folder_indexes: dict[Path, FolderIndex] | None = None,
+        match_content: bool = False, cache: ThumbnailCache | None = None,
+        records: dict[str, FileRecord] | None = None, executor: Executor | None = None
+    ):
+        super().__init__()
+        self.sets = {name: list(paths) for name, paths in sets.items()}
+        self.primary_folder = primary_folder
+        self.synced_folders = list(synced_folders)
+        self.output_dir = output_dir
+        self.folder_indexes = folder_indexes
+        self.match_content = match_content
+        self.cache = cache
+        # A copy, since the window's records change while the batch runs.
+        self.records = records
+        # Pool to decode files matched by content on, shared with the thumbnails.
+        self.executor = executor
+        self._answered = threading.Event()
+        self._confirmed = False
+
+    def run(self):
+        if self.output_dir is not None:
+            self.run_export()
+            return
+        try:
+            matcher = None
+            if self.match_content:
+                self.progress.emit("matching", 0, 0, 0.0, 0.0)
+                # Imported here since it loads NumPy.
+                from core.content_match import ContentMatcher
+                matcher = ContentMatcher(cache=self.cache, executor=self.executor)
+            plan = plan_renames(self.sets, self.primary_folder, self.synced_folders, self.folder_indexes, matcher, self.records)
+            if plan.conflicts:
+                raise RenameConflictError(plan.conflicts)
+            if plan.content_matches:
+                self.confirm_matches.emit(plan.content_matches)
+                self._answered.wait()
+                if not self._confirmed or self._cancel.is_set():
+                    self.cancelled.emit()
+                    self.finished.emit()
+                    return
+            self._total_files = len(plan)
+            self._start = time.perf_counter()
+            execute_plan(plan, progress=self._on_progress, cancel=self._cancel)
+            self.completed.emit(len(plan), plan.warnings, "")
+        except RenameCancelledError as e:
+            try:
+                rollback_batch(e.journal_path)
+                self.cancelled.emit()
+            except Exception as rollback_error:
+                self.failed.emit(f"Processing was cancelled, but rolling back failed:\n{rollback_error}", True)
+        except RenameConflictError as e:
+            self.failed.emit("Nothing was renamed because of these conflicts:\n" + "\n".join(e.conflicts), False)
+        except RenameBatchError as e:
+            self.failed.emit(f"An error occurred during processing:\n{e}", True)
+        except Exception as e:
+            self.failed.emit(f"An error occurred during processing:\n{e}", False)
+        self.finished.emit()
+
+    def run_export(self):
+        try:
+            plan = plan_export(self.sets, self.primary_folder, self.output_dir, self.records)
+            if plan.conflicts:
+                raise RenameConflictError(plan.conflicts)
+            self._start = time.perf_counter()
+            result = export_files(plan, progress=self._on_export_progress, cancel=self._cancel)
+            self.completed.emit(result.files, plan.warnings, result.summary())
+        except ExportCancelledError as e:
+            if e.errors:
+                self.failed.emit(str(e), False)
+            else:
+                self.cancelled.emit()
+        except RenameConflictError as e:
+            self.failed.emit("Nothing was exported because of these conflicts:\n" + "\n".join(e.conflicts), False)
+        except Exception as e:
+            self.failed.emit(f"An error occurred during export:\n{e}", False)
+        self.finished.emit()
+
+    def confirm(self, confirmed: bool):
+        """Answers confirm_matches; called from the GUI thread."""
+        self._confirmed = confirmed
+        self._answered.set()
+
+    def cancel(self):
+        super().cancel()
+        self._answered.set()
+
+    def _on_export_progress(self, files_done, total_files, bytes_done, total_bytes):
+        now = time.perf_counter()
+        if files_done < total_files and now - self._last_emit < self.PROGRESS_INTERVAL:
+            return
+        self._last_emit = now
+        bytes_per_sec = bytes_done / max(now - self._start, 1e-6)
+        eta = (total_bytes - bytes_done) / bytes_per_sec if bytes_per_sec else 0.0
+        self.progress.emit("copying", files_done, total_files, bytes_per_sec, eta)
+
+
+class JournalWorker(BatchWorker):
+    """
+    Resumes, rolls back or undoes journaled batches off the GUI thread.
+    `actions` pairs "resume", "rollback" or "undo" with a journal path and
+    is worked through in order. These cannot be cancelled part way.
+    """
+
+    def __init__(self, actions: list[tuple[str, Path]]):
+        super().__init__()
+        self.actions = list(actions)
+
+    def run(self):
+        action = None
+        try:
+            count = 0
+            for action, journal_path in self.actions:
+                self._total_files = len(RenameJournal.load(journal_path).ops)
+                self._start = time.perf_counter()
+                if action == "undo":
+                    undo_batch(journal_path, progress=self._on_progress)
+                elif action == "rollback":
+                    # Rolling back is a single pass without progress callbacks.
+                    self.progress.emit("rolling back", 0, 0, 0.0, 0.0)
+                    rollback_batch(journal_path)
+                else:
+                    resume_batch(journal_path, progress=self._on_progress)
+                count += self._total_files
+            summary = f"Restored {count} files." if action == "undo" else ""
+            self.completed.emit(count, [], summary)
+        except RenameConflictError as e:
+            self.failed.emit("Nothing was restored because of these conflicts:\n" + "\n".join(e.conflicts), False)
+        except Exception as e:
+            # The batch is still unfinished; an undo is a batch of its own.
+            if action == "undo":
+                self.failed.emit(f"An error occurred while undoing:\n{e}", True)
+            else:
+                self.failed.emit(f"Could not recover the interrupted run:\n{e}", True)
+        self.finished.emit()
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("AFWRename")
         self.setGeometry(100, 100, 1200, 800)
 
-        self.set_manager = SetManager()
+        # Scan record of every file in the primary folder, shared with the
+        # grid and the set manager; cleared rather than replaced.
+        self.records: dict[str, FileRecord] = {}
+        self.set_manager = SetManager(self.records)
+        self.session = None
         self.primary_folder = None
         self.synced_folders = []
         self.all_image_paths = []
+        self.skipped_paths = set()
+        self._skipped_pending = []
+        self._skip_timer = QTimer(self)
+        self._skip_timer.setSingleShot(True)
+        self._skip_timer.setInterval(50)
+        self._skip_timer.timeout.connect(self.remove_skipped_from_grid)
         self.thumbnail_thread = None
         self.thumbnail_worker = None
-        self.thumbnail_cache = {}
+        self._decode_pool = None
+        self.scan_thread = None
+        self.scan_worker = None
+        self.synced_indexes = {}
+        self.index_thread = None
+        self.index_worker = None
+        # Synced folders whose index is being rebuilt, and those to rebuild next.
+        self._indexing: set[Path] = set()
+        self._index_pending: set[Path] = set()
+        self._refresh_entries = []
+        self._refresh_pending = False
+        self.folder_watcher = FolderWatcher(self)
+        self.folder_watcher.folder_changed.connect(self.on_folder_changed)
+        self.process_thread = None
+        self.process_worker = None
+        self.progress_dialog = None
+        # What to do once the running batch worker's thread has finished.
+        self._reload_after_batch = False
+        self._recover_after_batch = False
+        # Set while a batch is left to resume or roll back. Its files may sit
+        # at temporary names, so the folders are not rescanned until then.
+        self._unfinished_batch = False
+        self.disk_cache = self.open_disk_cache()
         
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -107,15 +635,12 @@ class MainWindow(QMainWindow):
         self.folder_list_label.setWordWrap(True)
         main_layout.addWidget(self.folder_list_label)
 
-        self.image_grid = QListWidget()
-        self.image_grid.setViewMode(QListWidget.ViewMode.IconMode)
-        self.image_grid.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
-        self.image_grid.setResizeMode(QListWidget.ResizeMode.Adjust)
-        self.image_grid.setIconSize(QSize(128, 128))
-        self.image_grid.setGridSize(QSize(150, 150))
-        self.image_grid.setWordWrap(True)
+        self.grid_model = ThumbnailModel(self)
+        self.image_grid = ThumbnailGrid()
+        self.image_grid.setModel(self.grid_model)
+        self.image_grid.thumbnails_wanted.connect(self.request_thumbnails)
+        self.grid_model.thumbnails_evicted.connect(self.on_thumbnails_evicted)
         main_layout.addWidget(self.image_grid)
-        self.image_grid.setAcceptDrops(False)
 
         self.statusBar().showMessage("Ready")
         bottom_layout = QHBoxLayout()
@@ -145,6 +670,7 @@ class MainWindow(QMainWindow):
         preview_layout = QVBoxLayout(preview_group)
         self.set_preview_list = QListWidget()
         preview_layout.addWidget(self.set_preview_list)
+        self.set_manager.subscribe(self.on_set_changed)
         bottom_layout.addWidget(preview_group)
         
         output_group = QGroupBox("Output")
@@ -155,15 +681,30 @@ class MainWindow(QMainWindow):
         self.process_btn = QPushButton("Process and Rename")
         self.process_btn.setObjectName("process_btn")
         self.process_btn.clicked.connect(self.process_files)
+        self.undo_processing_btn = QPushButton("Undo Last Processing")
+        self.undo_processing_btn.clicked.connect(self.undo_last_processing)
+        self.match_content_check = QCheckBox("Match files without IDs by content")
+        self.match_content_check.setToolTip("Finds counterparts in the synced folders by their picture when the (N) ID is missing or was renamed away.")
         output_layout.addWidget(self.rename_inplace_radio)
         output_layout.addWidget(self.export_folder_radio)
+        output_layout.addWidget(self.match_content_check)
         output_layout.addStretch()
+        output_layout.addWidget(self.undo_processing_btn)
         output_layout.addWidget(self.process_btn)
         bottom_layout.addWidget(output_group)
         
         main_layout.addLayout(bottom_layout)
         self.setup_shortcuts()
         self.update_folder_ui_state()
+        QTimer.singleShot(0, self.recover_interrupted_batches)
+
+    def open_disk_cache(self):
+        """Opens the persistent thumbnail cache; thumbnails are still generated without it."""
+        try:
+            return ThumbnailCache()
+        except Exception as e:
+            print(f"Warning: Thumbnail cache unavailable: {e}")
+            return None
 
     def select_primary_folder(self):
         self.clear_folders()
@@ -191,15 +732,30 @@ class MainWindow(QMainWindow):
                 break
         if folders_added > 0:
             self.update_folder_ui_state()
+            self.watch_folders()
+            if self.session:
+                self.session.record_synced(self.synced_folders)
             
     def clear_folders(self):
+        # The session stays on disk and is offered again when the folder is reopened.
+        if self.session:
+            self.session.close()
+            self.session = None
         self.primary_folder = None
         self.synced_folders.clear()
         self.all_image_paths.clear()
-        self.thumbnail_cache.clear()
-        self.image_grid.clear()
+        self.skipped_paths.clear()
+        self._skipped_pending.clear()
+        self.records.clear()
+        self.synced_indexes.clear()
+        self._index_pending.clear()
+        self._refresh_pending = False
+        self.folder_watcher.clear()
+        self.stop_scan_worker()
+        self.stop_index_worker()
+        self.stop_thumbnail_worker()
+        self.grid_model.clear()
         self.set_manager.reset()
-        self.update_set_preview()
         self.update_folder_ui_state()
 
     def update_folder_ui_state(self):
@@ -207,6 +763,8 @@ class MainWindow(QMainWindow):
         self.select_synced_btn.setEnabled(has_primary)
         self.clear_folders_btn.setEnabled(has_primary)
         self.export_folder_radio.setEnabled(not self.synced_folders)
+        # Only synced folders have counterparts to match.
+        self.match_content_check.setEnabled(bool(self.synced_folders))
         if self.synced_folders:
             self.rename_inplace_radio.setChecked(True)
         if not self.primary_folder:
@@ -221,30 +779,304 @@ class MainWindow(QMainWindow):
         self.folder_list_label.setText(html)
 
     def load_images_from_primary(self):
+        """Lists the primary folder in the background, filling the grid as files are found."""
+        if not self.primary_folder: return
+        self.stop_scan_worker()
+        self.all_image_paths = []
+        self.records.clear()
+        self.grid_model.set_paths([], self.records)
+        self.start_thumbnail_worker()
+        self.start_scan_worker(self.on_files_found, self.on_scan_completed)
+        self.statusBar().showMessage("Listing files...")
+
+    def start_scan_worker(self, on_found, on_completed, on_failed=None):
+        self.scan_thread = QThread()
+        self.scan_worker = ScanWorker(self.primary_folder)
+        self.scan_worker.moveToThread(self.scan_thread)
+        self.scan_thread.started.connect(self.scan_worker.run)
+        self.scan_worker.finished.connect(self.scan_thread.quit)
+        self.scan_worker.finished.connect(self.scan_worker.deleteLater)
+        self.scan_thread.finished.connect(self.scan_thread.deleteLater)
+        self.scan_thread.finished.connect(self.on_scan_finished)
+        self.scan_worker.files_found.connect(on_found)
+        self.scan_worker.failed.connect(on_failed or self.on_scan_failed)
+        self.scan_worker.completed.connect(on_completed)
+        self.scan_thread.start()
+
+    def stop_scan_worker(self):
+        if self.scan_worker is None: return
+        self.scan_worker.stop()
+        self.scan_thread.quit()
+        self.scan_thread.wait()
+        self.scan_worker = None
+        self.scan_thread = None
+
+    def on_files_found(self, records):
+        paths = [record.path for record in records]
+        for record in records:
+            self.records[record.path] = record
+        self.all_image_paths.extend(paths)
+        if self.thumbnail_worker is not None:
+            self.thumbnail_worker.add_records(records)
+        self.grid_model.insert_paths([p for p in paths if p not in self.skipped_paths])
+
+    def on_scan_failed(self, message):
+        QMessageBox.critical(self, "Error", f"Could not read the primary folder:\n{message}")
+
+    def on_scan_finished(self):
+        # Ignore a stopped scan whose thread ends after a new one was started.
+        if self.sender() is self.scan_thread:
+            self.scan_worker = None
+            self.scan_thread = None
+            if self._refresh_pending:
+                self._refresh_pending = False
+                self.refresh_primary()
+
+    def on_scan_completed(self):
+        records = self.records
+        self.all_image_paths.sort(key=lambda p: (records[p].sort_key, p))
+        self.open_session()
+        self.watch_folders()
+        self.statusBar().showMessage(f"Loaded {len(self.all_image_paths)} files", 3000)
+
+    def watch_folders(self):
+        """Watches the open folders for changes and keeps an ID index of each synced folder."""
+        folders = ([self.primary_folder] if self.primary_folder else []) + self.synced_folders
+        self.folder_watcher.watch(folders)
+        for folder in list(self.synced_indexes):
+            if folder not in self.synced_folders:
+                del self.synced_indexes[folder]
+        self.index_synced_folders([f for f in self.synced_folders if f not in self.synced_indexes])
+
+    def index_synced_folders(self, folders: list[Path]):
+        """Rebuilds the ID index of the given synced folders in the background."""
+        self._index_pending.update(folders)
+        if self.index_worker is not None or not self._index_pending: return
+        self._indexing, self._index_pending = self._index_pending, set()
+        self.index_thread = QThread()
+        self.index_worker = IndexWorker(sorted(self._indexing))
+        self.index_worker.moveToThread(self.index_thread)
+        self.index_thread.started.connect(self.index_worker.run)
+        self.index_worker.finished.connect(self.index_thread.quit)
+        self.index_worker.finished.connect(self.index_worker.deleteLater)
+        self.index_thread.finished.connect(self.index_thread.deleteLater)
+        self.index_thread.finished.connect(self.on_index_finished)
+        self.index_worker.indexed.connect(self.on_folder_indexed)
+        self.index_worker.failed.connect(self.on_index_failed)
+        self.index_thread.start()
+
+    def stop_index_worker(self):
+        if self.index_worker is None: return
+        self.index_worker.stop()
+        self.index_thread.quit()
+        self.index_thread.wait()
+        self.index_worker = None
+        self.index_thread = None
+        self._indexing = set()
+
+    def on_folder_indexed(self, folder: Path, index: FolderIndex):
+        # The folder may have been closed while it was being indexed.
+        if folder in self.synced_folders:
+            self.synced_indexes[folder] = index
+
+    def on_index_failed(self, folder: Path, message: str):
+        # Processing scans the folder itself when it has no index.
+        self.synced_indexes.pop(folder, None)
+        print(f"Warning: Could not index '{folder}': {message}")
+
+    def on_index_finished(self):
+        # Ignore a stopped worker whose thread ends after a new one was started.
+        if self.sender() is not self.index_thread: return
+        self.index_worker = None
+        self.index_thread = None
+        self._indexing = set()
+        self._index_pending.intersection_update(self.synced_folders)
+        self.index_synced_folders([])
+
+    def on_folder_changed(self, folder: Path):
+        if self._unfinished_batch: return
+        if folder == self.primary_folder:
+            self.refresh_primary()
+        elif folder in self.synced_folders:
+            self.index_synced_folders([folder])
+
+    def refresh_primary(self):
+        """Rescans the primary folder and applies only what changed to the grid and the sets."""
         if not self.primary_folder: return
-        image_paths = sorted([str(f) for f in self.primary_folder.iterdir() if self.is_supported_file(f)])
-        self.all_image_paths = image_paths
-        self.load_images_async(self.all_image_paths)
+        if self.scan_worker is not None:
+            self._refresh_pending = True
+            return
+        self._refresh_entries = []
+        self.start_scan_worker(self.on_refresh_files_found, self.on_refresh_completed, self.on_refresh_failed)
+
+    def on_refresh_files_found(self, entries):
+        self._refresh_entries.extend(entries)
+
+    def on_refresh_failed(self, message):
+        # A partial listing says nothing about which files are gone; the grid,
+        # the sets and the session are left as they were.
+        self._refresh_entries = []
+        QMessageBox.warning(self, "Warning", f"Could not rescan the primary folder, so it was left as it was:\n{message}")
+
+    def on_refresh_completed(self):
+        entries, self._refresh_entries = self._refresh_entries, []
+        diff = diff_scan(self.records, entries)
+
+        if diff.removed:
+            removed = set(diff.removed)
+            # Rows are located by their record, so they must leave the grid first.
+            self.grid_model.remove_paths(diff.removed)
+            for path_str in diff.removed:
+                self.grid_model.thumbnails.pop(path_str)
+                self.records.pop(path_str, None)
+                self.skipped_paths.discard(path_str)
+            self.all_image_paths = [p for p in self.all_image_paths if p not in removed]
+            if any(self.set_manager.is_assigned(p) for p in diff.removed):
+                released = self.set_manager.remove_paths(removed)
+                if self.session:
+                    self.session.record_remove(diff.removed)
+                self.grid_model.insert_paths(released)
+
+        if diff.added:
+            for entry in diff.added:
+                self.records[entry.path] = entry
+            records = self.records
+            self.all_image_paths.extend(entry.path for entry in diff.added)
+            self.all_image_paths.sort(key=lambda p: (records[p].sort_key, p))
+            self.grid_model.insert_paths([entry.path for entry in diff.added])
+
+        if diff.changed:
+            paths = [entry.path for entry in diff.changed]
+            for entry in diff.changed:
+                self.records[entry.path] = entry
+            # A file that failed to load before may load now.
+            retry = [p for p in paths if p in self.skipped_paths]
+            self.skipped_paths.difference_update(retry)
+            self.grid_model.insert_paths(retry)
+            self.grid_model.invalidate_thumbnails(paths)
+
+        if self.thumbnail_worker is not None:
+            self.thumbnail_worker.add_records(diff.added + diff.changed)
+            self.thumbnail_worker.forget([entry.path for entry in diff.changed])
+        self.image_grid.schedule_request()
+        if diff.added or diff.removed or diff.changed:
+            self.statusBar().showMessage(
+                f"Folder updated: {len(diff.added)} added, {len(diff.removed)} removed, {len(diff.changed)} changed", 5000
+            )
+
+    def open_session(self):
+        """Offers to resume the sets saved for this folder, then keeps saving new ones."""
+        self.session = None
+        if not self.records:
+            # Nothing was listed, e.g. a share that is not mounted yet. Every
+            # saved file would look missing, so the session is left alone.
+            return
+        session = SessionLog(self.primary_folder)
+        try:
+            restored = session.load(self.records) if session.exists() else None
+        except OSError as e:
+            print(f"Warning: Could not read the saved session, so new sets will not be saved: {e}")
+            return
+        if restored is not None and (restored.groups or restored.missing):
+            box = QMessageBox(self)
+            box.setIcon(QMessageBox.Icon.Question)
+            box.setWindowTitle("Resume Session")
+            resume_btn = None
+            if restored.groups:
+                count = sum(len(paths) for _, paths, _ in restored.groups)
+                text = f"A previous session assigned {count} files in this folder to sets. Resume it?"
+                if restored.missing:
+                    text += f"\n\n{len(restored.missing)} files from it are no longer in the folder and will be left out."
+                resume_btn = box.addButton("Resume", QMessageBox.ButtonRole.AcceptRole)
+            else:
+                text = (f"A previous session assigned {len(restored.missing)} files to sets, "
+                        "but none of them are in this folder any more. Discard it?")
+            discard_btn = box.addButton("Discard", QMessageBox.ButtonRole.DestructiveRole)
+            box.addButton("Keep for Later", QMessageBox.ButtonRole.RejectRole)
+            box.setText(text)
+            box.exec()
+            clicked = box.clickedButton()
+            if resume_btn is not None and clicked == resume_btn:
+                restore_sets(self.set_manager, restored)
+                self.grid_model.remove_paths([p for _, paths, _ in restored.groups for p in paths])
+                self.synced_folders = [f for f in restored.synced_folders if f != self.primary_folder]
+                self.update_folder_ui_state()
+            elif clicked == discard_btn:
+                restored = None
+            else:
+                # The saved session stays as it is; sets assigned now are not saved.
+                self.statusBar().showMessage("Previous session kept; new sets will not be saved.", 5000)
+                return
+        else:
+            restored = None
+        session.start(restored)
+        self.session = session
     
     def load_images_async(self, image_paths: list[str]):
+        """Fills the grid at once; thumbnails are loaded as rows come into view."""
+        is_assigned = self.set_manager.is_assigned
+        image_paths = [p for p in image_paths if p not in self.skipped_paths and not is_assigned(p)]
+        self.grid_model.set_paths(image_paths, self.records)
         if not image_paths: return
-        self.select_primary_btn.setEnabled(False)
-        self.select_synced_btn.setEnabled(False)
-        self.clear_folders_btn.setEnabled(False)
-        self.statusBar().showMessage(f"Loading {len(image_paths)} files...")
+        self.start_thumbnail_worker()
+        self.statusBar().showMessage(f"Loaded {len(image_paths)} files", 3000)
+
+    def start_thumbnail_worker(self):
+        if self.thumbnail_worker is not None: return
         self.thumbnail_thread = QThread()
-        self.thumbnail_worker = ThumbnailWorker(image_paths, self.image_grid.iconSize())
+        self.thumbnail_worker = ThumbnailWorker(self.image_grid.iconSize(), cache=self.disk_cache, executor=self.decode_pool())
+        self.thumbnail_worker.add_records(list(self.records.values()))
         self.thumbnail_worker.moveToThread(self.thumbnail_thread)
         self.thumbnail_thread.started.connect(self.thumbnail_worker.run)
         self.thumbnail_worker.finished.connect(self.thumbnail_thread.quit)
         self.thumbnail_worker.finished.connect(self.thumbnail_worker.deleteLater)
         self.thumbnail_thread.finished.connect(self.thumbnail_thread.deleteLater)
-        self.thumbnail_worker.thumbnail_ready.connect(self.add_thumbnail_to_grid)
+        self.thumbnail_worker.thumbnails_ready.connect(self.add_thumbnails_to_grid)
         self.thumbnail_worker.file_skipped.connect(self.on_file_skipped)
-        self.thumbnail_thread.finished.connect(lambda: self.select_primary_btn.setEnabled(True))
-        self.thumbnail_thread.finished.connect(lambda: self.update_folder_ui_state())
-        self.thumbnail_thread.finished.connect(lambda: self.statusBar().showMessage("Ready", 3000))
         self.thumbnail_thread.start()
+        self.image_grid.schedule_request()
+
+    def decode_pool(self) -> Executor:
+        """The decoder processes shared by thumbnails and content matching, started on first use."""
+        if self._decode_pool is None:
+            self._decode_pool = make_executor(use_processes=True)
+        return self._decode_pool
+
+    def stop_thumbnail_worker(self):
+        """Stops the current worker and waits for its thread to exit."""
+        if self.thumbnail_worker is None: return
+        self.thumbnail_worker.stop()
+        self.thumbnail_thread.quit()
+        self.thumbnail_thread.wait()
+        self.thumbnail_worker = None
+        self.thumbnail_thread = None
+
+    def request_thumbnails(self, paths: list[str]):
+        if self.thumbnail_worker is not None:
+            self.thumbnail_worker.request(paths)
+
+    def on_thumbnails_evicted(self, paths: list[str]):
+        """Lets evicted thumbnails be loaded again, from the disk cache if possible."""
+        if self.thumbnail_worker is not None:
+            self.thumbnail_worker.forget(paths)
+
+    def closeEvent(self, event):
+        if self.process_worker is not None:
+            # Let the batch stop at a safe point; it is rolled back before the thread exits.
+            self.process_worker.cancel()
+            self.process_thread.quit()
+            self.process_thread.wait()
+        self.stop_scan_worker()
+        self.stop_index_worker()
+        self.stop_thumbnail_worker()
+        if self._decode_pool is not None:
+            self._decode_pool.shutdown(wait=False, cancel_futures=True)
+            self._decode_pool = None
+        if self.session:
+            self.session.close()
+        if self.disk_cache:
+            self.disk_cache.close()
+        super().closeEvent(event)
 
     def process_files(self):
         if not self.primary_folder:
@@ -258,20 +1090,214 @@ class MainWindow(QMainWindow):
         if not self.synced_folders and self.export_folder_radio.isChecked():
             output_dir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
             if not output_dir: return
-        try:
-            renamed_files = rename_files(sets, self.primary_folder, self.synced_folders, output_dir)
-            QMessageBox.information(self, "Success", f"Successfully processed {len(renamed_files)} files.")
-            self.clear_folders()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred during processing:\n{e}")
+        self.start_processing(output_dir)
+
+    def start_processing(self, output_dir: str | None = None):
+        """Runs the rename batch on a background thread behind a progress dialog."""
+        # Indexes still being rebuilt may be out of date; the planner scans those folders itself.
+        stale = self._indexing | self._index_pending
+        indexes = {folder: index for folder, index in self.synced_indexes.items() if folder not in stale}
+        worker = ProcessWorker(
+            self.set_manager.get_all_sets(), self.primary_folder, self.synced_folders,
+            Path(output_dir) if output_dir else None, indexes,
+            self.match_content_check.isChecked(), self.disk_cache, self.set_manager.assigned_records(),
+            self.decode_pool() if self.match_content_check.isChecked() else None
+        )
+        worker.confirm_matches.connect(self.on_confirm_matches)
+        self.run_batch_worker(worker, "Planning renames...", self.on_processing_completed)
+
+    def run_batch_worker(self, worker: BatchWorker, label: str, on_completed, cancellable: bool = True):
+        """Runs a batch worker on the processing thread behind a modal progress dialog."""
+        self.process_btn.setEnabled(False)
+        self.undo_processing_btn.setEnabled(False)
+        self.progress_dialog = QProgressDialog(label, "Cancel", 0, 0, self)
+        self.progress_dialog.setWindowTitle("Processing")
+        self.progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress_dialog.setMinimumDuration(0)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setAutoReset(False)
+        if not cancellable:
+            self.progress_dialog.setCancelButton(None)
+        self.process_thread = QThread()
+        # The application's own renames should not trigger refreshes.
+        self.folder_watcher.suspend()
+        self.process_worker = worker
+        self.process_worker.moveToThread(self.process_thread)
+        self.process_thread.started.connect(self.process_worker.run)
+        self.process_worker.finished.connect(self.process_thread.quit)
+        self.process_worker.finished.connect(self.process_worker.deleteLater)
+        self.process_thread.finished.connect(self.process_thread.deleteLater)
+        self.process_thread.finished.connect(self.on_processing_finished)
+        self.process_worker.progress.connect(self.on_processing_progress)
+        self.process_worker.completed.connect(on_completed)
+        self.process_worker.cancelled.connect(self.on_processing_cancelled)
+        self.process_worker.failed.connect(self.on_processing_failed)
+        if cancellable:
+            self.progress_dialog.canceled.connect(self.cancel_processing)
+        self.process_thread.start()
+
+    def on_confirm_matches(self, matches):
+        if self.process_worker is None: return
+        box = QMessageBox(self)
+        box.setIcon(QMessageBox.Icon.Question)
+        box.setWindowTitle("Confirm Matches")
+        box.setText(f"{len(matches)} files in the synced folders were matched by their picture rather than their ID. "
+                    "Rename them together with the rest?\n\nChoose No to rename nothing; see details for the matches.")
+        box.setDetailedText("\n".join(matches))
+        box.setStandardButtons(QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        box.setDefaultButton(QMessageBox.StandardButton.No)
+        confirmed = box.exec() == QMessageBox.StandardButton.Yes
+        if self.process_worker is not None:
+            self.process_worker.confirm(confirmed)
+
+    def cancel_processing(self):
+        if self.process_worker is not None:
+            self.process_worker.cancel()
+        if self.progress_dialog is not None:
+            self.progress_dialog.setLabelText("Cancelling...")
+
+    def on_processing_progress(self, phase, done, total, rate, eta):
+        dialog = self.progress_dialog
+        if dialog is None: return
+        if phase == "matching":
+            dialog.setLabelText("Matching files by content...")
+            return
+        if phase == "rolling back":
+            dialog.setLabelText("Rolling back the interrupted run...")
+            return
+        if phase == "copying":
+            dialog.setLabelText(f"Exporting {done} of {total} files\n{rate / 1e6:.0f} MB/s, about {eta:.0f}s left")
+        else:
+            step = "Preparing" if phase == "staging" else "Renaming"
+            dialog.setLabelText(f"{step} {done} of {total} files\n{rate:.0f} files/s, about {eta:.0f}s left")
+        dialog.setMaximum(total)
+        # setValue() on a modal dialog processes events, during which the run
+        # may finish and the dialog be closed; nothing may touch it afterwards.
+        dialog.setValue(done)
+
+    def on_processing_completed(self, count, warnings, summary):
+        self.close_progress_dialog()
+        box = QMessageBox(self)
+        box.setIcon(QMessageBox.Icon.Information if not warnings else QMessageBox.Icon.Warning)
+        box.setWindowTitle("Success")
+        text = f"Successfully processed {count} files."
+        if summary:
+            text += f"\n{summary}"
+        if warnings:
+            text += f"\n{len(warnings)} files were skipped or matched by content; see details."
+            box.setDetailedText("\n".join(warnings))
+        box.setText(text)
+        box.exec()
+        if self.session:
+            self.session.discard()
+            self.session = None
+        self.clear_folders()
+
+    def on_processing_cancelled(self):
+        self.close_progress_dialog()
+        QMessageBox.information(self, "Cancelled", "Processing was cancelled. No files were changed.")
+
+    def on_processing_failed(self, message, recoverable):
+        self.close_progress_dialog()
+        QMessageBox.critical(self, "Error", message)
+        if recoverable:
+            self._unfinished_batch = True
+            # Offered once the worker's thread is done, since recovery runs on it too.
+            self._recover_after_batch = True
+
+    def on_batch_recovered(self, count, warnings, summary):
+        self.close_progress_dialog()
+        if summary:
+            QMessageBox.information(self, "Success", summary)
+        self._reload_after_batch = True
+
+    def on_processing_finished(self):
+        self.process_worker = None
+        self.process_thread = None
+        self.close_progress_dialog()
+        self.process_btn.setEnabled(True)
+        self.undo_processing_btn.setEnabled(True)
+        reload, self._reload_after_batch = self._reload_after_batch, False
+        if self._recover_after_batch:
+            self._recover_after_batch = False
+            self.recover_interrupted_batches()
+            if self.process_thread is not None:
+                # Recovery is running; this is called again once it is done.
+                return
+        if self._unfinished_batch:
+            # The folder watcher stays suspended as well.
+            self.statusBar().showMessage("Folders are not refreshed until the interrupted run is resumed or rolled back.")
+            return
+        self.folder_watcher.resume()
+        if reload:
+            self.reload_folders()
+        elif self.primary_folder:
+            # A cancelled run may have left the folders changed.
+            self.refresh_primary()
+            self.index_synced_folders(self.synced_folders)
+
+    def close_progress_dialog(self):
+        if self.progress_dialog is not None:
+            self.progress_dialog.close()
+            self.progress_dialog.deleteLater()
+            self.progress_dialog = None
+
+    def recover_interrupted_batches(self):
+        """Offers to finish or revert any processing run that did not complete."""
+        if self.process_thread is not None: return
+        actions = []
+        deferred = False
+        for journal_path in find_incomplete_batches():
+            try:
+                journal = RenameJournal.load(journal_path)
+            except (OSError, ValueError):
+                continue
+            box = QMessageBox(self)
+            box.setIcon(QMessageBox.Icon.Warning)
+            box.setWindowTitle("Interrupted Processing")
+            box.setText(f"A processing run of {len(journal.ops)} renames did not finish.\n"
+                        "Resume it, or roll back the files it already renamed?")
+            resume_btn = box.addButton("Resume", QMessageBox.ButtonRole.AcceptRole)
+            rollback_btn = box.addButton("Roll Back", QMessageBox.ButtonRole.DestructiveRole)
+            box.addButton("Later", QMessageBox.ButtonRole.RejectRole)
+            box.exec()
+            if box.clickedButton() == resume_btn:
+                actions.append(("resume", journal_path))
+            elif box.clickedButton() == rollback_btn:
+                actions.append(("rollback", journal_path))
+            else:
+                deferred = True
+        self._unfinished_batch = deferred
+        if actions:
+            self.run_batch_worker(JournalWorker(actions), "Recovering...", self.on_batch_recovered, cancellable=False)
+
+    def undo_last_processing(self):
+        if self.process_thread is not None: return
+        journal_path = last_undoable_batch()
+        if journal_path is None:
+            QMessageBox.information(self, "Information", "There is no processing run to undo.")
+            return
+        journal = RenameJournal.load(journal_path)
+        reply = QMessageBox.question(self, "Confirm Undo", f"Restore the original names of the {len(journal.ops)} files renamed by the last processing run?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes: return
+        self.run_batch_worker(JournalWorker([("undo", journal_path)]), "Restoring names...", self.on_batch_recovered, cancellable=False)
+
+    def reload_folders(self):
+        """Rescans the open folders after their contents were renamed."""
+        if not self.primary_folder: return
+        primary, synced = self.primary_folder, list(self.synced_folders)
+        self.clear_folders()
+        self.primary_folder, self.synced_folders = primary, synced
+        self.update_folder_ui_state()
+        self.load_images_from_primary()
 
     def reset_all(self):
         if not self.primary_folder: return
         reply = QMessageBox.question(self, "Confirm Reset", "Clear all sets and selections?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             self.set_manager.reset()
-            self.update_set_preview()
-            self.image_grid.clear()
+            if self.session:
+                self.session.record_reset()
             self.load_images_async(self.all_image_paths)
             
     def setup_shortcuts(self):
@@ -280,59 +1306,67 @@ class MainWindow(QMainWindow):
         QShortcut(QKeySequence("Ctrl+3"), self).activated.connect(lambda: self.assign_to_set(3))
         QShortcut(QKeySequence.StandardKey.Undo, self).activated.connect(self.undo_last)
         
-    def on_file_skipped(self, path, reason):
+    def on_file_skipped(self, path, reason, keep):
         self.statusBar().showMessage(f"Skipped {Path(path).name}: {reason}", 5000)
+        if keep:
+            # Readable, only too costly to preview; it can still be put in a set.
+            self.grid_model.mark_unavailable(path, reason)
+            return
+        # Files that cannot be read at all leave the grid.
+        self.skipped_paths.add(path)
+        self._skipped_pending.append(path)
+        self._skip_timer.start()
+
+    def remove_skipped_from_grid(self):
+        self.grid_model.remove_paths(self._skipped_pending)
+        self._skipped_pending.clear()
         
-    def add_thumbnail_to_grid(self, path_str, name, pixmap):
-        self.thumbnail_cache[path_str] = pixmap
-        item = QListWidgetItem(QIcon(pixmap), name)
-        item.setData(Qt.ItemDataRole.UserRole, path_str)
-        self.image_grid.addItem(item)
+    def add_thumbnails_to_grid(self, batch):
+        pixmaps = []
+        for path_str, image in batch:
+            instrumentation.flow_end("deliver", path_str)
+            with instrumentation.span("pixmap"):
+                pixmaps.append((path_str, QPixmap.fromImage(image)))
+        self.grid_model.set_thumbnails(pixmaps)
         
     def assign_to_set(self, set_size: int):
-        selected_items = self.image_grid.selectedItems()
-        if not selected_items: return
-        if set_size > 1 and len(selected_items) != set_size:
+        if self.session is None and self.scan_worker is not None:
+            # A saved session may still be restored once the listing completes.
+            self.statusBar().showMessage("Still listing files; sets can be assigned once it finishes.", 3000)
+            return
+        image_paths = self.image_grid.selected_paths()
+        if not image_paths: return
+        if set_size > 1 and len(image_paths) != set_size:
             QMessageBox.warning(self, "Warning", f"You must select exactly {set_size} files.")
             return
-        image_paths = [item.data(Qt.ItemDataRole.UserRole) for item in selected_items]
-        if self.set_manager.add_set(set_size, image_paths):
-            for item in selected_items:
-                self.image_grid.takeItem(self.image_grid.row(item))
-            self.update_set_preview()
+        set_name = self.set_manager.add_set(set_size, image_paths)
+        if set_name:
+            if self.session:
+                self.session.record_add(set_size, image_paths, set_name)
+            self.grid_model.remove_paths(image_paths)
             
     def undo_last(self):
         undone_images = self.set_manager.undo_last_set()
         if not undone_images: return
-        all_visible_paths = {self.image_grid.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.image_grid.count())}
-        all_visible_paths.update(undone_images)
-        sorted_paths = [p for p in self.all_image_paths if p in all_visible_paths]
-        self.image_grid.setUpdatesEnabled(False)
-        self.image_grid.clear()
-        for path_str in sorted_paths:
-            pixmap = self.thumbnail_cache.get(path_str)
-            if pixmap: self.add_thumbnail_to_grid(path_str, Path(path_str).name, pixmap)
-        self.image_grid.setUpdatesEnabled(True)
-        self.update_set_preview()
-        for i in range(self.image_grid.count()):
-            item = self.image_grid.item(i)
-            if item.data(Qt.ItemDataRole.UserRole) in undone_images:
-                item.setSelected(True)
+        if self.session:
+            self.session.record_undo()
+        self.grid_model.insert_paths(undone_images)
+        self.image_grid.select_paths(undone_images)
+        first_row = self.grid_model.row_of(undone_images[0])
+        if first_row is not None:
+            self.image_grid.scrollTo(self.grid_model.index(first_row))
         self.image_grid.setFocus()
         
-    def is_supported_file(self, path: Path):
-        """Checks if the file is a supported image or a PDF."""
-        return path.is_file() and path.suffix.lower() in [".png", ".jpg", ".jpeg", ".webp", ".pdf"]
-        
-    def update_set_preview(self):
-        self.set_preview_list.clear()
-        sets = self.set_manager.get_all_sets()
-        for set_name in sorted(sets.keys()):
-            images = sets[set_name]
-            if set_name.startswith("set1"):
-                display_text = f"Set 1: {len(images)} files"
-                existing_items = self.set_preview_list.findItems("Set 1:", Qt.MatchFlag.MatchStartsWith)
-                if not existing_items: self.set_preview_list.addItem(display_text)
-                else: existing_items[0].setText(display_text)
+    def on_set_changed(self, change: SetChange):
+        """Updates only the preview row of the set that changed."""
+        if change.kind == "reset":
+            self.set_preview_list.clear()
+        elif change.kind == "removed":
+            self.set_preview_list.takeItem(change.position)
+        else:
+            label = "Set 1" if change.set_name == "set1" else change.set_name
+            text = f"{label}: {change.size} files"
+            if change.kind == "added":
+                self.set_preview_list.insertItem(change.position, text)
             else:
-                self.set_preview_list.addItem(f"{set_name}: {len(images)} files")
\ No newline at end of file
+                self.set_preview_list.item(change.position).setText(text)
@@ -0,0 +1,298 @@
+# AFWRename/ui/thumbnail_grid.py
+
+from bisect import bisect_left
+
+from PySide6.QtCore import QAbstractListModel, QItemSelection, QItemSelectionModel, QModelIndex, QSize, Qt, QTimer, Signal
+from PySide6.QtGui import QColor, QIcon, QPainter, QPixmap
+from PySide6.QtWidgets import QAbstractItemView, QListView
+
+from core import instrumentation
+from core.memory_cache import LRUCache
+from core.scanner import FileRecord
+
+# Number of screens of rows to request ahead of the scroll direction,
+# and behind it, on top of the rows currently visible.
+PREFETCH_AHEAD_PAGES = 2
+PREFETCH_BEHIND_PAGES = 0.5
+
+# Default memory budget for decoded thumbnails held by the grid, in bytes.
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+def pixmap_bytes(pixmap: QPixmap) -> int:
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+
+class ThumbnailModel(QAbstractListModel):
+    """
+    List model over the primary folder's files. Rows hold only paths; thumbnails
+    are attached later as they are loaded, and a placeholder is shown until then.
+    Labels and order come from each path's FileRecord in the primary folder
+    listing, so nothing is parsed while painting.
+
+    Rows stay sorted by each record's sort key, and by path where keys are
+    equal. A parallel list of keys lets a path's row be found by binary
+    search, so inserting or removing k paths costs O(k log n) lookups and no
+    reindexing. The record mapping may grow
+    while the model is in use, e.g. as a folder listing streams in.
+
+    Thumbnails live in an LRU cache bounded by `memory_budget` bytes. Evicted
+    paths are announced through `thumbnails_evicted` so the loader can fetch
+    them again the next time they are wanted. Files that have no thumbnail,
+    though they are kept, show a "No preview" placeholder with the reason as
+    a tooltip.
+    """
+
+    thumbnails_evicted = Signal(list)
+
+    def __init__(self, parent=None, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        super().__init__(parent)
+        self._paths: list[str] = []
+        self._keys: list = []
+        self._records: dict[str, FileRecord] = {}
+        self.thumbnails = LRUCache(memory_budget, pixmap_bytes, self.thumbnails_evicted.emit)
+        self._unavailable: dict[str, str] = {}
+        placeholder = QPixmap(128, 128)
+        placeholder.fill(QColor("#1E293B"))
+        self._placeholder = QIcon(placeholder)
+        painter = QPainter(placeholder)
+        painter.setPen(QColor("#64748B"))
+        painter.drawText(placeholder.rect(), Qt.AlignmentFlag.AlignCenter, "No preview")
+        painter.end()
+        self._unavailable_icon = QIcon(placeholder)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._paths)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        path_str = self._paths[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._records[path_str].name
+        if role == Qt.ItemDataRole.DecorationRole:
+            pixmap = self.thumbnails.get(path_str)
+            if pixmap is not None:
+                return QIcon(pixmap)
+            return self._unavailable_icon if path_str in self._unavailable else self._placeholder
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self._unavailable.get(path_str)
+        if role == Qt.ItemDataRole.UserRole:
+            return path_str
+        return None
+
+    def path_at(self, row: int) -> str:
+        return self._paths[row]
+
+    def paths(self) -> list[str]:
+        return list(self._paths)
+
+    def row_of(self, path_str: str) -> int | None:
+        record = self._records.get(path_str)
+        if record is None:
+            return None
+        row = self._position(path_str, record.sort_key)
+        if row < len(self._paths) and self._paths[row] == path_str:
+            return row
+        return None
+
+    def _position(self, path_str: str, key: str) -> int:
+        """The row a path has, or would have, in the sorted rows."""
+        row = bisect_left(self._keys, key)
+        # Names differing only in case or leading zeros share a key.
+        while row < len(self._keys) and self._keys[row] == key and self._paths[row] < path_str:
+            row += 1
+        return row
+
+    def set_paths(self, paths: list[str], records: dict[str, FileRecord]):
+        """
+        Replaces all rows. `records` maps every path that may ever be shown to
+        its scan record, which must carry a sort key.
+        """
+        self.beginResetModel()
+        self._records = records
+        self._paths = sorted(paths, key=lambda p: (records[p].sort_key, p))
+        self._keys = [records[p].sort_key for p in self._paths]
+        self.endResetModel()
+
+    def clear(self):
+        self.set_paths([], {})
+        self.thumbnails.clear()
+        self._unavailable.clear()
+
+    def insert_paths(self, paths):
+        """
+        Inserts paths at their sorted positions, skipping any already shown.
+        Paths that fall between the same two rows are inserted as one block.
+        """
+        with instrumentation.span("grid.insert"):
+            records = self._records
+
+            def order(path_str):
+                return (records[path_str].sort_key, path_str)
+
+            new = sorted(set(paths), key=order)
+            i = 0
+            while i < len(new):
+                row = self._position(new[i], records[new[i]].sort_key)
+                if row < len(self._paths) and self._paths[row] == new[i]:
+                    i += 1
+                    continue
+                j = i + 1
+                if row < len(self._keys):
+                    limit = (self._keys[row], self._paths[row])
+                    while j < len(new) and order(new[j]) < limit:
+                        j += 1
+                else:
+                    j = len(new)
+                block = new[i:j]
+                self.beginInsertRows(QModelIndex(), row, row + len(block) - 1)
+                self._paths[row:row] = block
+                self._keys[row:row] = [records[p].sort_key for p in block]
+                self.endInsertRows()
+                i = j
+
+    def remove_paths(self, paths):
+        """Removes the given paths, one contiguous block of rows at a time."""
+        with instrumentation.span("grid.remove"):
+            rows = sorted({row for row in map(self.row_of, paths) if row is not None}, reverse=True)
+            i = 0
+            while i < len(rows):
+                last = first = rows[i]
+                i += 1
+                while i < len(rows) and rows[i] == first - 1:
+                    first = rows[i]
+                    i += 1
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del self._paths[first:last + 1]
+                del self._keys[first:last + 1]
+                self.endRemoveRows()
+
+    def invalidate_thumbnails(self, paths):
+        """Drops thumbnails that are out of date; the placeholder shows until they are reloaded."""
+        for path_str in paths:
+            if self.thumbnails.pop(path_str) is None and self._unavailable.pop(path_str, None) is None:
+                continue
+            row = self.row_of(path_str)
+            if row is not None:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def mark_unavailable(self, path_str: str, reason: str):
+        """Shows the "No preview" placeholder for a file, explained by `reason`."""
+        self._unavailable[path_str] = reason
+        row = self.row_of(path_str)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole, Qt.ItemDataRole.ToolTipRole])
+
+    def set_thumbnails(self, items: list[tuple[str, QPixmap]]):
+        """Stores a batch of thumbnails and repaints the rows they cover with one update."""
+        with instrumentation.span("grid.set_thumbnails"):
+            first = last = None
+            for path_str, pixmap in items:
+                self.thumbnails.put(path_str, pixmap)
+                row = self.row_of(path_str)
+                if row is not None:
+                    first = row if first is None else min(first, row)
+                    last = row if last is None else max(last, row)
+            if first is not None:
+                self.dataChanged.emit(self.index(first), self.index(last), [Qt.ItemDataRole.DecorationRole])
+
+class ThumbnailGrid(QListView):
+    """
+    Icon-mode view that reports which paths it needs thumbnails for: the rows
+    in the viewport first, then rows ahead of the scroll direction, then a
+    smaller margin behind. Requests are debounced while scrolling.
+    """
+
+    thumbnails_wanted = Signal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setUniformItemSizes(True)
+        self.setMovement(QListView.Movement.Static)
+        self.setIconSize(QSize(128, 128))
+        self.setGridSize(QSize(150, 150))
+        self.setWordWrap(True)
+        self.setAcceptDrops(False)
+
+        self._last_scroll = 0
+        self._scroll_direction = 1
+        self._request_timer = QTimer(self)
+        self._request_timer.setSingleShot(True)
+        self._request_timer.setInterval(30)
+        self._request_timer.timeout.connect(self.request_visible)
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+
+    def setModel(self, model):
+        super().setModel(model)
+        model.modelReset.connect(self.schedule_request)
+        model.rowsInserted.connect(self.schedule_request)
+        model.rowsRemoved.connect(self.schedule_request)
+
+    def schedule_request(self, *args):
+        self._request_timer.start()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_request()
+
+    def _on_scrolled(self, value):
+        if value != self._last_scroll:
+            self._scroll_direction = 1 if value > self._last_scroll else -1
+            self._last_scroll = value
+        self.schedule_request()
+
+    def visible_range(self) -> tuple[int, int]:
+        """Returns the first and last row (inclusive) that can be on screen."""
+        model = self.model()
+        count = model.rowCount() if model else 0
+        if count == 0:
+            return 0, -1
+        grid = self.gridSize()
+        viewport = self.viewport().size()
+        columns = max(1, viewport.width() // grid.width())
+        top_line = self.verticalScrollBar().value() // grid.height()
+        lines = viewport.height() // grid.height() + 2
+        first = min(count - 1, top_line * columns)
+        last = min(count - 1, first + lines * columns - 1)
+        return first, last
+
+    def request_visible(self):
+        model = self.model()
+        first, last = self.visible_range()
+        if model is None or last < first:
+            self.thumbnails_wanted.emit([])
+            return
+        page = last - first + 1
+        ahead = int(page * PREFETCH_AHEAD_PAGES)
+        behind = int(page * PREFETCH_BEHIND_PAGES)
+        count = model.rowCount()
+        rows = list(range(first, last + 1))
+        if self._scroll_direction > 0:
+            rows += range(last + 1, min(count, last + 1 + ahead))
+            rows += range(first - 1, max(-1, first - 1 - behind), -1)
+        else:
+            rows += range(first - 1, max(-1, first - 1 - ahead), -1)
+            rows += range(last + 1, min(count, last + 1 + behind))
+        self.thumbnails_wanted.emit([model.path_at(row) for row in rows])
+
+    def selected_paths(self) -> list[str]:
+        rows = sorted(index.row() for index in self.selectionModel().selectedIndexes())
+        return [self.model().path_at(row) for row in rows]
+
+    def select_paths(self, paths):
+        """Replaces the selection with the given paths."""
+        model = self.model()
+        selection = QItemSelection()
+        for path_str in paths:
+            row = model.row_of(path_str)
+            if row is not None:
+                index = model.index(row)
+                selection.select(index, index)
+        self.selectionModel().select(selection, QItemSelectionModel.SelectionFlag.ClearAndSelect)